@@ -0,0 +1,84 @@
+"""Benchmark de CPU por minuto de áudio: caminho antigo (MP3 + FFmpegPCMAudio + encoder Opus)
+x caminho novo (OGG/Opus em memória repassado sem reencodar).
+
+Gera um áudio de teste com o ffmpeg e consome os frames tão rápido quanto possível,
+medindo o tempo de CPU do processo e dos filhos (o ffmpeg). Requer ffmpeg e libopus.
+
+Uso, a partir da raiz do projeto:
+    python benchmarks/bench_audio_cpu.py [segundos_de_audio]
+
+Medido (1 vCPU, Python 3.11, discord.py 2.7.1, ffmpeg 7.0.2 estático, libopus 1.5), em ms de CPU por minuto de áudio:
+    60 s de áudio:   antes 1335.9  |  depois 3.9
+    300 s de áudio:  antes 1485.9 e 1475.6  |  depois 3.9 e 2.2
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+from utils.voz import AudioOpusMemoria
+
+
+def tempo_cpu():
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + filhos.ru_utime + filhos.ru_stime
+
+
+def gerar_audios(pasta, segundos):
+    origem = ["-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=24000:duration={segundos}"]
+    mp3 = os.path.join(pasta, "audio.mp3")
+    ogg = os.path.join(pasta, "audio.ogg")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", *origem, "-b:a", "64k", mp3], check=True)
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", *origem, "-ar", "48000", "-c:a", "libopus", ogg], check=True)
+    return mp3, ogg
+
+
+def caminho_antigo(mp3):
+    """O que o discord faz com FFmpegPCMAudio: ffmpeg decodifica para PCM e o bot reencoda cada frame em Opus."""
+    encoder = discord.opus.Encoder()
+    fonte = discord.FFmpegPCMAudio(mp3)
+    frames = 0
+    while frame := fonte.read():
+        encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+        frames += 1
+    fonte.cleanup()
+    return frames
+
+
+def caminho_novo(dados):
+    fonte = AudioOpusMemoria(dados)
+    frames = 0
+    while fonte.read():
+        frames += 1
+    return frames
+
+
+def medir(funcao, *args):
+    inicio = tempo_cpu()
+    frames = funcao(*args)
+    return tempo_cpu() - inicio, frames
+
+
+def main():
+    segundos = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    with tempfile.TemporaryDirectory() as pasta:
+        mp3, ogg = gerar_audios(pasta, segundos)
+        with open(ogg, "rb") as arquivo:
+            dados = arquivo.read()
+        cpu_antigo, frames_antigo = medir(caminho_antigo, mp3)
+        cpu_novo, frames_novo = medir(caminho_novo, dados)
+
+    minutos = segundos / 60
+    print(f"Áudio de teste: {segundos}s")
+    print(f"Antes  (MP3 -> ffmpeg -> PCM -> Opus): {cpu_antigo / minutos * 1000:9.1f} ms de CPU por minuto ({frames_antigo} frames)")
+    print(f"Depois (OGG/Opus em memória, sem reencode): {cpu_novo / minutos * 1000:9.1f} ms de CPU por minuto ({frames_novo} frames)")
+
+
+if __name__ == "__main__":
+    main()
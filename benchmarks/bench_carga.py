@@ -0,0 +1,324 @@
+"""Teste de carga: centenas de usuários simultâneos usando os cogs de verdade, com Gemini, TTS e Discord falsos.
+
+Cada usuário escolhe um comando (/simulado, /flashcards, /explique ou /pomodoro) e o executa até o fim,
+clicando nos botões com um tempo de reflexão entre os cliques. No final mostra p50/p95/p99 de latência
+por comando e por clique, o atraso do event loop, o crescimento de memória e as chamadas externas
+(Gemini, TTS, REST do Discord) por comando.
+
+Todos os bancos e caches vão para uma pasta temporária. Uso, a partir da raiz do projeto:
+    python benchmarks/bench_carga.py --usuarios 500
+    python benchmarks/bench_carga.py --usuarios 500 --gemini-mediana 4 --gemini-p95 15 --gemini-erro 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Os módulos em utils leem os caminhos ao serem importados: tudo vai para uma pasta descartável.
+PASTA = tempfile.mkdtemp(prefix="carga-")
+os.environ.update({
+    "BANCO_QUESTOES_PATH": os.path.join(PASTA, "banco_questoes.db"),
+    "CACHE_PATH": os.path.join(PASTA, "cache.db"),
+    "REVISAO_PATH": os.path.join(PASTA, "revisao.db"),
+    "SESSOES_PATH": os.path.join(PASTA, "sessoes.db"),
+    "TTS_CACHE_DIR": os.path.join(PASTA, "tts_cache"),
+})
+
+import falsos
+from falsos import (
+    BotFalso, CanalFalso, CanalVozFalso, ClienteTTSFalso, ExecutorComContexto, InteracaoFalsa, Latencia,
+    ModeloGeminiFalso, RestFalso, UsuarioFalso,
+)
+
+from utils.coalescencia import CoalescedorRequisicoes
+from utils.executores import PoolLimitado, encerrar_pools
+from utils.fila_envio import FilaEnvio
+from utils.gemini_gateway import GatewayGemini
+
+TEMAS = [
+    "Princípios da Administração Pública", "Licitações e contratos", "Lei de Acesso à Informação",
+    "Controle da Administração", "Políticas públicas", "Orçamento público", "Ética no serviço público",
+    "Direitos fundamentais", "Organização do Estado", "Gestão de pessoas no setor público",
+]
+COMANDOS = ("simulado", "flashcards", "explique", "pomodoro")
+
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class _Descartar:
+    """Os cogs imprimem bastante; durante a carga isso só atrapalharia a leitura do relatório."""
+
+    def write(self, texto):
+        return len(texto)
+
+    def flush(self):
+        pass
+
+
+class Carga:
+    def __init__(self, args):
+        self.args = args
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.execucoes = defaultdict(int)
+        self.atrasos_loop = []
+
+    async def medir(self, nome, corrotina):
+        inicio = time.perf_counter()
+        try:
+            await corrotina
+        except Exception as e:
+            self.erros[nome] += 1
+            self.erros[f"{nome}: {type(e).__name__}"] += 1
+            return False
+        finally:
+            self.latencias[nome].append(time.perf_counter() - inicio)
+        return True
+
+    async def pensar(self):
+        await asyncio.sleep(random.uniform(0, self.args.reflexao * 2))
+
+    async def monitorar_loop(self, intervalo=0.01):
+        while True:
+            inicio = time.perf_counter()
+            await asyncio.sleep(intervalo)
+            self.atrasos_loop.append(time.perf_counter() - inicio - intervalo)
+
+    async def montar(self):
+        args = self.args
+        self.rest = RestFalso(Latencia(args.discord_mediana, args.discord_p95))
+        gemini = GatewayGemini(
+            "chave-falsa", requisicoes_por_minuto=args.gemini_rpm,
+            fabrica_modelo=ModeloGeminiFalso.fabrica(
+                latencia=Latencia(args.gemini_mediana, args.gemini_p95), taxa_erro=args.gemini_erro, taxa_cota=args.gemini_cota,
+            ),
+        )
+        self.bot = BotFalso(self.rest, gemini, CoalescedorRequisicoes(), FilaEnvio())
+
+        from cogs.explicacao_cog import TTS_MAX_FILA, TTS_MAX_PARALELO, ExplicacaoCog
+        from cogs.flashcards_cog import FlashcardsCog
+        from cogs.pomodoro_cog import PomodoroCog
+        from cogs.simulado_cog import SimuladoAICog
+
+        self.simulado = SimuladoAICog(self.bot)
+        self.flashcards = FlashcardsCog(self.bot)
+        self.explicacao = ExplicacaoCog(self.bot)
+        self.pomodoro = PomodoroCog(self.bot)
+        self.explicacao.tts_client = ClienteTTSFalso(Latencia(args.tts_mediana, args.tts_p95), taxa_erro=args.tts_erro)
+        self.explicacao.pool_tts.encerrar()
+        self.explicacao.pool_tts = PoolLimitado(
+            "tts", lambda: ExecutorComContexto(max_workers=TTS_MAX_PARALELO, thread_name_prefix="tts"), TTS_MAX_PARALELO, TTS_MAX_FILA,
+        )
+        for cog in (self.simulado, self.flashcards, self.explicacao, self.pomodoro):
+            self.bot.cogs[type(cog).__name__] = cog
+            if hasattr(cog, "cog_load"):
+                # As tasks criadas no cog_load (como a do agendador de timers do Pomodoro) herdam o contexto
+                # daqui, então as chamadas que elas fizerem entram na conta do comando dono do cog.
+                token = falsos.comando_atual.set("pomodoro" if cog is self.pomodoro else "segundo plano")
+                try:
+                    await cog.cog_load()
+                finally:
+                    falsos.comando_atual.reset(token)
+
+        self.canais = [CanalFalso(self.rest) for _ in range(max(1, args.usuarios // 25))]
+        for canal in self.canais:
+            self.bot.canais[canal.id] = canal
+        self.canal_voz = CanalVozFalso(self.rest, args.velocidade_audio)
+
+    def interacao(self, usuario, canal, **kwargs):
+        return InteracaoFalsa(self.rest, usuario, canal, **kwargs)
+
+    async def usar_simulado(self, usuario, canal):
+        from cogs.simulado_cog import SimuladoView, active_simulados
+
+        cog = self.simulado
+        inicial = self.interacao(usuario, canal)
+        await self.medir("/simulado", cog.simulado.callback(cog, inicial, tema=random.choice(TEMAS), quantidade=self.args.questoes))
+        mensagens = [m for m in inicial.followup.mensagens if m.conteudo.get("view") is not None]
+        if not mensagens:
+            return
+        view = SimuladoView(cog)
+        while usuario.id in active_simulados:
+            await self.pensar()
+            clique = self.interacao(usuario, canal, message=mensagens[0], custom_id="simulado:A")
+            if not await view.interaction_check(clique):
+                break
+            await self.medir("simulado: resposta", view.process_answer(clique, random.choice("ABCD")))
+            if clique.followup.mensagens and clique.response.view is not None and hasattr(clique.response.view, "paginas"):
+                await self.navegar_gabarito(usuario, canal, clique.response.view, clique.followup.mensagens[-1])
+
+    async def navegar_gabarito(self, usuario, canal, view, mensagem):
+        view.update_buttons()
+        for _ in range(view.total_pages - 1):
+            await self.pensar()
+            clique = self.interacao(usuario, canal, message=mensagem)
+            await self.medir("simulado: página do gabarito", view.next_button.callback(clique))
+
+    async def usar_flashcards(self, usuario, canal):
+        from cogs.flashcards_cog import FlashcardView, active_flashcards
+
+        cog = self.flashcards
+        inicial = self.interacao(usuario, canal)
+        await self.medir("/flashcards", cog.flashcards.callback(cog, inicial, tema=random.choice(TEMAS), quantidade=self.args.cards))
+        if not inicial.followup.mensagens or usuario.id not in active_flashcards:
+            return
+        mensagem = inicial.followup.mensagens[-1]
+        view = FlashcardView(cog)
+        while usuario.id in active_flashcards:
+            await self.pensar()
+            virar = self.interacao(usuario, canal, message=mensagem, custom_id="flashcards:virar")
+            if not await view.interaction_check(virar):
+                break
+            await self.medir("flashcards: virar", view.flip_card_callback(virar))
+            await self.pensar()
+            nota = random.choice(("flashcards:acertei", "flashcards:errei", "flashcards:nao_sei"))
+            avaliar = self.interacao(usuario, canal, message=mensagem, custom_id=nota)
+            if not await view.interaction_check(avaliar):
+                break
+            await self.medir("flashcards: avaliar", view.assess_callback(avaliar))
+
+    async def usar_explique(self, usuario, canal):
+        cog = self.explicacao
+        inicial = self.interacao(usuario, canal)
+        if not await self.medir("/explique", cog.explique.callback(cog, inicial, topico=random.choice(TEMAS))):
+            return
+        view = inicial.response.view
+        await self.pensar()
+        audio = random.random() < self.args.fracao_audio
+        if audio:
+            usuario = UsuarioFalso(usuario.id, canal_voz=self.canal_voz)
+        clique = self.interacao(usuario, canal, message=inicial.mensagem_original)
+        if not await view.interaction_check(clique):
+            return
+        botao = view.audio_button if audio else view.texto_button
+        await self.medir("explique: áudio" if audio else "explique: texto", botao.callback(clique))
+
+    async def usar_pomodoro(self, usuario, canal):
+        from cogs.pomodoro_cog import active_pomodoros
+
+        cog = self.pomodoro
+        inicial = self.interacao(usuario, canal)
+        # Durações em minutos: frações pequenas para o ciclo inteiro caber no teste.
+        await self.medir("/pomodoro", cog.pomodoro.callback(
+            cog, inicial, foco=self.args.pomodoro_minutos, pausa_curta=self.args.pomodoro_minutos / 2,
+            pausa_longa=self.args.pomodoro_minutos, ciclos=2,
+        ))
+        prazo = time.monotonic() + self.args.pomodoro_minutos * 60 * 6 + 30
+        while usuario.id in active_pomodoros and time.monotonic() < prazo:
+            await asyncio.sleep(0.25)
+
+    async def usuario(self, indice):
+        await asyncio.sleep(random.uniform(0, self.args.rampa))
+        comando = random.choices(COMANDOS, weights=self.args.pesos)[0]
+        falsos.comando_atual.set(comando)
+        self.execucoes[comando] += 1
+        usuario = UsuarioFalso(1000 + indice)
+        canal = random.choice(self.canais)
+        await getattr(self, f"usar_{comando}")(usuario, canal)
+
+    async def executar(self):
+        await self.montar()
+        monitor = asyncio.create_task(self.monitorar_loop())
+        tracemalloc.start()
+        memoria_inicial, _ = tracemalloc.get_traced_memory()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(_Descartar()):
+            await asyncio.gather(*(self.usuario(i) for i in range(self.args.usuarios)))
+        duracao = time.perf_counter() - inicio
+        voz = self.explicacao.voz.estatisticas()
+        await self.explicacao.voz.encerrar()
+        encerrar_pools()
+        memoria_final, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        monitor.cancel()
+        self.relatorio(duracao, memoria_inicial, memoria_final, pico, voz)
+
+    def relatorio(self, duracao, memoria_inicial, memoria_final, pico, voz):
+        print(f"\n{self.args.usuarios} usuários em {duracao:.1f}s  |  dados em {PASTA}\n")
+        print(f"{'operação':<30}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}")
+        for nome in sorted(self.latencias):
+            valores = self.latencias[nome]
+            print(
+                f"{nome:<30}{len(valores):>7}{percentil(valores, 50) * 1000:>10.1f}"
+                f"{percentil(valores, 95) * 1000:>10.1f}{percentil(valores, 99) * 1000:>10.1f}{self.erros[nome]:>8}"
+            )
+        detalhes = {nome: n for nome, n in self.erros.items() if ":" in nome and n}
+        if detalhes:
+            print("\nerros por tipo: " + ", ".join(f"{nome} = {n}" for nome, n in sorted(detalhes.items())))
+
+        print(
+            f"\natraso do event loop: p50 {percentil(self.atrasos_loop, 50) * 1000:.1f} ms, "
+            f"p99 {percentil(self.atrasos_loop, 99) * 1000:.1f} ms, máx {max(self.atrasos_loop, default=0) * 1000:.1f} ms"
+        )
+        print(
+            f"memória Python: {memoria_inicial / 2**20:.1f} -> {memoria_final / 2**20:.1f} MiB "
+            f"(+{(memoria_final - memoria_inicial) / 2**20:.1f}, pico {pico / 2**20:.1f})  |  "
+            f"RSS máximo {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB"
+        )
+        for cog in (self.simulado, self.flashcards):
+            medida = cog.expiracao.medir()
+            print(f"sessões vivas de {cog.expiracao.nome}: {medida['sessoes']} ({medida['bytes'] / 1024:.1f} KiB)")
+
+        print("\nchamadas externas por execução do comando:")
+        servicos = sorted({servico for _, servico in falsos.chamadas})
+        largura = max([10, *(len(s) for s in servicos)]) + 2
+        print(f"{'comando':<16}{'execuções':>10}" + "".join(f"{s:>{largura}}" for s in servicos))
+        for comando in (*COMANDOS, "segundo plano"):
+            execucoes = self.execucoes.get(comando, 0)
+            if not execucoes and not any(c == comando for c, _ in falsos.chamadas):
+                continue
+            linha = f"{comando:<16}{execucoes:>10}"
+            for servico in servicos:
+                total = falsos.chamadas[(comando, servico)]
+                linha += f"{(total / execucoes if execucoes else total):>{largura}.2f}"
+            print(linha)
+        print(f"\ncoalescedor: {self.bot.coalescedor.estatisticas()}  |  fila de envio: {self.bot.fila_envio.estatisticas()}")
+        print(f"voz: {voz}  |  roteador: {self.bot.roteador.estatisticas()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--rampa", type=float, default=10.0, help="segundos para todos os usuários começarem")
+    parser.add_argument("--reflexao", type=float, default=1.0, help="tempo médio entre cliques, em segundos")
+    parser.add_argument("--pesos", type=float, nargs=4, default=(3, 3, 2, 2), metavar=("SIM", "FLASH", "EXPL", "POMO"))
+    parser.add_argument("--questoes", type=int, default=5)
+    parser.add_argument("--cards", type=int, default=5)
+    parser.add_argument("--fracao-audio", type=float, default=0.3, help="fração dos /explique pedidos em áudio")
+    parser.add_argument("--velocidade-audio", type=float, default=20.0, help="quantas vezes mais rápido o áudio é 'tocado'")
+    parser.add_argument("--pomodoro-minutos", type=float, default=0.05)
+    parser.add_argument("--gemini-mediana", type=float, default=3.0)
+    parser.add_argument("--gemini-p95", type=float, default=8.0)
+    parser.add_argument("--gemini-erro", type=float, default=0.02, help="probabilidade de 503 por chamada")
+    parser.add_argument("--gemini-cota", type=float, default=0.01, help="probabilidade de 429 por chamada")
+    parser.add_argument("--gemini-rpm", type=float, default=float(os.getenv("GEMINI_RPM", "60")))
+    parser.add_argument("--tts-mediana", type=float, default=0.8)
+    parser.add_argument("--tts-p95", type=float, default=2.0)
+    parser.add_argument("--tts-erro", type=float, default=0.01)
+    parser.add_argument("--discord-mediana", type=float, default=0.08)
+    parser.add_argument("--discord-p95", type=float, default=0.3)
+    parser.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args()
+    if args.semente is not None:
+        random.seed(args.semente)
+    asyncio.run(Carga(args).executar())
+
+
+if __name__ == "__main__":
+    main()
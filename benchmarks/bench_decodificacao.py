@@ -0,0 +1,45 @@
+"""Micro-benchmark: caminho antigo (regex + demjson) x saída estruturada (orjson).
+
+Uso, a partir da raiz do projeto:
+    python benchmarks/bench_decodificacao.py [repeticoes]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import demjson3 as demjson
+
+from utils.decodificacao import extrair_lista_json, orjson
+
+DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+
+
+def caminho_antigo(raw_text):
+    json_match = re.search(r'```json\s*([\s\S]*?)\s*```|(\[[\s\S]*\])', raw_text)
+    cleaned_response = next((group for group in json_match.groups() if group is not None), None)
+    return demjson.decode(cleaned_response)
+
+
+def ler(nome):
+    with open(os.path.join(DADOS, nome), encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"Decoder rápido: {'orjson' if orjson else 'json (orjson não instalado)'} | repetições: {repeticoes}")
+    for n in (10, 20):
+        markdown = ler(f"questoes_{n}_markdown.txt")
+        estruturado = ler(f"questoes_{n}.json")
+        assert caminho_antigo(markdown) == extrair_lista_json(estruturado)
+
+        antigo = min(timeit.repeat(lambda: caminho_antigo(markdown), number=repeticoes, repeat=3)) / repeticoes
+        novo = min(timeit.repeat(lambda: extrair_lista_json(estruturado), number=repeticoes, repeat=3)) / repeticoes
+        print(f"{n:>2} itens | regex + demjson: {antigo * 1000:8.3f} ms | estruturado: {novo * 1000:8.3f} ms | {antigo / novo:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Dublês locais para o teste de carga: Gemini, Cloud TTS e a parte do Discord (REST e gateway) que os cogs usam.
+
+Nada aqui abre conexão de rede. Cada chamada é contada por comando (via contextvar), para o relatório
+de chamadas por comando do bench_carga.py.
+"""
+import asyncio
+import contextvars
+import itertools
+import json
+import math
+import os
+import random
+import struct
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+
+DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+
+comando_atual = contextvars.ContextVar("comando_atual", default="segundo plano")
+chamadas = Counter()
+_ids = itertools.count(10 ** 17)
+
+
+def registrar_chamada(servico: str):
+    chamadas[(comando_atual.get(), servico)] += 1
+
+
+def novo_id() -> int:
+    return next(_ids)
+
+
+class Latencia:
+    """Distribuição log-normal definida pela mediana e pelo p95, em segundos."""
+
+    def __init__(self, mediana: float, p95: float):
+        self.mu = math.log(max(mediana, 1e-6))
+        self.sigma = math.log(max(p95, mediana) / max(mediana, 1e-6)) / 1.645
+
+    def amostrar(self) -> float:
+        return random.lognormvariate(self.mu, self.sigma)
+
+
+# --- Gemini ---------------------------------------------------------------------------------------
+
+def _ler(nome):
+    with open(os.path.join(DADOS, nome), encoding="utf-8") as f:
+        return f.read()
+
+
+class RespostasGravadas:
+    """Respostas reais gravadas em benchmarks/dados, escolhidas pelo tipo de prompt."""
+
+    def __init__(self):
+        self.questoes = json.loads(_ler("questoes_20.json"))
+        self.flashcards = json.loads(_ler("flashcards_20.json"))
+        self.explicacao = _ler("explicacao.ssml")
+
+    def _lista(self, itens, prompt):
+        encontrado = next((int(p) for p in prompt.split() if p.isdigit()), len(itens))
+        repetidos = (itens * (encontrado // len(itens) + 1))[:encontrado]
+        return json.dumps(repetidos, ensure_ascii=False)
+
+    def para(self, prompt: str) -> str:
+        if "flashcards" in prompt:
+            return self._lista(self.flashcards, prompt)
+        if "múltipla escolha" in prompt:
+            return self._lista(self.questoes, prompt)
+        return self.explicacao
+
+
+class _Resposta:
+    def __init__(self, text):
+        self.text = text
+
+
+class _RespostaStream:
+    def __init__(self, texto, atraso_por_pedaco, tamanho_pedaco=400):
+        self.pedacos = [texto[i:i + tamanho_pedaco] for i in range(0, len(texto), tamanho_pedaco)]
+        self.atraso = atraso_por_pedaco
+
+    async def __aiter__(self):
+        for pedaco in self.pedacos:
+            await asyncio.sleep(self.atraso)
+            yield _Resposta(pedaco)
+
+
+class ModeloGeminiFalso:
+    """Implementa o `generate_content_async` que o GatewayGemini usa. Passe a fábrica como `fabrica_modelo`."""
+
+    def __init__(self, nome, latencia: Latencia, taxa_erro: float = 0.0, taxa_cota: float = 0.0, respostas=None):
+        self.nome = nome
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.taxa_cota = taxa_cota
+        self.respostas = respostas or RespostasGravadas()
+
+    @classmethod
+    def fabrica(cls, **kwargs):
+        respostas = RespostasGravadas()
+        return lambda nome: cls(nome, respostas=respostas, **kwargs)
+
+    def _falha(self):
+        sorteio = random.random()
+        if sorteio < self.taxa_cota:
+            return google_exceptions.ResourceExhausted("cota simulada")
+        if sorteio < self.taxa_cota + self.taxa_erro:
+            return google_exceptions.ServiceUnavailable("indisponibilidade simulada")
+        return None
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        registrar_chamada("gemini")
+        duracao = self.latencia.amostrar()
+        texto = self.respostas.para(prompt)
+        erro = self._falha()
+        if stream:
+            # O primeiro pedaço chega em ~30% do tempo total; o resto é distribuído entre os demais.
+            await asyncio.sleep(duracao * 0.3)
+            if erro:
+                raise erro
+            resposta = _RespostaStream(texto, 0)
+            resposta.atraso = duracao * 0.7 / max(1, len(resposta.pedacos))
+            return resposta
+        await asyncio.sleep(duracao)
+        if erro:
+            raise erro
+        return _Resposta(texto)
+
+
+# --- Cloud TTS ------------------------------------------------------------------------------------
+
+def _tabela_crc_ogg():
+    tabela = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) if r & 0x80000000 else (r << 1)
+        tabela.append(r & 0xFFFFFFFF)
+    return tabela
+
+
+_CRC_OGG = _tabela_crc_ogg()
+_SILENCIO_OPUS = b"\xf8\xff\xfe"
+
+
+def _crc_ogg(dados: bytes) -> int:
+    crc = 0
+    for byte in dados:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_OGG[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+def _pagina_ogg(serial, sequencia, granulo, pacotes, flags=0) -> bytes:
+    segmentos = []
+    for pacote in pacotes:
+        segmentos += [255] * (len(pacote) // 255) + [len(pacote) % 255]
+    cabecalho = b"OggS" + bytes([0, flags]) + struct.pack("<qIII", granulo, serial, sequencia, 0)
+    pagina = cabecalho + bytes([len(segmentos)]) + bytes(segmentos) + b"".join(pacotes)
+    return pagina[:22] + struct.pack("<I", _crc_ogg(pagina)) + pagina[26:]
+
+
+def ogg_opus_silencio(segundos: float) -> bytes:
+    """Arquivo OGG/Opus válido com `segundos` de silêncio (frames de 20 ms), no formato que o TTS devolve."""
+    serial = random.getrandbits(32)
+    cabecalho = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 5) + b"falso" + struct.pack("<I", 0)
+    paginas = [_pagina_ogg(serial, 0, 0, [cabecalho], flags=2), _pagina_ogg(serial, 1, 0, [tags])]
+    frames = max(1, int(segundos / 0.02))
+    for i, inicio in enumerate(range(0, frames, 50)):
+        quantidade = min(50, frames - inicio)
+        final = 4 if inicio + quantidade >= frames else 0
+        paginas.append(_pagina_ogg(serial, i + 2, (inicio + quantidade) * 960, [_SILENCIO_OPUS] * quantidade, flags=final))
+    return b"".join(paginas)
+
+
+class ClienteTTSFalso:
+    """Substitui o TextToSpeechClient: mesmo `synthesize_speech` síncrono (roda no pool_tts do cog)."""
+
+    CARACTERES_POR_SEGUNDO = 15
+
+    def __init__(self, latencia: Latencia, taxa_erro: float = 0.0):
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+
+    def synthesize_speech(self, input, voice, audio_config):
+        registrar_chamada("tts")
+        time.sleep(self.latencia.amostrar())
+        if random.random() < self.taxa_erro:
+            raise google_exceptions.ServiceUnavailable("TTS indisponível (simulado)")
+        texto = input.ssml or input.text
+        return _RespostaTTS(ogg_opus_silencio(len(texto) / self.CARACTERES_POR_SEGUNDO))
+
+
+class _RespostaTTS:
+    def __init__(self, audio_content: bytes):
+        self.audio_content = audio_content
+
+
+class ExecutorComContexto(ThreadPoolExecutor):
+    """run_in_executor não leva os contextvars para a thread; este executor leva, para a contagem por comando."""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# --- Discord --------------------------------------------------------------------------------------
+
+class RestFalso:
+    """Toda chamada REST do Discord passa por aqui: aplica a latência e conta a chamada."""
+
+    def __init__(self, latencia: Latencia):
+        self.latencia = latencia
+
+    async def chamar(self, rota: str):
+        registrar_chamada(f"discord:{rota}")
+        await asyncio.sleep(self.latencia.amostrar())
+
+
+class MensagemFalsa:
+    def __init__(self, rest: RestFalso, canal_id: int, **conteudo):
+        self.rest = rest
+        self.id = novo_id()
+        self.channel_id = canal_id
+        self.conteudo = conteudo
+
+    async def edit(self, **conteudo):
+        await self.rest.chamar("editar_mensagem")
+        self.conteudo.update(conteudo)
+        return self
+
+
+class CanalFalso:
+    def __init__(self, rest: RestFalso, canal_id: int = None):
+        self.rest = rest
+        self.id = canal_id or novo_id()
+        self.name = f"canal-{self.id}"
+
+    async def send(self, content=None, **conteudo):
+        await self.rest.chamar("enviar_mensagem")
+        return MensagemFalsa(self.rest, self.id, content=content, **conteudo)
+
+    def get_partial_message(self, mensagem_id):
+        mensagem = MensagemFalsa(self.rest, self.id)
+        mensagem.id = mensagem_id
+        return mensagem
+
+
+class VoiceClientFalso:
+    """Consome os pacotes Opus da fonte como o player do discord faria, mas `velocidade` vezes mais rápido."""
+
+    def __init__(self, canal, velocidade: float):
+        self.channel = canal
+        self.velocidade = velocidade
+        self.conectado = True
+
+    def is_connected(self) -> bool:
+        return self.conectado
+
+    def play(self, fonte, after=None):
+        async def tocar():
+            pacotes = 0
+            while fonte.read():
+                pacotes += 1
+            await asyncio.sleep(pacotes * 0.02 / self.velocidade)
+            if after:
+                after(None)
+        asyncio.get_running_loop().create_task(tocar())
+
+    async def move_to(self, canal):
+        self.channel = canal
+
+    async def disconnect(self):
+        self.conectado = False
+        registrar_chamada("discord:voz")
+
+
+class CanalVozFalso(CanalFalso):
+    def __init__(self, rest, velocidade_audio: float):
+        super().__init__(rest)
+        self.velocidade_audio = velocidade_audio
+
+    async def connect(self):
+        await self.rest.chamar("voz")
+        return VoiceClientFalso(self, self.velocidade_audio)
+
+
+class UsuarioFalso:
+    def __init__(self, user_id: int, canal_voz=None):
+        self.id = user_id
+        self.name = f"usuario{user_id}"
+        self.voice = type("EstadoVoz", (), {"channel": canal_voz})() if canal_voz else None
+
+
+class RespostaFalsa:
+    """interaction.response: a primeira resposta tem que sair em até 3 s no Discord; aqui é só contada."""
+
+    def __init__(self, interacao):
+        self.interacao = interacao
+        self.feita = False
+        self.view = None
+
+    def is_done(self):
+        return self.feita
+
+    async def _responder(self, rota, conteudo):
+        if self.feita:
+            raise RuntimeError("Interação respondida duas vezes.")
+        self.feita = True
+        self.interacao.respondida_em = time.perf_counter()
+        await self.interacao.rest.chamar(rota)
+        if conteudo.get("view") is not None:
+            self.view = conteudo["view"]
+
+    async def send_message(self, content=None, **conteudo):
+        await self._responder("responder", conteudo)
+        self.interacao.mensagem_original = MensagemFalsa(self.interacao.rest, self.interacao.channel_id, content=content, **conteudo)
+
+    async def defer(self, **_):
+        await self._responder("adiar", {})
+
+    async def edit_message(self, **conteudo):
+        await self._responder("responder_editando", conteudo)
+
+
+class WebhookFalso:
+    """interaction.followup."""
+
+    def __init__(self, interacao):
+        self.interacao = interacao
+        self.mensagens = []
+
+    async def send(self, content=None, wait=False, **conteudo):
+        await self.interacao.rest.chamar("webhook")
+        mensagem = MensagemFalsa(self.interacao.rest, self.interacao.channel_id, content=content, **conteudo)
+        self.mensagens.append(mensagem)
+        if conteudo.get("view") is not None:
+            self.interacao.response.view = conteudo["view"]
+        return mensagem if wait else None
+
+
+class InteracaoFalsa:
+    def __init__(self, rest: RestFalso, usuario: UsuarioFalso, canal: CanalFalso, message=None, custom_id=None):
+        self.rest = rest
+        self.id = novo_id()
+        self.user = usuario
+        self.channel_id = canal.id
+        self.channel = canal
+        self.guild = type("Guild", (), {"voice_client": None})()
+        # Um servidor por usuário simulado: cada um tem a sua fila de reprodução, como em servidores distintos.
+        self.guild_id = usuario.id
+        self.message = message
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.response = RespostaFalsa(self)
+        self.followup = WebhookFalso(self)
+        self.mensagem_original = message
+        self.criada_em = time.perf_counter()
+        self.respondida_em = None
+
+    async def edit_original_response(self, **conteudo):
+        await self.rest.chamar("webhook")
+        return self.mensagem_original
+
+    async def original_response(self):
+        await self.rest.chamar("webhook")
+        if self.mensagem_original is None and self.followup.mensagens:
+            return self.followup.mensagens[0]
+        return self.mensagem_original
+
+
+class BotFalso:
+    """O mínimo de commands.Bot que os cogs usam, sem login nem gateway."""
+
+    def __init__(self, rest: RestFalso, gemini, coalescedor, fila_envio):
+        from utils.pre_geracao import AgendadorPreGeracao
+        from utils.roteamento import RoteadorModelos
+
+        self.rest = rest
+        self.gemini = gemini
+        self.roteador = RoteadorModelos(gemini)
+        self.coalescedor = coalescedor
+        self.fila_envio = fila_envio
+        self.pre_geracao = AgendadorPreGeracao(self)
+        self.loop = asyncio.get_running_loop()
+        self.cogs = {}
+        self.canais = {}
+        self.views = []
+
+    def add_view(self, view):
+        self.views.append(view)
+
+    def atende_servidor(self, guild_id):
+        return True
+
+    async def wait_until_ready(self):
+        return None
+
+    def get_cog(self, nome):
+        return self.cogs.get(nome)
+
+    def get_channel(self, canal_id):
+        return self.canais.get(canal_id)
+
+    async def fetch_channel(self, canal_id):
+        await self.rest.chamar("buscar_canal")
+        return self.canais.setdefault(canal_id, CanalFalso(self.rest, canal_id))
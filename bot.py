@@ -1,18 +1,55 @@
+import time
+
+# Marcado antes de qualquer import pesado: a etapa "imports" da inicialização começa aqui.
+INICIO_PROCESSO = time.perf_counter()
+
 import discord
 from discord.ext import commands
+from discord import app_commands
+import asyncio
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
 
+# Carrega o .env antes dos módulos em utils, que leem suas configurações ao serem importados.
 load_dotenv()
 
+from utils.coalescencia import CoalescedorRequisicoes
+from utils.executores import encerrar_pools
+from utils.fila_envio import FilaEnvio
+from utils.gemini_gateway import GatewayGemini
+from utils.metricas import (
+    COMANDOS, ESTATISTICAS, INICIALIZACAO, METRICAS_PORTA, ServidorMetricas, acompanhar_estatisticas, configurar_logs,
+    monitorar_loop, registrar_evento,
+)
+from utils.pre_geracao import AgendadorPreGeracao
+from utils.roteamento import RoteadorModelos
+
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GUILD_ID_STR = os.getenv("GUILD_ID")
+# Total de shards. Vazio: o Discord recomenda quantos usar. Para dividir os shards em processos, use cluster.py.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0") or 0) or None
+# Assinatura da última árvore de comandos sincronizada: se não mudou, o boot não chama tree.sync.
+CAMINHO_SYNC = os.getenv("COMANDOS_SYNC_PATH", "data/comandos_sincronizados.json")
+SINCRONIZAR_SEMPRE = os.getenv("SINCRONIZAR_SEMPRE", "0") == "1"
+
+COGS = [
+    "cogs.simulado_cog",
+    "cogs.explicacao_cog",
+    "cogs.pomodoro_cog",
+    "cogs.flashcards_cog",
+]
 
 if not DISCORD_TOKEN:
     print("ERRO CRÍTICO: A variável de ambiente 'DISCORD_TOKEN' não foi encontrada.")
     print("Verifique se você criou o arquivo .env e o preencheu corretamente.")
     exit()
 
+if not GEMINI_API_KEY:
+    print("AVISO: A variável de ambiente 'GEMINI_API_KEY' não foi encontrada. Os comandos com IA não funcionarão.")
+
 GUILD_ID = None
 if GUILD_ID_STR:
     try:
@@ -22,36 +59,102 @@ if GUILD_ID_STR:
 else:
     print("AVISO: A variável de ambiente 'GUILD_ID' não foi definida no arquivo .env. A sincronização de comandos será global.")
 
-class CNUGeminiBot(commands.Bot):
-    def __init__(self):
+class CNUGeminiBot(commands.AutoShardedBot):
+    """Bot com todos os shards num processo só ou, com `shard_ids`, um dos processos do cluster (ver cluster.py).
+
+    Cada servidor é atendido sempre pelo mesmo shard, então as sessões em memória de um usuário ficam no
+    processo certo. O que precisa valer para o cluster inteiro (cota da Gemini, sessões salvas, caches em
+    disco) fica nos backends compartilhados configurados no .env.
+    """
+
+    def __init__(self, shard_ids=None, shard_count=SHARD_COUNT, cluster: int = None):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.guilds = True
         intents.voice_states = True
 
-        super().__init__(command_prefix='!', intents=intents)
+        super().__init__(command_prefix='!', intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+        self.criado_em = time.perf_counter()
+        self.cluster = cluster
+        self.pre_geracao = AgendadorPreGeracao(self)
+        self.coalescedor = CoalescedorRequisicoes()
+        self.gemini = GatewayGemini(GEMINI_API_KEY)
+        self.roteador = RoteadorModelos(self.gemini)
+        self.fila_envio = FilaEnvio()
+        # Um endpoint por processo: o processo N do cluster usa a porta METRICAS_PORTA + N.
+        self.servidor_metricas = ServidorMetricas(porta=METRICAS_PORTA + (cluster or 0)) if METRICAS_PORTA else None
+        self.monitor_loop = None
+        self.aquecimento = None
+        self.tempos_inicializacao = {}
+        acompanhar_estatisticas("fila_envio", self.fila_envio)
+        acompanhar_estatisticas("coalescedor", self.coalescedor)
+        acompanhar_estatisticas("roteador", self.roteador)
+        ESTATISTICAS.acompanhar(lambda: self.gemini.disjuntor.falhas_seguidas, componente="gemini", campo="falhas_seguidas")
 
     async def setup_hook(self):
+        self.marcar_etapa("imports", INICIO_PROCESSO, self.criado_em)
+        self.marcar_etapa("login", self.criado_em)
+        # Os SDKs pesados ficam fora do caminho crítico: carregam numa thread enquanto os cogs e o sync andam.
+        self.aquecimento = asyncio.create_task(self.gemini.aquecer())
+        self.tree.on_error = self.on_app_command_error
+        self.monitor_loop = asyncio.create_task(monitorar_loop())
+        if self.servidor_metricas:
+            try:
+                await self.servidor_metricas.iniciar()
+            except OSError as e:
+                print(f"AVISO: Não foi possível abrir o endpoint de métricas na porta {self.servidor_metricas.porta}: {e}")
+                self.servidor_metricas = None
+
         print("Carregando cogs...")
+        inicio = time.perf_counter()
+        await asyncio.gather(*(self.carregar_cog(cog) for cog in COGS))
+        self.marcar_etapa("cogs", inicio)
 
-        cogs_a_carregar = [
-            "cogs.simulado_cog",
-            "cogs.explicacao_cog",
-            "cogs.pomodoro_cog",
-            "cogs.flashcards_cog",
-        ]
+        if not self.lider:
+            # Os comandos são da aplicação, não do shard: o processo com o shard 0 sincroniza e pré-gera por todos.
+            return
 
-        for cog in cogs_a_carregar:
-            try:
-                await self.load_extension(cog)
-                print(f"-> Cog '{cog}' carregado com sucesso.")
-            except Exception as e:
-                print(f"!!! Falha ao carregar o cog '{cog}': {e}")
+        inicio = time.perf_counter()
+        await self.sincronizar_comandos()
+        self.marcar_etapa("sync", inicio)
 
-        print("Sincronizando comandos de barra...")
-        if GUILD_ID:
-            guild_obj = discord.Object(id=GUILD_ID)
+        self.pre_geracao.iniciar()
+
+    async def carregar_cog(self, cog: str):
+        inicio = time.perf_counter()
+        try:
+            await self.load_extension(cog)
+        except Exception as e:
+            print(f"!!! Falha ao carregar o cog '{cog}': {e}")
+            return
+        duracao = self.marcar_etapa(f"cog:{cog}", inicio)
+        print(f"-> Cog '{cog}' carregado com sucesso ({duracao * 1000:.0f} ms).")
+
+    def assinatura_comandos(self, guild) -> str:
+        """Hash do payload que tree.sync enviaria: muda quando nome, descrição, opção ou permissão de um comando muda."""
+        comandos = sorted(
+            (comando.to_dict(self.tree) for comando in self.tree.get_commands(guild=guild)),
+            key=lambda comando: (comando.get("type", 1), comando["name"]),
+        )
+        return hashlib.sha256(json.dumps(comandos, sort_keys=True, default=str).encode()).hexdigest()
+
+    async def sincronizar_comandos(self):
+        guild_obj = discord.Object(id=GUILD_ID) if GUILD_ID else None
+        if guild_obj:
             self.tree.copy_global_to(guild=guild_obj)
+        escopo = f"{self.application_id}:{GUILD_ID or 'global'}"
+        assinatura = self.assinatura_comandos(guild_obj)
+        try:
+            with open(CAMINHO_SYNC, encoding="utf-8") as f:
+                sincronizados = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            sincronizados = {}
+        if sincronizados.get(escopo) == assinatura and not SINCRONIZAR_SEMPRE:
+            print("Comandos de barra sem alterações desde a última sincronização; sync ignorado.")
+            return
+
+        print("Sincronizando comandos de barra...")
+        if guild_obj:
             synced = await self.tree.sync(guild=guild_obj)
             print(f"Sincronizados {len(synced)} comandos para o servidor {GUILD_ID}.")
         else:
@@ -59,13 +162,81 @@ class CNUGeminiBot(commands.Bot):
             synced = await self.tree.sync()
             print(f"Sincronizados {len(synced)} comandos globalmente.")
 
+        sincronizados[escopo] = assinatura
+        os.makedirs(os.path.dirname(CAMINHO_SYNC) or ".", exist_ok=True)
+        with open(CAMINHO_SYNC, "w", encoding="utf-8") as f:
+            json.dump(sincronizados, f, indent=2)
+
+    def marcar_etapa(self, etapa: str, inicio: float, fim: float = None) -> float:
+        duracao = (fim or time.perf_counter()) - inicio
+        self.tempos_inicializacao[etapa] = duracao
+        INICIALIZACAO.definir(duracao, etapa=etapa)
+        registrar_evento("inicializacao", etapa=etapa, duracao_ms=round(duracao * 1000, 1))
+        return duracao
+
+    async def close(self):
+        self.pre_geracao.parar()
+        if self.aquecimento:
+            self.aquecimento.cancel()
+        if self.monitor_loop:
+            self.monitor_loop.cancel()
+        if self.servidor_metricas:
+            await self.servidor_metricas.parar()
+        encerrar_pools()
+        await super().close()
+
+    @property
+    def lider(self) -> bool:
+        return self.shard_ids is None or 0 in self.shard_ids
+
+    def atende_servidor(self, guild_id) -> bool:
+        """Se o servidor (None para DMs) pertence a um shard deste processo."""
+        if self.shard_ids is None:
+            return True
+        shard = 0 if guild_id is None else (guild_id >> 22) % self.shard_count
+        return shard in self.shard_ids
+
+    def registrar_comando(self, interaction: discord.Interaction, resultado: str, erro: Exception = None):
+        # Medido a partir da criação da interação no Discord: inclui a espera na fila do gateway, como o usuário sente.
+        duracao = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        comando = interaction.command.qualified_name if interaction.command else "desconhecido"
+        COMANDOS.observar(duracao, comando=comando, resultado=resultado)
+        registrar_evento(
+            "comando", comando=comando, resultado=resultado, duracao_ms=round(duracao * 1000, 1),
+            usuario=interaction.user.id, servidor=interaction.guild_id, shard=interaction.guild.shard_id if interaction.guild else 0,
+            erro=repr(erro) if erro else None,
+        )
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        self.registrar_comando(interaction, "ok")
+
+    async def on_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        self.registrar_comando(interaction, "erro", error)
+        await app_commands.CommandTree.on_error(self.tree, interaction, error)
+
     async def on_ready(self):
+        if "pronto" not in self.tempos_inicializacao:
+            self.marcar_etapa("pronto", INICIO_PROCESSO)
+            etapas = ", ".join(
+                f"{etapa} {duracao:.2f}s" for etapa, duracao in self.tempos_inicializacao.items() if not etapa.startswith("cog:")
+            )
+            print(f"Inicialização: {etapas}")
         print("-" * 50)
         print(f'Bot conectado como {self.user.name} (ID: {self.user.id})')
         print(f'Pronto para ajudar em {len(self.guilds)} servidores.')
+        if self.cluster is not None:
+            print(f'Processo {self.cluster} do cluster com os shards {list(self.shard_ids)} de {self.shard_count}.')
         print("-" * 50)
         await self.change_presence(activity=discord.Game(name="com os estudos | /pomodoro"))
 
-if __name__ == "__main__":
-    bot = CNUGeminiBot()
+def main(shard_ids=None, shard_count=SHARD_COUNT, cluster: int = None):
+    if cluster is None:
+        configurar_logs()
+    else:
+        configurar_logs(cluster=cluster)
+    bot = CNUGeminiBot(shard_ids=shard_ids, shard_count=shard_count, cluster=cluster)
     bot.run(DISCORD_TOKEN)
+
+
+if __name__ == "__main__":
+    main()
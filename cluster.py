@@ -0,0 +1,154 @@
+"""Sobe o bot em vários processos, cada um com um grupo de shards, para usar mais de um núcleo.
+
+Uso:
+    python cluster.py --processos 4             # quantidade de shards recomendada pelo Discord
+    python cluster.py --processos 4 --shards 16
+
+O processo N atende os shards N*k .. N*k+k-1 e expõe métricas em METRICAS_PORTA + N. Processos que caem
+são reiniciados com espera crescente. Sessões, a cota da Gemini e a popularidade dos temas precisam de um
+backend compartilhado (SESSOES_BACKEND, LIMITES_BACKEND e PRE_GERACAO_BACKEND 'sqlite' numa máquina só, ou
+'redis'); se não forem definidos, o launcher usa 'sqlite'.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import signal
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cada IDENTIFY consome a cota de início de sessão do Discord: `max_concurrency` a cada 5 segundos.
+INTERVALO_IDENTIFY = 5.0
+ESPERA_MAXIMA_REINICIO = 300.0
+
+
+def consultar_gateway(token: str) -> dict:
+    """GET /gateway/bot: quantidade recomendada de shards e limites de início de sessão."""
+    requisicao = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (cnu-gemini-bot cluster)"},
+    )
+    with urllib.request.urlopen(requisicao, timeout=15) as resposta:
+        return json.load(resposta)
+
+
+def dividir_shards(total: int, processos: int) -> list:
+    """Grupos contíguos de shards, um por processo, com tamanhos que diferem no máximo em um."""
+    base, resto = divmod(total, processos)
+    grupos, inicio = [], 0
+    for i in range(processos):
+        tamanho = base + (1 if i < resto else 0)
+        grupos.append(list(range(inicio, inicio + tamanho)))
+        inicio += tamanho
+    return [grupo for grupo in grupos if grupo]
+
+
+def rodar_processo(indice: int, shard_ids: list, shard_count: int):
+    # Importado aqui: no modo spawn, cada processo filho carrega o bot do zero.
+    import bot
+
+    bot.main(shard_ids=shard_ids, shard_count=shard_count, cluster=indice)
+
+
+class Cluster:
+    def __init__(self, grupos: list, shard_count: int, max_concurrency: int):
+        self.grupos = grupos
+        self.shard_count = shard_count
+        self.max_concurrency = max_concurrency
+        self.contexto = multiprocessing.get_context("spawn")
+        self.processos = {}
+        self.falhas = {}
+        self.parando = False
+
+    def espera_identify(self, indice: int) -> float:
+        # Os processos começam um depois do outro, no ritmo em que os shards do anterior conseguem se identificar.
+        return math.ceil(len(self.grupos[indice]) / self.max_concurrency) * INTERVALO_IDENTIFY
+
+    def iniciar(self, indice: int):
+        processo = self.contexto.Process(
+            target=rodar_processo, args=(indice, self.grupos[indice], self.shard_count), name=f"cnu-cluster-{indice}",
+        )
+        processo.start()
+        self.processos[indice] = (processo, time.monotonic())
+        print(f"Processo {indice} (PID {processo.pid}) iniciado com os shards {self.grupos[indice]}.")
+
+    def parar(self, *_):
+        self.parando = True
+
+    def executar(self):
+        signal.signal(signal.SIGINT, self.parar)
+        signal.signal(signal.SIGTERM, self.parar)
+        for indice in range(len(self.grupos)):
+            if self.parando:
+                break
+            self.iniciar(indice)
+            if indice + 1 < len(self.grupos):
+                time.sleep(self.espera_identify(indice))
+
+        reinicios = {}
+        while not self.parando:
+            time.sleep(1)
+            agora = time.monotonic()
+            for indice, (processo, iniciado_em) in list(self.processos.items()):
+                if processo.is_alive() or indice in reinicios:
+                    continue
+                if processo.exitcode == 0:
+                    print(f"Processo {indice} terminou normalmente.")
+                    del self.processos[indice]
+                    continue
+                # Quem ficou de pé por 10 minutos volta a ter espera curta na próxima queda.
+                falhas = 1 if agora - iniciado_em > 600 else self.falhas.get(indice, 0) + 1
+                self.falhas[indice] = falhas
+                espera = min(ESPERA_MAXIMA_REINICIO, INTERVALO_IDENTIFY * 2 ** (falhas - 1))
+                print(f"AVISO: Processo {indice} caiu (código {processo.exitcode}); reiniciando em {espera:.0f}s.")
+                reinicios[indice] = agora + espera
+            for indice, quando in list(reinicios.items()):
+                if agora >= quando:
+                    del reinicios[indice]
+                    self.iniciar(indice)
+            if not self.processos:
+                break
+
+        print("Encerrando o cluster...")
+        for processo, _ in self.processos.values():
+            if processo.is_alive():
+                processo.terminate()
+        for processo, _ in self.processos.values():
+            processo.join(timeout=30)
+            if processo.is_alive():
+                processo.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "0") or 0),
+                        help="total de shards (padrão: o recomendado pelo Discord)")
+    args = parser.parse_args()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        print("ERRO CRÍTICO: A variável de ambiente 'DISCORD_TOKEN' não foi encontrada.")
+        return
+
+    gateway = consultar_gateway(token)
+    shard_count = args.shards or gateway["shards"]
+    max_concurrency = gateway.get("session_start_limit", {}).get("max_concurrency", 1)
+    grupos = dividir_shards(shard_count, max(1, args.processos))
+
+    for variavel in ("SESSOES_BACKEND", "LIMITES_BACKEND", "PRE_GERACAO_BACKEND"):
+        if os.getenv(variavel, "memoria") == "memoria":
+            print(f"AVISO: {variavel} não é compartilhado entre processos; usando 'sqlite'.")
+            os.environ[variavel] = "sqlite"
+
+    print(f"{shard_count} shards em {len(grupos)} processos (max_concurrency {max_concurrency}).")
+    Cluster(grupos, shard_count, max_concurrency).executar()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,50 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import google.generativeai as genai
-from google.cloud import texttospeech
 import asyncio
+import logging
+import math
 import os
-import re
-from config import GEMINI_API_KEY
+import time
+from utils.cache import CacheDuasCamadas
+from utils.cache_audio import CacheAudio, chave_audio
+from utils.executores import MENSAGEM_OCUPADO, PoolOcupado, criar_pool_threads, processar_texto
+from utils.gemini_gateway import GeminiIndisponivel
+from utils.metricas import ETAPAS, acompanhar_estatisticas, registrar_evento
+from utils.roteamento import POLITICAS
+from utils.ssml import dividir_ssml, remover_tags
+from utils.voz import GerenciadorVoz, PedidoReproducao, liberar_partes
+from utils.texto import normalizar_chave
 
-genai.configure(api_key=GEMINI_API_KEY)
+VERSAO_PROMPT = 1
+TTS_MAX_PARALELO = int(os.getenv("TTS_MAX_PARALELO", "4"))
+# Trechos aguardando uma thread livre; além disso, novos pedidos de áudio recebem o aviso de "ocupado".
+TTS_MAX_FILA = int(os.getenv("TTS_MAX_FILA", "16"))
+# Marca o cliente do TTS ainda não criado; None fica para "não foi possível criar".
+_TTS_PENDENTE = object()
+
+
+async def _texto_resposta(response):
+    return response.text
+
+
+def carregar_tts():
+    """Importa o SDK do Google Cloud TTS no primeiro uso: o import (gRPC, protobuf) sozinho leva segundos."""
+    from google.cloud import texttospeech
+
+    return texttospeech
+
+
+def criar_cliente_tts():
+    try:
+        cliente = carregar_tts().TextToSpeechClient.from_service_account_json('google_credentials.json')
+        print("Cliente Google Cloud TTS inicializado com sucesso.")
+        return cliente
+    except FileNotFoundError:
+        print("ERRO: O arquivo 'google_credentials.json' não foi encontrado. A função de áudio não funcionará.")
+    except Exception as e:
+        print(f"ERRO ao inicializar o cliente Google Cloud TTS: {e}")
+    return None
 
 class SelecaoFormatoView(discord.ui.View):
     def __init__(self, author_id, topico, cog_ref):
@@ -45,18 +81,55 @@ class SelecaoFormatoView(discord.ui.View):
 class ExplicacaoCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        try:
-            self.tts_client = texttospeech.TextToSpeechClient.from_service_account_json('google_credentials.json')
-            print("Cliente Google Cloud TTS inicializado com sucesso.")
-        except FileNotFoundError:
-            print("ERRO: O arquivo 'google_credentials.json' não foi encontrado. A função de áudio não funcionará.")
-            self.tts_client = None
-        except Exception as e:
-            print(f"ERRO ao inicializar o cliente Google Cloud TTS: {e}")
-            self.tts_client = None
+        self.politica = POLITICAS["explique"]
+        self.explicacoes = CacheDuasCamadas("explicacoes", capacidade=500, ttl=7 * 24 * 3600)
+        self.cache_audio = CacheAudio()
+        self.pool_tts = criar_pool_threads("tts", TTS_MAX_PARALELO, TTS_MAX_FILA)
+        self.voz = GerenciadorVoz()
+        acompanhar_estatisticas("voz", self.voz)
+        acompanhar_estatisticas("cache_explicacoes", self.explicacoes)
+        self.tts_client = _TTS_PENDENTE
+        self.trava_tts = asyncio.Lock()
+        self.aquecimento_tts = None
+
+    async def cog_load(self):
+        # O cliente é criado em segundo plano: carregar o cog não espera o SDK, e o primeiro áudio quase nunca espera.
+        self.aquecimento_tts = asyncio.create_task(self.obter_tts_client())
+
+    async def obter_tts_client(self):
+        """Cliente do TTS, criado numa thread na primeira vez; None se as credenciais não estiverem disponíveis."""
+        if self.tts_client is _TTS_PENDENTE:
+            async with self.trava_tts:
+                if self.tts_client is _TTS_PENDENTE:
+                    self.tts_client = await asyncio.to_thread(criar_cliente_tts)
+        return self.tts_client
+
+    async def cog_unload(self):
+        if self.aquecimento_tts:
+            self.aquecimento_tts.cancel()
+        await self.voz.encerrar()
+        self.pool_tts.encerrar()
+
+    async def pre_gerar(self, topico: str):
+        """Deixa a explicação do tópico pronta. Retorna True se chamou a Gemini."""
+        if await self.explicacoes.obter(self.chave_explicacao(topico), contar=False):
+            return False
+        await self.obter_texto_explicativo(topico)
+        return True
+
+    def chave_explicacao(self, topico: str) -> str:
+        """Mudar o modelo primário da política ou a VERSAO_PROMPT invalida as explicações já guardadas."""
+        return f"{self.politica.primario}:v{VERSAO_PROMPT}:{normalizar_chave(topico)}"
 
     async def obter_texto_explicativo(self, topico: str):
+        """Explicação em SSML, compartilhada pelos modos texto e áudio; só chama a Gemini em caso de falha no cache."""
+        chave = self.chave_explicacao(topico)
+        texto_em_cache = await self.explicacoes.obter(chave)
+        if texto_em_cache:
+            return texto_em_cache
+        return await self.bot.coalescedor.executar(f"explique:{chave}", lambda: self._gerar_texto_explicativo(topico, chave))
+
+    async def _gerar_texto_explicativo(self, topico: str, chave: str):
         prompt = f"""
         Aja como um narrador profissional e especialista no assunto.
         Explique de forma clara, didática e conversacional o seguinte tópico: "{topico}".
@@ -71,15 +144,24 @@ class ExplicacaoCog(commands.Cog):
         </speak>
         """
         try:
-            response = await self.model.generate_content_async(prompt)
-            return response.text
+            texto = await self.bot.roteador.gerar("explique", prompt, _texto_resposta)
+            if texto:
+                await self.explicacoes.definir(chave, texto)
+            return texto
+        except GeminiIndisponivel:
+            raise
         except Exception as e:
             print(f"Erro ao gerar conteúdo com Gemini: {e}")
             return None
 
     def converter_texto_para_audio_google(self, texto_ssml: str):
-        if not self.tts_client:
+        """Sintetiza o SSML em OGG/Opus (ou reaproveita o cache) e devolve um HandleAudio com o áudio em memória.
+
+        O handle deve ser liberado após o uso.
+        """
+        if not self.tts_client or self.tts_client is _TTS_PENDENTE:
             return None
+        texttospeech = carregar_tts()
 
         texto_ssml = texto_ssml.strip()
         if not texto_ssml.startswith('<speak>'):
@@ -91,11 +173,23 @@ class ExplicacaoCog(commands.Cog):
             language_code="pt-BR", name="pt-BR-Wavenet-A"
         )
         audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
+            audio_encoding=texttospeech.AudioEncoding.OGG_OPUS,
+            sample_rate_hertz=48000,
             effects_profile_id=['headphone-class-device']
         )
         
+        chave = chave_audio(
+            texto_ssml, f"{voice.language_code}/{voice.name}",
+            f"{audio_config.audio_encoding}/{audio_config.sample_rate_hertz}/{','.join(audio_config.effects_profile_id)}"
+        )
+        handle = self.cache_audio.obter(chave)
+        if handle:
+            print("Áudio encontrado no cache, sem chamada ao TTS.")
+            handle.ler()
+            return handle
+
         response = None
+        inicio = time.perf_counter()
         try:
             print("Tentando sintetizar com SSML...")
             synthesis_input = texttospeech.SynthesisInput(ssml=texto_ssml)
@@ -106,7 +200,7 @@ class ExplicacaoCog(commands.Cog):
             print(f"AVISO: Falha ao sintetizar com SSML ({e}). Tentando novamente com texto puro.")
             try:
                 print("Executando Plano B: Sintetizando com texto puro.")
-                texto_puro = re.sub('<[^<]+?>', '', texto_ssml)
+                texto_puro = remover_tags(texto_ssml)
                 
                 synthesis_input = texttospeech.SynthesisInput(text=texto_puro)
                 response = self.tts_client.synthesize_speech(
@@ -117,20 +211,35 @@ class ExplicacaoCog(commands.Cog):
                 return None
         
         if response:
-            filepath = "temp_audio.mp3"
-            with open(filepath, "wb") as out:
-                out.write(response.audio_content)
-            print(f"Áudio salvo em: {filepath}")
-            return filepath
+            duracao = time.perf_counter() - inicio
+            ETAPAS.observar(duracao, etapa="tts_sintese")
+            registrar_evento("tts_sintese", duracao_ms=round(duracao * 1000, 1), caracteres=len(texto_ssml), bytes=len(response.audio_content))
+            handle = self.cache_audio.salvar(chave, response.audio_content)
+            print(f"Áudio salvo em: {handle.caminho}")
+            return handle
         return None
 
-    async def gerar_explicacao_texto(self, interaction: discord.Interaction, topico: str):
-        texto_ssml = await self.obter_texto_explicativo(topico)
+    async def obter_texto_ou_avisar(self, interaction: discord.Interaction, topico: str):
+        """Obtém a explicação; se não der, avisa o usuário e devolve None."""
+        try:
+            texto_ssml = await self.obter_texto_explicativo(topico)
+        except GeminiIndisponivel:
+            await interaction.followup.send("A IA está sobrecarregada ou fora do ar no momento. Tente novamente em alguns minutos.", ephemeral=True)
+            return None
         if not texto_ssml:
             await interaction.followup.send("Desculpe, não consegui gerar o conteúdo da explicação.", ephemeral=True)
+        return texto_ssml
+
+    async def gerar_explicacao_texto(self, interaction: discord.Interaction, topico: str):
+        texto_ssml = await self.obter_texto_ou_avisar(interaction, topico)
+        if not texto_ssml:
             return
             
-        texto_limpo = re.sub('<[^<]+?>', '', texto_ssml)
+        try:
+            texto_limpo = await processar_texto(remover_tags, texto_ssml)
+        except PoolOcupado:
+            await interaction.followup.send(MENSAGEM_OCUPADO, ephemeral=True)
+            return
         
         if len(texto_limpo) > 1900:
             texto_limpo = texto_limpo[:1900] + "\n\n... (explicação truncada)"
@@ -139,55 +248,62 @@ class ExplicacaoCog(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
 
     async def gerar_explicacao_audio(self, interaction: discord.Interaction, topico: str):
-        if not self.tts_client:
+        if not await self.obter_tts_client():
             await interaction.followup.send("Desculpe, a função de áudio não está configurada corretamente.", ephemeral=True)
             return
 
-        texto_ssml = await self.obter_texto_explicativo(topico)
+        inicio = time.perf_counter()
+        texto_ssml = await self.obter_texto_ou_avisar(interaction, topico)
         if not texto_ssml:
-            await interaction.followup.send("Desculpe, não consegui gerar o conteúdo da explicação.", ephemeral=True)
             return
 
-        loop = asyncio.get_running_loop()
-        audio_filepath = await loop.run_in_executor(None, self.converter_texto_para_audio_google, texto_ssml)
+        try:
+            trechos = await processar_texto(dividir_ssml, texto_ssml) or [texto_ssml]
+        except PoolOcupado:
+            await interaction.followup.send(MENSAGEM_OCUPADO, ephemeral=True)
+            return
+        # Só o primeiro trecho pode ser recusado pelo pool cheio; aceito o pedido, os demais esperam a vez.
+        partes = [
+            asyncio.ensure_future(self.pool_tts.executar(
+                self.converter_texto_para_audio_google, trecho, espera=None if i == 0 else math.inf,
+            ))
+            for i, trecho in enumerate(trechos)
+        ]
+        try:
+            primeira = await partes[0]
+        except PoolOcupado:
+            await interaction.followup.send(MENSAGEM_OCUPADO, ephemeral=True)
+            liberar_partes(partes)
+            return
+        except Exception as e:
+            # Erro do SDK/API do TTS, pool quebrado ou falha ao ler o cache: cai no mesmo aviso de falha na síntese.
+            registrar_evento("tts_falhou", nivel=logging.ERROR, trecho=0, erro=type(e).__name__, detalhe=str(e))
+            primeira = None
 
-        if not audio_filepath:
+        if not primeira:
             await interaction.followup.send("Desculpe, falhei ao tentar converter a explicação para áudio.", ephemeral=True)
+            liberar_partes(partes)
             return
 
         voice_channel = interaction.user.voice.channel
-        try:
-            vc = await voice_channel.connect()
-        except discord.ClientException:
-            vc = interaction.guild.voice_client
-            if vc.channel != voice_channel:
-                await vc.move_to(voice_channel)
-        except Exception as e:
-            await interaction.followup.send(f"Não consegui me conectar ao canal de voz: {e}", ephemeral=True)
-            if os.path.exists(audio_filepath): os.remove(audio_filepath)
-            return
 
-        await interaction.followup.send(f"Iniciando a explicação em áudio no canal `{voice_channel.name}`.", ephemeral=True)
-        
-        def after_playing(error):
-            if error:
-                print(f"Erro ao tocar o áudio: {error}")
-            coro = vc.disconnect()
-            fut = asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-            try:
-                fut.result()
-            except Exception as e:
-                print(f"Erro ao tentar desconectar: {e}")
-            
-            if os.path.exists(audio_filepath):
-                os.remove(audio_filepath)
-                print(f"Arquivo temporário '{audio_filepath}' deletado.")
+        async def avisar_falha(erro):
+            await interaction.followup.send(f"Não consegui tocar a explicação no canal de voz: {erro}", ephemeral=True)
 
-        vc.play(discord.FFmpegPCMAudio(audio_filepath), after=after_playing)
+        pedido = PedidoReproducao(canal=voice_channel, partes=partes, inicio=inicio, avisar_falha=avisar_falha)
+        na_frente = self.voz.enfileirar(interaction.guild_id, interaction.guild, pedido)
+        if na_frente:
+            await interaction.followup.send(
+                f"Há {na_frente} explicação(ões) tocando ou na fila deste servidor; a sua começa em seguida no canal `{voice_channel.name}`.",
+                ephemeral=True,
+            )
+        else:
+            await interaction.followup.send(f"Iniciando a explicação em áudio no canal `{voice_channel.name}`.", ephemeral=True)
 
     @app_commands.command(name="explique", description="Pede ao bot uma explicação sobre qualquer tópico.")
     @app_commands.describe(topico="O assunto que você quer que o bot explique.")
     async def explique(self, interaction: discord.Interaction, topico: str):
+        self.bot.pre_geracao.registrar("explique", topico)
         view = SelecaoFormatoView(author_id=interaction.user.id, topico=topico, cog_ref=self)
         await interaction.response.send_message(
             f"Entendido! Você pediu uma explicação sobre **{topico}**. Como você prefere recebê-la?",
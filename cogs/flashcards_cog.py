@@ -1,149 +1,269 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import google.generativeai as genai
-import json
-import re
-from config import GEMINI_API_KEY
+import os
+from dataclasses import asdict, dataclass, field
+from utils.cache import CacheLRU
+from utils.embeds import LIMITE_RODAPE, adicionar_campo, paginar, truncar
+from utils.decodificacao import SCHEMA_FLASHCARDS, config_json
+from utils.executores import MENSAGEM_OCUPADO, PoolOcupado
+from utils.lotes import gerar_itens, variacao_prompt
+from utils.paineis import avisar_expiracao, painel_botoes
+from utils.gemini_gateway import GeminiIndisponivel
+from utils.repeticao_espacada import BaralhoRevisao, Flashcard
+from utils.roteamento import POLITICAS
+from utils.sessoes import ExpiracaoSessoes, criar_armazem
+from utils.texto import normalizar_chave
 
-genai.configure(api_key=GEMINI_API_KEY)
 active_flashcards = {}
+MAX_CARDS = 20
+# Mesmo valor do antigo timeout da FlashcardView.
+TTL_OCIOSO = float(os.getenv("FLASHCARDS_TTL_OCIOSO", "600"))
+# Notas do SM-2 para cada botão de avaliação.
+NOTAS = {"flashcards:acertei": 4, "flashcards:errei": 1, "flashcards:nao_sei": 0}
+# Espaço guardado no limite de 6000 caracteres para o placar, que é o único trecho que muda a cada clique.
+RESERVA_PLACAR = 64
 
-class FlashcardView(discord.ui.View):
-    def __init__(self, bot: commands.Bot, interaction: discord.Interaction, cards: list):
-        super().__init__(timeout=600.0)
-        self.bot = bot
-        self.interaction = interaction
-        self.cards = cards
-        self.author_id = interaction.user.id
-        
-        self.current_card = 0
-        self.acertos = 0
-        self.erros = 0
-        self.nao_sabia_topicos = []
-        self.is_flipped = False
+@dataclass(slots=True)
+class SessaoFlashcards:
+    cards: tuple
+    # Id de cada card no baralho de revisão do usuário, na mesma ordem de `cards`.
+    card_ids: tuple = ()
+    message_id: int = 0
+    current_card: int = 0
+    acertos: int = 0
+    erros: int = 0
+    nao_sabia_topicos: list = field(default_factory=list)
+    is_flipped: bool = False
+    # Última interação do usuário, para desabilitar os botões quando a sessão expira. Não é salva.
+    interacao: discord.Interaction = None
+    # Embeds (frente, verso) de cada card, montados uma vez por sessão. Não são salvos.
+    paginas: tuple = None
 
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.author_id:
-            await interaction.response.send_message("Estes flashcards não são seus!", ephemeral=True)
-            return False
-        return True
+    def para_dict(self) -> dict:
+        dados = {campo: getattr(self, campo) for campo in self.__slots__ if campo not in ("interacao", "paginas")}
+        dados["cards"] = [asdict(card) for card in self.cards]
+        return dados
 
-    async def start(self):
-        """Inicia a sessão de flashcards, mostrando o primeiro card."""
-        await self.show_card()
+    @classmethod
+    def de_dict(cls, dados: dict) -> "SessaoFlashcards":
+        return cls(**{
+            **dados, "cards": tuple(Flashcard.de_dict(card) for card in dados["cards"]), "card_ids": tuple(dados["card_ids"]),
+        })
 
-    def create_embed(self):
-        """Cria o embed com base no estado atual do card (virado ou não)."""
-        card_data = self.cards[self.current_card]
-        
-        if not self.is_flipped:
-            embed = discord.Embed(
-                title=f"Flashcard {self.current_card + 1}/{len(self.cards)}",
-                description=f"**FRENTE:**\n\n# {card_data['frente']}",
-                color=discord.Color.blue()
-            )
-        else:
-            embed = discord.Embed(
-                title=f"Flashcard {self.current_card + 1}/{len(self.cards)}",
-                description=f"**FRENTE:**\n\n# {card_data['frente']}\n\n---\n\n**VERSO:**\n\n## {card_data['verso']}",
-                color=discord.Color.purple()
-            )
-        
-        embed.set_footer(text=f"Acertos: {self.acertos} | Erros: {self.erros}")
-        return embed
-
-    def update_buttons(self):
-        """Atualiza os botões visíveis com base no estado do card."""
-        self.clear_items()
-        if not self.is_flipped:
-            flip_button = discord.ui.Button(label="Virar Card 🔄", style=discord.ButtonStyle.primary, custom_id="flip_card")
-            flip_button.callback = self.flip_card_callback
-            self.add_item(flip_button)
-        else:
-            correct_button = discord.ui.Button(label="Acertei ✅", style=discord.ButtonStyle.success, custom_id="assess_correct")
-            correct_button.callback = self.assess_callback
-            
-            incorrect_button = discord.ui.Button(label="Errei ❌", style=discord.ButtonStyle.danger, custom_id="assess_incorrect")
-            incorrect_button.callback = self.assess_callback
+def card_valido(card) -> bool:
+    """Confere se o card gerado pela IA tem frente e verso."""
+    return isinstance(card, dict) and bool(card.get("frente")) and bool(card.get("verso"))
 
-            unknown_button = discord.ui.Button(label="Não Sei 🤔", style=discord.ButtonStyle.secondary, custom_id="assess_unknown")
-            unknown_button.callback = self.assess_callback
+def renderizar_cards(cards) -> tuple:
+    """Monta, já dentro dos limites do Discord, os embeds da frente e do verso de todos os cards do baralho."""
+    paginas = []
+    for i, card in enumerate(cards):
+        titulo = f"Flashcard {i + 1}/{len(cards)}"
+        frente = f"**FRENTE:**\n\n# {card.frente}"
+        paginas.append((
+            paginar(titulo, frente, discord.Color.blue(), reserva=RESERVA_PLACAR),
+            paginar(titulo, f"{frente}\n\n---\n\n**VERSO:**\n\n## {card.verso}", discord.Color.purple(), reserva=RESERVA_PLACAR),
+        ))
+    return tuple(paginas)
 
-            self.add_item(correct_button)
-            self.add_item(incorrect_button)
-            self.add_item(unknown_button)
+def embeds_card(sessao: SessaoFlashcards):
+    """Embeds pré-montados do card atual (virado ou não); só o placar do rodapé é atualizado."""
+    if sessao.paginas is None:
+        sessao.paginas = renderizar_cards(sessao.cards)
+    embeds = sessao.paginas[sessao.current_card][sessao.is_flipped]
+    embeds[-1].set_footer(text=truncar(f"Acertos: {sessao.acertos} | Erros: {sessao.erros}", min(RESERVA_PLACAR, LIMITE_RODAPE)))
+    return embeds
+
+def botoes_card(virado: bool = None) -> list:
+    """Botões conforme o card está virado ou não. Sem estado (view persistente), todos."""
+    botoes = []
+    if virado is not True:
+        botoes.append(discord.ui.Button(label="Virar Card 🔄", style=discord.ButtonStyle.primary, custom_id="flashcards:virar"))
+    if virado is not False:
+        botoes.append(discord.ui.Button(label="Acertei ✅", style=discord.ButtonStyle.success, custom_id="flashcards:acertei"))
+        botoes.append(discord.ui.Button(label="Errei ❌", style=discord.ButtonStyle.danger, custom_id="flashcards:errei"))
+        botoes.append(discord.ui.Button(label="Não Sei 🤔", style=discord.ButtonStyle.secondary, custom_id="flashcards:nao_sei"))
+    return botoes
+
+class FlashcardView(discord.ui.View):
+    """View persistente, registrada uma vez no carregamento do cog: os botões são roteados pelo custom_id e o
+    estado vem do armazenamento pelo usuário do clique, então a sessão continua depois de um reinício do bot,
+    sem nova chamada à IA. As mensagens levam só o layout dos botões (`painel_botoes`)."""
 
-    async def show_card(self):
-        """Função principal que monta e envia/edita a mensagem do card."""
-        embed = self.create_embed()
-        self.update_buttons()
-        await self.interaction.edit_original_response(embed=embed, view=self)
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+        for botao in botoes_card():
+            botao.callback = self.flip_card_callback if botao.custom_id == "flashcards:virar" else self.assess_callback
+            self.add_item(botao)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        sessao = await self.cog.obter_sessao(interaction.user.id)
+        if not sessao or sessao.message_id != interaction.message.id:
+            await interaction.response.send_message("Estes flashcards não são seus ou a sessão já foi encerrada!", ephemeral=True)
+            return False
+        sessao.interacao = interaction
+        self.cog.expiracao.tocar(interaction.user.id)
+        return True
+
+    async def show_card(self, interaction: discord.Interaction, sessao: SessaoFlashcards):
+        """Função principal que monta o card atual e edita a mensagem em resposta ao clique."""
+        await self.cog.salvar_sessao(interaction.user.id)
+        await interaction.response.edit_message(embeds=embeds_card(sessao), view=painel_botoes(botoes_card(sessao.is_flipped)))
 
     async def flip_card_callback(self, interaction: discord.Interaction):
         """Callback para o botão 'Virar Card'."""
-        await interaction.response.defer()
-        self.is_flipped = True
-        await self.show_card()
+        # A instância é compartilhada entre usuários: o estado vem sempre do dono do clique.
+        sessao = active_flashcards[interaction.user.id]
+        sessao.is_flipped = True
+        await self.show_card(interaction, sessao)
 
     async def assess_callback(self, interaction: discord.Interaction):
         """Callback para os botões 'Acertei', 'Errei' e 'Não Sei'."""
-        await interaction.response.defer()
-        
-
+        sessao = active_flashcards[interaction.user.id]
         custom_id = interaction.data['custom_id']
-        
-        if custom_id == "assess_correct":
-            self.acertos += 1
-        elif custom_id == "assess_incorrect":
-            self.erros += 1
-        elif custom_id == "assess_unknown":
-            self.erros += 1
-            card_data = self.cards[self.current_card]
-            review_topic = card_data.get('topico_para_revisao', 'Tópico não especificado.')
-            if review_topic not in self.nao_sabia_topicos:
-                self.nao_sabia_topicos.append(review_topic)
-
-        self.current_card += 1
-        self.is_flipped = False
-
-        if self.current_card < len(self.cards):
-            await self.show_card()
+        if sessao.current_card >= len(sessao.cards):
+            # Clique duplo no último card: o primeiro já está encerrando a sessão.
+            await interaction.response.defer()
+            return
+        # O estado muda antes de qualquer await: cliques rápidos rodam em paralelo e cada um deve avaliar o seu card.
+        card_id = sessao.card_ids[sessao.current_card]
+
+        if custom_id == "flashcards:acertei":
+            sessao.acertos += 1
+        elif custom_id == "flashcards:errei":
+            sessao.erros += 1
+        elif custom_id == "flashcards:nao_sei":
+            sessao.erros += 1
+            card_data = sessao.cards[sessao.current_card]
+            review_topic = card_data.topico_para_revisao or 'Tópico não especificado.'
+            if review_topic not in sessao.nao_sabia_topicos:
+                sessao.nao_sabia_topicos.append(review_topic)
+
+        sessao.current_card += 1
+        sessao.is_flipped = False
+        await self.cog.revisao.registrar(interaction.user.id, card_id, NOTAS[custom_id])
+
+        if sessao.current_card < len(sessao.cards):
+            await self.show_card(interaction, sessao)
         else:
-            await self.end_session()
+            await self.end_session(interaction, sessao)
             
-    async def end_session(self):
+    async def end_session(self, interaction: discord.Interaction, sessao: SessaoFlashcards):
         """Encerra a sessão e mostra o resultado final, incluindo os tópicos de revisão."""
-        total = len(self.cards)
-        percentual_acertos = (self.acertos / total) * 100 if total > 0 else 0
+        await self.cog.encerrar_sessao(interaction.user.id)
+        total = len(sessao.cards)
+        percentual_acertos = (sessao.acertos / total) * 100 if total > 0 else 0
         
         final_embed = discord.Embed(
             title="🏁 Sessão de Flashcards Finalizada!",
             description=f"Ótimo trabalho! Você revisou **{total}** cards.",
             color=discord.Color.gold()
         )
-        final_embed.add_field(name="Acertos ✅", value=f"**{self.acertos}**", inline=True)
-        final_embed.add_field(name="Erros/Não Sabia ❌", value=f"**{self.erros}**", inline=True)
+        final_embed.add_field(name="Acertos ✅", value=f"**{sessao.acertos}**", inline=True)
+        final_embed.add_field(name="Erros/Não Sabia ❌", value=f"**{sessao.erros}**", inline=True)
         final_embed.add_field(name="Aproveitamento", value=f"**{percentual_acertos:.2f}%**", inline=True)
 
-        if self.nao_sabia_topicos:
-            review_text = "\n".join(f"- {topic}" for topic in self.nao_sabia_topicos)
-            final_embed.add_field(
-                name="📚 Tópicos para reforçar o estudo:",
-                value=review_text,
-                inline=False
-            )
+        if sessao.nao_sabia_topicos:
+            review_text = "\n".join(f"- {topic}" for topic in sessao.nao_sabia_topicos)
+            adicionar_campo(final_embed, "📚 Tópicos para reforçar o estudo:", review_text, inline=False)
 
-        await self.interaction.edit_original_response(embed=final_embed, view=None)
-        self.stop()
+        await interaction.response.edit_message(embed=final_embed, view=None)
 
 class FlashcardsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        self.politica = POLITICAS["flashcards"]
+        self.decks_prontos = CacheLRU(capacidade=200, ttl=6 * 3600)
+        self.revisao = BaralhoRevisao()
+        self.sessoes = criar_armazem("flashcards")
+        self.expiracao = ExpiracaoSessoes("flashcards", active_flashcards, self.sessoes, TTL_OCIOSO, self.sessao_expirada)
+
+    async def cog_load(self):
+        self.bot.add_view(FlashcardView(self))
+        self.expiracao.iniciar()
+
+    async def cog_unload(self):
+        self.expiracao.parar()
+
+    async def obter_sessao(self, user_id):
+        """Sessão em andamento do usuário; após um reinício é recarregada do armazenamento."""
+        sessao = active_flashcards.get(user_id)
+        if sessao is None:
+            dados = await self.sessoes.obter(user_id)
+            if dados is not None:
+                sessao = SessaoFlashcards.de_dict(dados)
+                active_flashcards[user_id] = sessao
+                self.expiracao.tocar(user_id)
+        return sessao
+
+    async def salvar_sessao(self, user_id):
+        await self.sessoes.salvar(user_id, active_flashcards[user_id].para_dict())
+
+    async def encerrar_sessao(self, user_id):
+        active_flashcards.pop(user_id, None)
+        self.expiracao.cancelar(user_id)
+        await self.sessoes.remover(user_id)
+
+    async def sessao_expirada(self, user_id, sessao: SessaoFlashcards):
+        await avisar_expiracao(self.bot, sessao.interacao, sessao.message_id, "⌛ Esta sessão de flashcards expirou por inatividade.")
+
+    async def pre_gerar(self, tema):
+        """Deixa um baralho completo pronto para o tema. Retorna True se chamou a Gemini."""
+        chave = normalizar_chave(tema)
+        if chave in self.decks_prontos:
+            return False
+        cards = self.converter_cards(await self.generate_flashcards_with_gemini(tema, MAX_CARDS))
+        if cards:
+            self.decks_prontos.definir(chave, cards)
+        return True
+
+    async def montar_baralho(self, user_id, tema, quantidade):
+        """Cards vencidos do usuário primeiro; a Gemini só é chamada para completar com material novo.
+
+        Devolve (card_ids, cards). Se a IA estiver fora, a sessão segue só com as revisões, quando houver.
+        """
+        escolhidos = await self.revisao.vencidos(user_id, tema, quantidade)
+        faltam = quantidade - len(escolhidos)
+        if faltam > 0:
+            # O baralho pré-gerado pode ter cards que o usuário já tem; só se ele não bastar a Gemini é chamada.
+            # Só os cards que vão ser mostrados entram no baralho de revisão; os outros ficariam vencidos sem nunca aparecer.
+            deck = self.decks_prontos.obter(normalizar_chave(tema)) or ()
+            novos = await self.revisao.adicionar(user_id, tema, deck, limite=faltam)
+            try:
+                if len(novos) < faltam:
+                    restantes = faltam - len(novos)
+                    gerados = self.converter_cards(await self.generate_flashcards_with_gemini(tema, restantes)) or ()
+                    novos += await self.revisao.adicionar(user_id, tema, gerados, limite=restantes)
+            except (GeminiIndisponivel, PoolOcupado):
+                if not escolhidos and not novos:
+                    raise
+            escolhidos += novos
+        return tuple(card_id for card_id, _ in escolhidos), tuple(card for _, card in escolhidos)
+
+    def converter_cards(self, cards):
+        """Troca os dicts vindos da IA por `Flashcard`, descartando os que vieram sem frente ou verso."""
+        if not cards:
+            return cards
+        return tuple(Flashcard.de_dict(c) for c in cards if card_valido(c))
 
     async def generate_flashcards_with_gemini(self, tema, num_cards):
-        prompt = f"""
+        chave = f"flashcards:{self.politica.primario}:{normalizar_chave(tema)}:{num_cards}"
+        return await self.bot.coalescedor.executar(chave, lambda: self._gerar_flashcards(tema, num_cards))
+
+    async def _gerar_flashcards(self, tema, num_cards):
+        """Cards com frente e verso e sem frentes repetidas, gerados em lotes paralelos; pode devolver menos que o pedido."""
+        return await gerar_itens(
+            self.bot.roteador, "flashcards", lambda n, parte, partes, evitar: self.montar_prompt(tema, n, parte, partes, evitar),
+            num_cards, card_valido, "frente", config_json(SCHEMA_FLASHCARDS),
+        )
+
+    def montar_prompt(self, tema, num_cards, parte=0, partes=1, evitar=()):
+        variacao = variacao_prompt(
+            parte, partes, evitar, "cubra conceitos do tema diferentes dos mais óbvios.", "estes cards já criados",
+        )
+        return f"""
         Aja como um especialista em memorização e criação de material de estudo para concursos.
         Crie {num_cards} flashcards sobre o tema: "{tema}".
 
@@ -151,7 +271,7 @@ class FlashcardsCog(commands.Cog):
         - "frente": Deve ser uma pergunta direta ou um conceito a ser definido.
         - "verso": Deve ser a resposta direta e concisa para a "frente".
         - "topico_para_revisao": Um tópico de estudo específico e direcionado relacionado ao card.
-
+        {variacao}
         Retorne a resposta estritamente no seguinte formato JSON, dentro de um bloco de código JSON. Não inclua texto fora do bloco.
         
         Exemplo de formato:
@@ -165,25 +285,6 @@ class FlashcardsCog(commands.Cog):
         ]
         ```
         """
-        try:
-            response = await self.model.generate_content_async(prompt)
-            raw_text = response.text.strip()
-            
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```|(\[[\s\S]*\])', raw_text)
-            if not json_match:
-                print(f"ERRO: Nenhum JSON encontrado na resposta para flashcards sobre '{tema}'.")
-                return None
-            
-            cleaned_response = next((group for group in json_match.groups() if group is not None), None)
-            if not cleaned_response:
-                print(f"ERRO: Bloco JSON vazio para flashcards sobre '{tema}'.")
-                return None
-            
-            cards = json.loads(cleaned_response)
-            return cards
-        except Exception as e:
-            print(f"Erro ao gerar flashcards: {e}")
-            return None
 
     @app_commands.command(name="flashcards", description="Inicia uma sessão de revisão com flashcards gerados por IA.")
     @app_commands.describe(
@@ -192,21 +293,37 @@ class FlashcardsCog(commands.Cog):
     )
     async def flashcards(self, interaction: discord.Interaction, tema: str, quantidade: int):
         
-        if not (3 <= quantidade <= 20):
+        if not (3 <= quantidade <= MAX_CARDS):
             await interaction.response.send_message("Por favor, escolha uma quantidade de flashcards entre 3 e 20.", ephemeral=True)
             return
 
+        self.bot.pre_geracao.registrar("flashcards", tema)
         await interaction.response.defer(ephemeral=True)
         
-        cards = await self.generate_flashcards_with_gemini(tema, quantidade)
+        try:
+            card_ids, cards = await self.montar_baralho(interaction.user.id, tema, quantidade)
+        except GeminiIndisponivel:
+            await interaction.followup.send("A IA está sobrecarregada ou fora do ar no momento. Tente novamente em alguns minutos.", ephemeral=True)
+            return
+        except PoolOcupado:
+            await interaction.followup.send(MENSAGEM_OCUPADO, ephemeral=True)
+            return
         
-        if not cards or len(cards) < quantidade:
+        if not cards:
             await interaction.followup.send("Desculpe, não consegui gerar os flashcards no momento. A IA pode estar ocupada ou o tema é muito específico. Tente novamente.", ephemeral=True)
             return
             
-        view = FlashcardView(self.bot, interaction, cards)
-        await interaction.followup.send("Iniciando flashcards...", ephemeral=True)
-        await view.start()
+        sessao = SessaoFlashcards(cards=cards, card_ids=card_ids, interacao=interaction)
+        aviso = None
+        if len(cards) < quantidade:
+            aviso = f"Consegui montar {len(cards)} dos {quantidade} flashcards pedidos; a sessão seguirá com eles."
+        message = await interaction.followup.send(
+            content=aviso, embeds=embeds_card(sessao), view=painel_botoes(botoes_card(False)), ephemeral=True, wait=True,
+        )
+        sessao.message_id = message.id
+        active_flashcards[interaction.user.id] = sessao
+        self.expiracao.tocar(interaction.user.id)
+        await self.salvar_sessao(interaction.user.id)
 
 
 async def setup(bot: commands.Bot):
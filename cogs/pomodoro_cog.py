@@ -1,98 +1,191 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import asyncio
+import time
+from dataclasses import dataclass, asdict
+from utils.agendador import AgendadorTimers
+from utils.metricas import SESSOES_ATIVAS
+from utils.sessoes import criar_armazem
 
 active_pomodoros = {}
+SESSOES_ATIVAS.acompanhar(lambda: len(active_pomodoros), tipo="pomodoro")
+
+@dataclass(slots=True)
+class SessaoPomodoro:
+    user_id: int
+    channel_id: int
+    message_id: int
+    foco: int
+    pausa_curta: int
+    pausa_longa: int
+    ciclos: int
+    ciclo: int = 0
+    fase: str = "foco"
+    prazo: float = 0.0
+    guild_id: int = None
+
+    @property
+    def pausa_longa_agora(self) -> bool:
+        return (self.ciclo + 1) % 4 == 0
+
+    @property
+    def duracao_pausa(self) -> int:
+        return self.pausa_longa if self.pausa_longa_agora else self.pausa_curta
 
 class PomodoroView(discord.ui.View):
-    def __init__(self, author_id):
+    """View persistente: é registrada uma vez e encontra a sessão pelo usuário e pela mensagem clicada."""
+
+    def __init__(self, cog):
         super().__init__(timeout=None)
-        self.author_id = author_id
+        self.cog = cog
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.author_id:
+        sessao = active_pomodoros.get(interaction.user.id)
+        if not sessao or sessao.message_id != interaction.message.id:
             await interaction.response.send_message("Este controle de Pomodoro não é seu!", ephemeral=True)
             return False
         return True
 
-    @discord.ui.button(label="❌ Encerrar Sessão", style=discord.ButtonStyle.danger, custom_id="end_pomodoro")
+    @discord.ui.button(label="❌ Encerrar Sessão", style=discord.ButtonStyle.danger, custom_id="pomodoro:encerrar")
     async def end_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        task = active_pomodoros.get(self.author_id)
-        if task:
-            task.cancel()
-        
-        button.disabled = True
-        button.label = "Sessão Encerrada"
-        
+        await self.cog.encerrar_sessao(interaction.user.id)
+        print(f"Sessão de Pomodoro para {interaction.user.name} foi cancelada.")
+
+        # Esta instância é compartilhada por todas as mensagens; a versão desabilitada é uma cópia.
+        encerrada = PomodoroView(cog=self.cog)
+        encerrada.end_button.disabled = True
+        encerrada.end_button.label = "Sessão Encerrada"
+
         try:
-            await interaction.response.edit_message(content="Esta sessão de Pomodoro foi encerrada pelo usuário.", embed=None, view=self)
+            await interaction.response.edit_message(content="Esta sessão de Pomodoro foi encerrada pelo usuário.", embed=None, view=encerrada)
         except discord.NotFound:
             await interaction.response.send_message("Sessão de Pomodoro encerrada.", ephemeral=True)
         except Exception as e:
             print(f"Erro ao editar mensagem no encerramento: {e}")
 
 class PomodoroCog(commands.Cog):
+    """Todas as sessões rodam em um único agendador; o estado fica salvo para sobreviver a reinícios."""
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.agendador = AgendadorTimers()
+        self.armazem = criar_armazem("pomodoro")
+
+    async def cog_load(self):
+        self.bot.add_view(PomodoroView(cog=self))
+        self.agendador.iniciar()
+        self.bot.loop.create_task(self.restaurar_sessoes())
+
+    async def cog_unload(self):
+        self.agendador.parar()
+
+    async def restaurar_sessoes(self):
+        """Retoma as sessões salvas de onde pararam, inclusive fases que venceram com o bot desligado."""
+        await self.bot.wait_until_ready()
+        for dados in (await self.armazem.carregar_todas()).values():
+            sessao = SessaoPomodoro(**dados)
+            if not self.bot.atende_servidor(sessao.guild_id):
+                # Com o bot em cluster, cada processo retoma só as sessões dos servidores dos seus shards.
+                continue
+            active_pomodoros[sessao.user_id] = sessao
+            self.agendar(sessao)
+        if active_pomodoros:
+            print(f"{len(active_pomodoros)} sessões de Pomodoro restauradas.")
+
+    def agendar(self, sessao: SessaoPomodoro):
+        # O prazo salvo é de relógio de parede; o agendador trabalha com o relógio monotônico.
+        prazo = time.monotonic() + (sessao.prazo - time.time())
+        self.agendador.agendar(sessao.user_id, prazo, lambda: self.avancar_fase(sessao.user_id))
+
+    async def encerrar_sessao(self, user_id):
+        self.agendador.cancelar(user_id)
+        active_pomodoros.pop(user_id, None)
+        await self.armazem.remover(user_id)
+
+    async def obter_canal(self, sessao: SessaoPomodoro):
+        return self.bot.get_channel(sessao.channel_id) or await self.bot.fetch_channel(sessao.channel_id)
+
+    def embed_foco(self, sessao: SessaoPomodoro):
+        embed = discord.Embed(
+            title="🍅 Sessão de Foco",
+            description=f"**Foco total por `{sessao.foco}` minutos!**\nSilencie as notificações e mergulhe nos estudos.",
+            color=discord.Color.red()
+        )
+        embed.set_footer(text=f"Ciclo {sessao.ciclo + 1} de {sessao.ciclos}")
+        return embed
+
+    def embed_pausa(self, sessao: SessaoPomodoro):
+        if sessao.pausa_longa_agora:
+            embed = discord.Embed(
+                title="🎉 Pausa Longa!",
+                description=f"Excelente! Você completou 4 ciclos. Agora, uma pausa merecida de `{sessao.duracao_pausa}` minutos.",
+                color=discord.Color.green()
+            )
+        else:
+            embed = discord.Embed(
+                title="☕ Pausa Curta",
+                description=f"Bom trabalho! Hora de uma pausa rápida de `{sessao.duracao_pausa}` minutos.",
+                color=discord.Color.blue()
+            )
+        embed.set_footer(text=f"Após o ciclo {sessao.ciclo + 1} de {sessao.ciclos}")
+        return embed
 
-    async def run_pomodoro_cycle(self, user: discord.User, message: discord.Message, foco: int, pausa_curta: int, pausa_longa: int, ciclos: int):
-        for i in range(ciclos):
-            try:
-                embed = discord.Embed(
-                    title="🍅 Sessão de Foco",
-                    description=f"**Foco total por `{foco}` minutos!**\nSilencie as notificações e mergulhe nos estudos.",
-                    color=discord.Color.red()
-                )
-                embed.set_footer(text=f"Ciclo {i + 1} de {ciclos}")
-                await message.edit(embed=embed)
-
-                await asyncio.sleep(foco * 60)
-
-                is_long_break = (i + 1) % 4 == 0 and i + 1 >= 4
-
-                if is_long_break:
-                    break_time = pausa_longa
-                    embed = discord.Embed(
-                        title="🎉 Pausa Longa!",
-                        description=f"Excelente! Você completou 4 ciclos. Agora, uma pausa merecida de `{break_time}` minutos.",
-                        color=discord.Color.green()
-                    )
-                else:
-                    break_time = pausa_curta
-                    embed = discord.Embed(
-                        title="☕ Pausa Curta",
-                        description=f"Bom trabalho! Hora de uma pausa rápida de `{break_time}` minutos.",
-                        color=discord.Color.blue()
-                    )
-                
-                embed.set_footer(text=f"Após o ciclo {i + 1} de {ciclos}")
-                await message.edit(embed=embed)
-                await message.channel.send(f"⏰ {user.mention}, sua pausa de `{break_time}` minutos começou!")
-
-                await asyncio.sleep(break_time * 60)
-
-                if i + 1 < ciclos:
-                    await message.channel.send(f"💪 {user.mention}, a pausa terminou! Preparando para o próximo ciclo de foco.")
-                    await asyncio.sleep(5)
-
-            except asyncio.CancelledError:
-                print(f"Sessão de Pomodoro para {user.name} foi cancelada.")
+    async def avancar_fase(self, user_id):
+        """Passa para a próxima fase. Cada prazo é contado a partir do anterior, então não há deriva."""
+        sessao = active_pomodoros.get(user_id)
+        if not sessao:
+            return
+        while True:
+            if sessao.fase == "foco":
+                sessao.fase = "pausa"
+                sessao.prazo += sessao.duracao_pausa * 60
+            elif sessao.ciclo + 1 < sessao.ciclos:
+                sessao.ciclo += 1
+                sessao.fase = "foco"
+                sessao.prazo += sessao.foco * 60
+            else:
+                await self.concluir_sessao(sessao)
+                return
+            # Após um reinício longo, pula direto para a fase atual sem anunciar as que já passaram.
+            if sessao.prazo > time.time():
                 break
-        
-        if active_pomodoros.get(user.id):
-            final_embed = discord.Embed(
-                title="🏁 Sessão de Pomodoro Concluída!",
-                description="Parabéns por completar todos os ciclos! Você mandou muito bem.",
-                color=discord.Color.gold()
-            )
-            try:
-                await message.edit(embed=final_embed, view=None)
-            except discord.NotFound:
-                pass
-        
-        if user.id in active_pomodoros:
-            del active_pomodoros[user.id]
+
+        await self.armazem.salvar(user_id, asdict(sessao))
+        self.agendar(sessao)
+
+        try:
+            canal = await self.obter_canal(sessao)
+            if sessao.fase == "pausa":
+                self.avisar(canal, f"⏰ <@{user_id}>, sua pausa de `{sessao.duracao_pausa}` minutos começou!")
+                await self.editar_painel(canal, sessao, embed=self.embed_pausa(sessao))
+            else:
+                self.avisar(canal, f"💪 <@{user_id}>, a pausa terminou! Preparando para o próximo ciclo de foco.")
+                await self.editar_painel(canal, sessao, embed=self.embed_foco(sessao))
+        except (discord.NotFound, discord.Forbidden):
+            # Canal ou mensagem apagados, ou o bot perdeu acesso: sem painel não há como seguir a sessão.
+            await self.encerrar_sessao(user_id)
+
+    def avisar(self, canal, texto: str):
+        """Avisos do mesmo canal que disparam no mesmo segundo saem juntos, numa mensagem só."""
+        self.bot.fila_envio.agrupar(f"canal:{canal.id}", texto, canal.send)
+
+    async def editar_painel(self, canal, sessao: SessaoPomodoro, **kwargs):
+        """Edita a mensagem da sessão pela fila de saída; uma edição mais nova substitui a que ainda não saiu."""
+        mensagem = canal.get_partial_message(sessao.message_id)
+        await self.bot.fila_envio.editar(f"canal:{canal.id}", sessao.message_id, lambda: mensagem.edit(**kwargs))
+
+    async def concluir_sessao(self, sessao: SessaoPomodoro):
+        await self.encerrar_sessao(sessao.user_id)
+        final_embed = discord.Embed(
+            title="🏁 Sessão de Pomodoro Concluída!",
+            description="Parabéns por completar todos os ciclos! Você mandou muito bem.",
+            color=discord.Color.gold()
+        )
+        try:
+            canal = await self.obter_canal(sessao)
+            await self.editar_painel(canal, sessao, embed=final_embed, view=None)
+        except (discord.NotFound, discord.Forbidden):
+            pass
 
     @app_commands.command(name="pomodoro", description="Inicia uma sessão de estudo com a técnica Pomodoro.")
     @app_commands.describe(
@@ -107,15 +200,25 @@ class PomodoroCog(commands.Cog):
             await interaction.response.send_message("Você já tem uma sessão de Pomodoro ativa! Encerre-a antes de iniciar uma nova.", ephemeral=True)
             return
 
-        await interaction.response.defer(ephemeral=True)
-        
-        view = PomodoroView(author_id=user_id)
-        
-        initial_embed = discord.Embed(title="🍅 Preparando seu Pomodoro...", color=discord.Color.orange())
-        message = await interaction.followup.send(embed=initial_embed, view=view, wait=True)
+        view = PomodoroView(cog=self)
+        sessao = SessaoPomodoro(
+            user_id=user_id, channel_id=interaction.channel_id, message_id=0, guild_id=interaction.guild_id,
+            foco=foco, pausa_curta=pausa_curta, pausa_longa=pausa_longa, ciclos=ciclos,
+            prazo=time.time() + foco * 60,
+        )
+        # Registrada antes do envio para que um segundo /pomodoro simultâneo já a veja; se o envio falhar, sai de novo.
+        active_pomodoros[user_id] = sessao
 
-        task = self.bot.loop.create_task(self.run_pomodoro_cycle(interaction.user, message, foco, pausa_curta, pausa_longa, ciclos))
-        active_pomodoros[user_id] = task
+        # Mensagem pública (não efêmera) para continuar editável pelo bot após o token da interação expirar ou um reinício.
+        try:
+            await interaction.response.send_message(embed=self.embed_foco(sessao), view=view)
+            message = await interaction.original_response()
+        except discord.HTTPException:
+            active_pomodoros.pop(user_id, None)
+            raise
+        sessao.message_id = message.id
+        await self.armazem.salvar(user_id, asdict(sessao))
+        self.agendar(sessao)
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(PomodoroCog(bot))
\ No newline at end of file
+    await bot.add_cog(PomodoroCog(bot))
@@ -1,22 +1,106 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import google.generativeai as genai
-import demjson3 as demjson
-import re
-from config import GEMINI_API_KEY
+import os
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from utils.banco_questoes import LETRAS, BancoQuestoes, Questao, questao_valida
+from utils.embeds import LIMITE_DESCRICAO, LIMITE_TITULO, paginar, truncar
+from utils.decodificacao import SCHEMA_QUESTOES, config_json
+from utils.executores import MENSAGEM_OCUPADO, PoolOcupado
+from utils.gemini_gateway import GeminiIndisponivel
+from utils.json_stream import ParserArrayJSON
+from utils.lotes import gerar_em_lotes, gerar_itens, variacao_prompt
+from utils.metricas import registrar_evento
+from utils.paineis import avisar_expiracao, painel_botoes
+from utils.roteamento import POLITICAS
+from utils.sessoes import ExpiracaoSessoes, criar_armazem
+from utils.texto import normalizar_chave
 
-genai.configure(api_key=GEMINI_API_KEY)
 active_simulados = {}
+POOL_MINIMO = 30
+MENSAGEM_IA_INDISPONIVEL = "A IA está sobrecarregada ou fora do ar no momento. Tente novamente em alguns minutos."
+STREAMING = os.getenv("SIMULADO_STREAMING", "true").lower() in ("1", "true", "sim")
+# Mesmo valor do antigo timeout da SimuladoView: sem cliques por esse tempo, a sessão é descartada.
+TTL_OCIOSO = float(os.getenv("SIMULADO_TTL_OCIOSO", "300"))
+
+class FluxoQuestoes:
+    """Lista de questões que pode ainda estar sendo gerada; quem lê aguarda o próximo item chegar."""
+
+    def __init__(self, total):
+        self.total = total
+        self.itens = []
+        self.concluido = False
+        self.tarefa = None
+        self.erro = None
+        self._novidade = asyncio.Event()
+
+    def adicionar(self, questao):
+        self.itens.append(questao)
+        self._novidade.set()
+
+    def finalizar(self):
+        self.concluido = True
+        # A geração pode entregar menos que o pedido (lotes que falharam): o simulado fica com o que chegou.
+        self.total = min(self.total, len(self.itens))
+        self._novidade.set()
+
+    def disponivel(self, indice):
+        return indice < len(self.itens) or self.concluido
+
+    async def obter(self, indice):
+        """Devolve a questão `indice`, esperando por ela se preciso, ou None se a geração acabou antes."""
+        while not self.disponivel(indice):
+            self._novidade.clear()
+            await self._novidade.wait()
+        return self.itens[indice] if indice < len(self.itens) else None
+
+@dataclass(slots=True)
+class SessaoSimulado:
+    tema: str
+    fluxo: FluxoQuestoes
+    questoes: list
+    message_id: int = 0
+    respostas: str = ""
+    aguardando_questao: bool = False
+    # Última interação do usuário, para desabilitar os botões quando a sessão expira. Não é salva.
+    interacao: discord.Interaction = None
+
+    @property
+    def questao_atual(self) -> int:
+        return len(self.respostas)
+
+    def para_dict(self) -> dict:
+        return {
+            "questoes": [q.para_dict() for q in self.questoes], "total": self.fluxo.total,
+            "respostas_usuario": self.respostas, "tema": self.tema, "message_id": self.message_id,
+        }
+
+    @classmethod
+    def de_dict(cls, dados: dict) -> "SessaoSimulado":
+        questoes = [Questao.de_dict(q) for q in dados["questoes"]]
+        fluxo = FluxoQuestoes(min(dados["total"], len(questoes)))
+        for q in questoes:
+            fluxo.adicionar(q)
+        fluxo.finalizar()
+        return cls(
+            tema=dados["tema"], fluxo=fluxo, questoes=fluxo.itens,
+            message_id=dados["message_id"], respostas="".join(dados["respostas_usuario"]),
+        )
 
 class ResultadosPaginadosView(discord.ui.View):
-    def __init__(self, author_id, state):
+    def __init__(self, author_id, state: SessaoSimulado):
         super().__init__(timeout=300.0)
         self.author_id = author_id
         self.state = state
+        self.score = sum(1 for q, r in zip(state.questoes, state.respostas) if q.resposta == r)
         self.current_page = 0
-        self.total_pages = len(state['questoes'])
+        self.total_pages = len(state.questoes)
         self.message = None
+        # Todas as páginas são montadas (e ajustadas aos limites do Discord) uma vez só; cada clique só reenvia.
+        self.paginas = [self.create_page_embed(i) for i in range(self.total_pages)]
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         if interaction.user.id != self.author_id:
@@ -37,123 +121,224 @@ class ResultadosPaginadosView(discord.ui.View):
         self.children[0].disabled = self.current_page == 0
         self.children[1].disabled = self.current_page == self.total_pages - 1
 
-    def create_page_embed(self):
-        q = self.state['questoes'][self.current_page]
-        score = self.state['score']
+    def create_page_embed(self, pagina):
+        q = self.state.questoes[pagina]
+        score = self.score
         
-        resposta_correta_letra = q['resposta']
-        resposta_dada_letra = self.state['respostas_usuario'][self.current_page]
+        resposta_correta_letra = q.resposta
+        resposta_dada_letra = self.state.respostas[pagina]
 
-        texto_resposta_dada = q['opcoes'].get(resposta_dada_letra, "N/A")
-        texto_resposta_correta = q['opcoes'].get(resposta_correta_letra)
+        texto_resposta_dada = q.opcao(resposta_dada_letra)
+        texto_resposta_correta = q.opcao(resposta_correta_letra)
 
         if resposta_dada_letra == resposta_correta_letra:
             cor_embed = discord.Color.green()
             resultado_texto = (
                 f"✅ **Sua resposta:**\n> {resposta_dada_letra}) {texto_resposta_dada}\n\n"
                 f"**Resultado:** Correto!\n\n"
-                f"**Fonte:**\n> *{q.get('fonte', 'Fonte não informada pela IA.')}*"
+                f"**Fonte:**\n> *{q.fonte or 'Fonte não informada pela IA.'}*"
             )
         else:
             cor_embed = discord.Color.red()
             resultado_texto = (
                 f"❌ **Sua resposta:**\n> {resposta_dada_letra}) {texto_resposta_dada}\n\n"
                 f"✔️ **Resposta correta:**\n> {resposta_correta_letra}) {texto_resposta_correta}\n\n"
-                f"💡 **Justificativa:**\n> *{q.get('justificativa', 'Justificativa não fornecida.')}*\n\n"
-                f"📚 **Para revisar:**\n> *{q.get('topico_para_revisao', 'Tópico de revisão não informado.')}*"
+                f"💡 **Justificativa:**\n> *{q.justificativa or 'Justificativa não fornecida.'}*\n\n"
+                f"📚 **Para revisar:**\n> *{q.topico_para_revisao or 'Tópico de revisão não informado.'}*"
             )
 
-        embed = discord.Embed(
-            title=f"Questão {self.current_page + 1}: {q['materia']}",
-            description=f"**Enunciado:**\n> {q['pergunta']}\n\n{resultado_texto}",
-            color=cor_embed
+        return paginar(
+            titulo=f"Questão {pagina + 1}: {q.materia}",
+            texto=f"**Enunciado:**\n> {q.pergunta}\n\n{resultado_texto}",
+            cor=cor_embed,
+            rodape=f"Questão {pagina + 1}/{self.total_pages}  |  Pontuação Final: {score}/{self.total_pages}",
         )
-        embed.set_footer(text=f"Questão {self.current_page + 1}/{self.total_pages}  |  Pontuação Final: {score}/{self.total_pages}")
-        return embed
 
     @discord.ui.button(label="<< Anterior", style=discord.ButtonStyle.grey)
     async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.current_page -= 1
         self.update_buttons()
-        embed = self.create_page_embed()
-        await interaction.response.edit_message(embed=embed, view=self)
+        await interaction.response.edit_message(embeds=self.paginas[self.current_page], view=self)
 
     @discord.ui.button(label="Próxima >>", style=discord.ButtonStyle.grey)
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.current_page += 1
         self.update_buttons()
-        embed = self.create_page_embed()
-        await interaction.response.edit_message(embed=embed, view=self)
+        await interaction.response.edit_message(embeds=self.paginas[self.current_page], view=self)
 
     @discord.ui.button(label="❌ Fechar", style=discord.ButtonStyle.danger)
     async def close_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         for item in self.children:
             item.disabled = True
         self.stop()
-        await interaction.response.edit_message(content="Gabarito interativo fechado.", embed=None, view=self)
+        await interaction.response.edit_message(content="Gabarito interativo fechado.", embeds=[], view=self)
+
+def botoes_alternativas(desabilitados: bool = False) -> list:
+    """Layout dos botões de resposta; os cliques são tratados pela SimuladoView registrada no início."""
+    return [
+        discord.ui.Button(label=letra, style=discord.ButtonStyle.secondary, custom_id=f"simulado:{letra}", disabled=desabilitados)
+        for letra in LETRAS
+    ]
+
+def embed_questao(question_data: Questao, current_index, total_questions):
+    opcoes_texto = "\n".join([f"**{letra})** {texto}" for letra, texto in zip(LETRAS, question_data.opcoes)])
+    embed = discord.Embed(
+        title=truncar(f"Questão {current_index + 1}/{total_questions} | {question_data.materia}", LIMITE_TITULO),
+        description=truncar(f"**{question_data.pergunta}**\n\n{opcoes_texto}", LIMITE_DESCRICAO),
+        color=discord.Color.purple(),
+    )
+    embed.set_footer(text=f"Eixo: {question_data.eixo}")
+    return embed
 
 class SimuladoView(discord.ui.View):
-    def __init__(self, author_id, on_finish_callback):
-        super().__init__(timeout=300.0)
-        self.author_id = author_id
-        self.on_finish_callback = on_finish_callback
+    """View persistente, registrada uma vez no carregamento do cog: os botões são roteados pelo custom_id e o
+    estado vem do armazenamento de sessões pelo usuário do clique, então ela continua funcionando depois de um
+    reinício do bot, sem nova chamada à IA. As mensagens levam só o layout dos botões (`painel_botoes`)."""
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.author_id:
-            await interaction.response.send_message("Este simulado não é seu!", ephemeral=True)
+        simulado_state = await self.cog.obter_estado(interaction.user.id)
+        if not simulado_state or simulado_state.message_id != interaction.message.id:
+            await interaction.response.edit_message(content="Este simulado parece ter expirado ou foi encerrado.", embed=None, view=None)
             return False
         return True
     
-    def disable_all_buttons(self):
-        for item in self.children:
-            if isinstance(item, discord.ui.Button):
-                item.disabled = True
-
-    @discord.ui.button(label="A", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="A", style=discord.ButtonStyle.secondary, custom_id="simulado:A")
     async def button_a(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.process_answer(interaction, "A")
-    @discord.ui.button(label="B", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="B", style=discord.ButtonStyle.secondary, custom_id="simulado:B")
     async def button_b(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.process_answer(interaction, "B")
-    @discord.ui.button(label="C", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="C", style=discord.ButtonStyle.secondary, custom_id="simulado:C")
     async def button_c(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.process_answer(interaction, "C")
-    @discord.ui.button(label="D", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="D", style=discord.ButtonStyle.secondary, custom_id="simulado:D")
     async def button_d(self, interaction: discord.Interaction, button: discord.ui.Button):
         await self.process_answer(interaction, "D")
 
     async def process_answer(self, interaction: discord.Interaction, answer: str):
         user_id = interaction.user.id
-        simulado_state = active_simulados.get(user_id)
-        if not simulado_state:
-            await interaction.response.edit_message(content="Este simulado parece ter expirado ou foi encerrado.", view=None)
+        simulado_state = await self.cog.obter_estado(user_id)
+        simulado_state.interacao = interaction
+        self.cog.expiracao.tocar(user_id)
+        if simulado_state.aguardando_questao:
+            await interaction.response.defer()
             return
 
-        simulado_state["respostas_usuario"].append(answer)
-        simulado_state["questao_atual"] += 1
+        simulado_state.respostas += answer
+
+        fluxo = simulado_state.fluxo
+        indice = simulado_state.questao_atual
+        next_question = None
+        if indice < fluxo.total:
+            if not fluxo.disponivel(indice):
+                # O usuário alcançou a geração: segura a interação enquanto a próxima questão chega.
+                await interaction.response.defer()
+            simulado_state.aguardando_questao = True
+            try:
+                next_question = await fluxo.obter(indice)
+            finally:
+                simulado_state.aguardando_questao = False
+
+        if next_question:
+            await self.cog.salvar_estado(user_id)
+            embed = embed_questao(next_question, indice, fluxo.total)
+            await self.editar_mensagem(interaction, embed=embed, view=painel_botoes(botoes_alternativas()))
+        else:
+            await self.editar_mensagem(
+                interaction, content="🎉 **Simulado Finalizado!**\nGerando seu gabarito interativo...", embed=None,
+                view=painel_botoes(botoes_alternativas(desabilitados=True)),
+            )
+            await self.cog.show_final_results_paginated(interaction)
 
-        if simulado_state["questao_atual"] < len(simulado_state["questoes"]):
-            next_question = simulado_state["questoes"][simulado_state["questao_atual"]]
-            embed = self.create_question_embed(next_question, simulado_state["questao_atual"], len(simulado_state["questoes"]))
-            await interaction.response.edit_message(embed=embed, view=self)
+    async def editar_mensagem(self, interaction: discord.Interaction, **kwargs):
+        if interaction.response.is_done():
+            # Já respondida (defer): a edição vai pelo webhook da interação, que tem limite próprio no Discord.
+            await self.cog.bot.fila_envio.editar(
+                f"interacao:{interaction.id}", interaction.message.id, lambda: interaction.edit_original_response(**kwargs)
+            )
         else:
-            self.disable_all_buttons()
-            await interaction.response.edit_message(content="🎉 **Simulado Finalizado!**\nGerando seu gabarito interativo...", embed=None, view=self)
-            await self.on_finish_callback(interaction)
-    
-    def create_question_embed(self, question_data, current_index, total_questions):
-        opcoes_texto = "\n".join([f"**{letra})** {texto}" for letra, texto in question_data['opcoes'].items()])
-        embed = discord.Embed(title=f"Questão {current_index + 1}/{total_questions} | {question_data['materia']}", description=f"**{question_data['pergunta']}**\n\n{opcoes_texto}", color=discord.Color.purple())
-        embed.set_footer(text=f"Eixo: {question_data['eixo']}")
-        return embed
+            await interaction.response.edit_message(**kwargs)
 
 class SimuladoAICog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        self.politica = POLITICAS["simulado"]
+        self.banco = BancoQuestoes()
+        self.sessoes = criar_armazem("simulado")
+        self.expiracao = ExpiracaoSessoes("simulado", active_simulados, self.sessoes, TTL_OCIOSO, self.simulado_expirado)
+
+    async def cog_load(self):
+        self.bot.add_view(SimuladoView(self))
+        self.expiracao.iniciar()
+        self.bot.loop.create_task(self.indexar_banco())
+
+    async def cog_unload(self):
+        self.expiracao.parar()
+
+    async def obter_estado(self, user_id):
+        """Estado do simulado em andamento; após um reinício é reconstruído a partir do armazenamento."""
+        estado = active_simulados.get(user_id)
+        if estado is None:
+            dados = await self.sessoes.obter(user_id)
+            if dados is None:
+                return None
+            estado = SessaoSimulado.de_dict(dados)
+            active_simulados[user_id] = estado
+            self.expiracao.tocar(user_id)
+        return estado
+
+    async def salvar_estado(self, user_id):
+        await self.sessoes.salvar(user_id, active_simulados[user_id].para_dict())
+
+    async def simulado_expirado(self, user_id, estado: SessaoSimulado):
+        await avisar_expiracao(
+            self.bot, estado.interacao, estado.message_id,
+            "⌛ Este simulado expirou por inatividade. Use `/simulado` para começar outro.", embed=None,
+        )
+
+    async def indexar_banco(self):
+        indexadas = await self.banco.indexar_pendentes()
+        if indexadas:
+            print(f"{indexadas} questões antigas adicionadas ao índice de quase duplicatas.")
+
+    async def pre_gerar(self, tema):
+        """Completa o banco do tema em segundo plano. Retorna True se chamou a Gemini."""
+        if await self.banco.contar(tema) >= POOL_MINIMO:
+            return False
+        geradas = await self.generate_questions_with_gemini(tema, 10)
+        await self.banco.adicionar(tema, [q for q in geradas or [] if questao_valida(q)])
+        return True
+
+    async def obter_questoes(self, tema, num_questoes, user_id):
+        """Serve questões inéditas do banco local e só chama a Gemini quando o banco não tem o suficiente."""
+        questoes = await self.banco.sortear(tema, user_id, num_questoes)
+        if len(questoes) < num_questoes:
+            geradas = await self.generate_questions_with_gemini(tema, num_questoes - len(questoes))
+            validas = [q for q in geradas or [] if questao_valida(q)]
+            if validas:
+                salvas = await self.banco.adicionar(tema, validas)
+                # A IA costuma repetir questões (ou quase): o banco devolve o id da original, que pode já ter sido vista.
+                ids_servidos = {q.id for q in questoes} | await self.banco.ja_vistas(user_id, [q.id for q in salvas])
+                questoes += [q for q in salvas if q.id not in ids_servidos]
+        questoes = questoes[:num_questoes]
+        if questoes:
+            await self.banco.marcar_vistas(user_id, [q.id for q in questoes])
+        return questoes
 
     async def generate_questions_with_gemini(self, tema, num_questoes):
-        prompt = f"""
+        chave = f"simulado:{self.politica.primario}:{normalizar_chave(tema)}:{num_questoes}"
+        return await self.bot.coalescedor.executar(chave, lambda: self._gerar_questoes(tema, num_questoes))
+
+    def montar_prompt(self, tema, num_questoes, parte=0, partes=1, evitar=()):
+        variacao = variacao_prompt(
+            parte, partes, evitar, "priorize aspectos do tema diferentes dos óbvios, variando matérias e subtópicos.",
+            "estas questões já criadas",
+        )
+        return f"""
         Aja como um especialista na criação de questões para o Concurso Nacional Unificado (CNU) do Brasil. Crie {num_questoes} questões de múltipla escolha (A, B, C, D) sobre o seguinte tema: "{tema}".
         As questões devem ser desafiadoras e no estilo de bancas como Cesgranrio.
 
@@ -161,7 +346,7 @@ class SimuladoAICog(commands.Cog):
         - "justificativa": Explicação concisa do porquê a alternativa correta é a certa.
         - "fonte": A base legal ou teórica para a questão (ex: "Art. 37 da Constituição Federal de 1988").
         - "topico_para_revisao": Um tópico de estudo específico para o usuário que errar a questão (ex: "Princípios Expressos da Administração Pública").
-
+        {variacao}
         Retorne a resposta estritamente no seguinte formato JSON, dentro de um bloco de código JSON.
         
         Exemplo de formato:
@@ -175,68 +360,134 @@ class SimuladoAICog(commands.Cog):
         ]
         ```
         """
-        raw_text = ""
+
+    async def _gerar_questoes(self, tema, num_questoes):
+        """Questões válidas e sem perguntas repetidas, geradas em lotes paralelos; pode devolver menos que o pedido."""
+        return await gerar_itens(
+            self.bot.roteador, "simulado", lambda n, parte, partes, evitar: self.montar_prompt(tema, n, parte, partes, evitar),
+            num_questoes, questao_valida, "pergunta", config_json(SCHEMA_QUESTOES),
+        )
+
+    async def iniciar_fluxo_questoes(self, tema, num_questoes, user_id):
+        """Começa pelas questões inéditas do banco e completa o restante com a Gemini em stream, em segundo plano."""
+        fluxo = FluxoQuestoes(num_questoes)
+        for q in await self.banco.sortear(tema, user_id, num_questoes):
+            fluxo.adicionar(q)
+        if len(fluxo.itens) >= num_questoes:
+            fluxo.finalizar()
+            await self.banco.marcar_vistas(user_id, [q.id for q in fluxo.itens])
+        else:
+            fluxo.tarefa = asyncio.create_task(self._completar_fluxo(fluxo, tema, num_questoes, user_id))
+        return fluxo
+
+    async def _completar_fluxo(self, fluxo, tema, num_questoes, user_id):
+        chave = f"simulado-stream:{self.politica.primario}:{normalizar_chave(tema)}:{num_questoes}"
+        gerado = self.bot.coalescedor.compartilhar(chave, lambda: self._abrir_stream_gemini(tema, num_questoes))
+        ids_servidos = {q.id for q in fluxo.itens}
+        indice = 0
         try:
-            response = await self.model.generate_content_async(prompt)
-            raw_text = response.text
-
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```|(\[[\s\S]*\])', raw_text)
-            
-            if not json_match:
-                print("ERRO: Nenhum bloco JSON válido foi encontrado na resposta da IA.")
-                print("--- Resposta Recebida ---\n", raw_text, "\n-------------------------")
-                return None
+            while len(fluxo.itens) < num_questoes:
+                q = await gerado.obter(indice)
+                if q is None:
+                    break
+                indice += 1
+                if q.id not in ids_servidos and not await self.banco.ja_vistas(user_id, [q.id]):
+                    ids_servidos.add(q.id)
+                    fluxo.adicionar(q)
+        finally:
+            fluxo.erro = gerado.erro
+            fluxo.finalizar()
+        await self.banco.marcar_vistas(user_id, list(ids_servidos))
 
-            cleaned_response = next((group for group in json_match.groups() if group is not None), None)
+    def _abrir_stream_gemini(self, tema, num_questoes):
+        gerado = FluxoQuestoes(num_questoes)
+        gerado.tarefa = asyncio.create_task(self._consumir_stream_gemini(gerado, tema, num_questoes))
+        return gerado
 
-            if not cleaned_response:
-                print("ERRO: Bloco JSON encontrado, mas estava vazio.")
-                return None
-            questions = demjson.decode(cleaned_response)
-            return questions
-        except demjson.JSONDecodeError as e:
-            print(f"Erro ao parsear o JSON (demjson) da Gemini: {e}")
-            print("--- Resposta que causou o erro ---\n", raw_text, "\n---------------------------------")
-            return None
+    async def _consumir_stream_gemini(self, gerado, tema, num_questoes):
+        """Vários streams menores em paralelo alimentam o mesmo fluxo; o que faltar no fim é pedido de novo."""
+        ids = set()
+
+        async def gerar_lote(n, parte, partes):
+            parser = ParserArrayJSON()
+            # Stream não tem hedge (metade de um stream não se troca pela do outro modelo): só a escolha do modelo.
+            modelo = self.bot.roteador.escolher("simulado", n).modelo
+            inicio = time.perf_counter()
+            prompt = self.montar_prompt(tema, n, parte, partes, evitar=[q.pergunta for q in gerado.itens])
+            async for texto in self.bot.gemini.gerar_stream(modelo, prompt, generation_config=config_json(SCHEMA_QUESTOES)):
+                novas = [q for q in parser.alimentar(texto) if questao_valida(q)]
+                if novas:
+                    # O banco devolve a questão original para as quase duplicatas: o id repetido fica de fora.
+                    for q in await self.banco.adicionar(tema, novas):
+                        if q.id not in ids and len(gerado.itens) < num_questoes:
+                            ids.add(q.id)
+                            gerado.adicionar(q)
+            self.bot.roteador.latencias.registrar(modelo, time.perf_counter() - inicio, n)
+
+        try:
+            await gerar_em_lotes(gerar_lote, num_questoes, lambda: len(gerado.itens))
         except Exception as e:
-            print(f"Um erro inesperado ocorreu: {type(e).__name__} - {e}")
-            return None
+            gerado.erro = e
+            registrar_evento("simulado_stream_falhou", nivel=logging.ERROR, erro=type(e).__name__, detalhe=str(e))
+        finally:
+            gerado.finalizar()
 
     async def show_final_results_paginated(self, interaction: discord.Interaction):
         user_id = interaction.user.id
-        state = active_simulados.pop(user_id, None)
+        state = await self.obter_estado(user_id)
+        active_simulados.pop(user_id, None)
+        self.expiracao.cancelar(user_id)
+        await self.sessoes.remover(user_id)
         if not state:
             await interaction.followup.send("Não foi possível encontrar os dados do seu simulado.", ephemeral=True)
             return
-        score = 0
-        for i, q in enumerate(state['questoes']):
-            if i < len(state['respostas_usuario']) and state['respostas_usuario'][i] == q['resposta']:
-                score += 1
-        state['score'] = score
+        state.questoes = state.questoes[:len(state.respostas)]
         view = ResultadosPaginadosView(author_id=user_id, state=state)
         view.update_buttons()
-        embed = view.create_page_embed()
-        message = await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        message = await interaction.followup.send(embeds=view.paginas[0], view=view, ephemeral=True)
         view.message = message
     @app_commands.command(name="simulado", description="Inicia um simulado gerado por IA sobre um tema do CNU.")
     @app_commands.describe(tema="O tema para o simulado.", quantidade="O número de questões (entre 3 e 10).")
     async def simulado(self, interaction: discord.Interaction, tema: str, quantidade: int):
         user_id = interaction.user.id
-        if user_id in active_simulados:
+        if await self.obter_estado(user_id):
             await interaction.response.send_message("Você já tem um simulado em andamento!", ephemeral=True)
             return
         if not (3 <= quantidade <= 10):
             await interaction.response.send_message("Por favor, escolha uma quantidade de questões entre 3 e 10.", ephemeral=True)
             return
+        self.bot.pre_geracao.registrar("simulado", tema)
         await interaction.response.defer(ephemeral=True)
-        questoes = await self.generate_questions_with_gemini(tema, quantidade)
-        if not questoes or len(questoes) != quantidade:
+        try:
+            if STREAMING:
+                fluxo = await self.iniciar_fluxo_questoes(tema, quantidade, user_id)
+            else:
+                fluxo = FluxoQuestoes(quantidade)
+                for q in await self.obter_questoes(tema, quantidade, user_id):
+                    fluxo.adicionar(q)
+                fluxo.finalizar()
+            primeira_questao = await fluxo.obter(0)
+        except GeminiIndisponivel:
+            await interaction.followup.send(MENSAGEM_IA_INDISPONIVEL, ephemeral=True)
+            return
+        except PoolOcupado:
+            await interaction.followup.send(MENSAGEM_OCUPADO, ephemeral=True)
+            return
+        if not primeira_questao:
+            if isinstance(fluxo.erro, GeminiIndisponivel):
+                await interaction.followup.send(MENSAGEM_IA_INDISPONIVEL, ephemeral=True)
+                return
             await interaction.followup.send("Desculpe, não consegui gerar as questões no momento. Verifique o console para mais detalhes.", ephemeral=True)
             return
-        active_simulados[user_id] = {"questoes": questoes, "respostas_usuario": [], "questao_atual": 0, "tema": tema}
-        view = SimuladoView(author_id=user_id, on_finish_callback=self.show_final_results_paginated)
-        primeira_questao = active_simulados[user_id]["questoes"][0]
-        embed = view.create_question_embed(primeira_questao, 0, quantidade)
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        embed = embed_questao(primeira_questao, 0, fluxo.total)
+        aviso = None
+        if fluxo.concluido and fluxo.total < quantidade:
+            aviso = f"Consegui gerar {fluxo.total} das {quantidade} questões pedidas; o simulado seguirá com elas."
+        message = await interaction.followup.send(content=aviso, embed=embed, view=painel_botoes(botoes_alternativas()), ephemeral=True, wait=True)
+        active_simulados[user_id] = SessaoSimulado(
+            tema=tema, fluxo=fluxo, questoes=fluxo.itens, message_id=message.id, interacao=interaction,
+        )
+        self.expiracao.tocar(user_id)
+        await self.salvar_estado(user_id)
 async def setup(bot: commands.Bot):
     await bot.add_cog(SimuladoAICog(bot))
\ No newline at end of file
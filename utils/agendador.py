@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from utils.metricas import registrar_evento
+
+
+class AgendadorTimers:
+    """Dispara callbacks em prazos monotônicos usando uma única task e um min-heap de deadlines.
+
+    Reagendar ou cancelar uma chave é O(log n): a entrada antiga fica no heap
+    e é descartada quando chega ao topo.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.ativos = {}
+        self.sequencia = itertools.count()
+        self.acordar = asyncio.Event()
+        self.task = None
+        self.em_execucao = set()
+
+    def agendar(self, chave, prazo: float, callback):
+        """Agenda `callback()` (uma função que devolve uma corrotina) para o instante `prazo` de time.monotonic()."""
+        seq = next(self.sequencia)
+        self.ativos[chave] = (seq, callback)
+        heapq.heappush(self.heap, (prazo, seq, chave))
+        if self.heap[0][1] == seq:
+            self.acordar.set()
+
+    def cancelar(self, chave):
+        self.ativos.pop(chave, None)
+
+    def __len__(self):
+        return len(self.ativos)
+
+    def iniciar(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._executar())
+
+    def parar(self):
+        if self.task:
+            self.task.cancel()
+
+    def _topo_valido(self):
+        while self.heap:
+            _, seq, chave = self.heap[0]
+            ativo = self.ativos.get(chave)
+            if ativo is not None and ativo[0] == seq:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    async def _executar(self):
+        while True:
+            self.acordar.clear()
+            topo = self._topo_valido()
+            if topo is None:
+                await self.acordar.wait()
+                continue
+            espera = topo[0] - time.monotonic()
+            if espera > 0:
+                try:
+                    await asyncio.wait_for(self.acordar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, chave = heapq.heappop(self.heap)
+            _, callback = self.ativos.pop(chave)
+            task = asyncio.create_task(self._disparar(chave, callback))
+            self.em_execucao.add(task)
+            task.add_done_callback(self.em_execucao.discard)
+
+    async def _disparar(self, chave, callback):
+        try:
+            await callback()
+        except Exception as e:
+            registrar_evento("timer_falhou", nivel=logging.ERROR, timer=str(chave), erro=type(e).__name__, detalhe=str(e))
@@ -0,0 +1,254 @@
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+from array import array
+
+from utils.quase_duplicatas import LIMIAR, assinatura, chaves_bandas, similaridade, texto_questao
+from utils.sqlite import abrir_sqlite, no_executor
+from utils.texto import hash_texto, normalizar_chave
+
+CAMINHO_BANCO = os.getenv("BANCO_QUESTOES_PATH", "data/banco_questoes.db")
+LETRAS = ("A", "B", "C", "D")
+CAMPOS_OBRIGATORIOS = ("eixo", "materia", "pergunta", "opcoes", "resposta")
+
+
+def questao_valida(q) -> bool:
+    """Confere se a questão gerada tem todos os campos que as views usam."""
+    if not isinstance(q, dict):
+        return False
+    if any(not q.get(campo) for campo in CAMPOS_OBRIGATORIOS):
+        return False
+    opcoes = q["opcoes"]
+    if not isinstance(opcoes, dict) or set(opcoes.keys()) != set(LETRAS):
+        return False
+    return q["resposta"] in LETRAS
+
+
+def hash_questao(q: dict) -> str:
+    opcoes = [normalizar_chave(str(q["opcoes"][letra])) for letra in LETRAS]
+    return hash_texto(normalizar_chave(q["pergunta"]), *opcoes)
+
+
+@dataclass(slots=True, frozen=True)
+class Questao:
+    """Questão já validada. Com __slots__ e as opções em tupla ocupa bem menos memória que o dict
+    gerado pela IA, e a mesma instância é compartilhada por todas as sessões que a servem."""
+
+    id: int
+    eixo: str
+    materia: str
+    pergunta: str
+    opcoes: tuple
+    resposta: str
+    justificativa: str = ""
+    fonte: str = ""
+    topico_para_revisao: str = ""
+
+    @classmethod
+    def de_dict(cls, dados: dict, questao_id: int = None) -> "Questao":
+        return cls(
+            id=dados.get("id", questao_id),
+            # Eixos e matérias se repetem muito entre questões: internar evita uma cópia por questão.
+            eixo=sys.intern(str(dados["eixo"])),
+            materia=sys.intern(str(dados["materia"])),
+            pergunta=str(dados["pergunta"]),
+            opcoes=tuple(str(dados["opcoes"][letra]) for letra in LETRAS),
+            resposta=sys.intern(dados["resposta"]),
+            justificativa=str(dados.get("justificativa") or ""),
+            fonte=str(dados.get("fonte") or ""),
+            topico_para_revisao=str(dados.get("topico_para_revisao") or ""),
+        )
+
+    def para_dict(self) -> dict:
+        return {
+            "id": self.id, "eixo": self.eixo, "materia": self.materia, "pergunta": self.pergunta,
+            "opcoes": dict(zip(LETRAS, self.opcoes)), "resposta": self.resposta,
+            "justificativa": self.justificativa, "fonte": self.fonte, "topico_para_revisao": self.topico_para_revisao,
+        }
+
+    def opcao(self, letra: str, padrao: str = "N/A") -> str:
+        return self.opcoes[LETRAS.index(letra)] if letra in LETRAS else padrao
+
+
+class BancoQuestoes:
+    """Banco local (SQLite) com todas as questões validadas, indexado por tema, eixo e matéria.
+
+    Além do hash exato, cada questão tem uma assinatura MinHash indexada por LSH (uma linha por banda), então
+    uma questão nova quase igual a uma já guardada é reconhecida como a mesma e recebe o id da existente.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_BANCO):
+        self.conn, self.lock = abrir_sqlite(caminho)
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS questoes (
+                    id INTEGER PRIMARY KEY,
+                    tema TEXT NOT NULL,
+                    eixo TEXT NOT NULL,
+                    materia TEXT NOT NULL,
+                    hash TEXT NOT NULL UNIQUE,
+                    dados TEXT NOT NULL,
+                    criada_em REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_questoes_tema ON questoes (tema, eixo, materia);
+                CREATE INDEX IF NOT EXISTS idx_questoes_materia ON questoes (eixo, materia);
+                CREATE TABLE IF NOT EXISTS questoes_vistas (
+                    user_id INTEGER NOT NULL,
+                    questao_id INTEGER NOT NULL,
+                    vista_em REAL NOT NULL,
+                    PRIMARY KEY (user_id, questao_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS questoes_assinaturas (
+                    questao_id INTEGER PRIMARY KEY,
+                    assinatura BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS questoes_lsh (
+                    banda INTEGER NOT NULL,
+                    chave INTEGER NOT NULL,
+                    questao_id INTEGER NOT NULL,
+                    PRIMARY KEY (banda, chave, questao_id)
+                ) WITHOUT ROWID;
+            """)
+
+    def _quase_duplicata(self, sig: array):
+        """(id, dados) da questão guardada mais parecida com a assinatura, se passar do LIMIAR."""
+        bandas = list(enumerate(chaves_bandas(sig)))
+        filtro = " OR ".join(["(banda = ? AND chave = ?)"] * len(bandas))
+        candidatos = self.conn.execute(
+            f"""
+            SELECT a.questao_id, a.assinatura FROM questoes_assinaturas a
+            WHERE a.questao_id IN (SELECT questao_id FROM questoes_lsh WHERE {filtro})
+            """,
+            [valor for par in bandas for valor in par],
+        ).fetchall()
+        melhor, melhor_sim = None, LIMIAR
+        for questao_id, blob in candidatos:
+            sim = similaridade(sig, array("I", blob))
+            if sim >= melhor_sim:
+                melhor, melhor_sim = questao_id, sim
+        if melhor is None:
+            return None
+        return self.conn.execute("SELECT id, dados FROM questoes WHERE id = ?", (melhor,)).fetchone()
+
+    def _indexar(self, questao_id: int, sig: array):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO questoes_assinaturas (questao_id, assinatura) VALUES (?, ?)", (questao_id, sig.tobytes())
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO questoes_lsh (banda, chave, questao_id) VALUES (?, ?, ?)",
+            [(banda, chave, questao_id) for banda, chave in enumerate(chaves_bandas(sig))],
+        )
+
+    def _indexar_pendentes(self, lote: int = 1000) -> int:
+        total = 0
+        while True:
+            with self.lock, self.conn:
+                linhas = self.conn.execute(
+                    """
+                    SELECT id, dados FROM questoes
+                    WHERE id NOT IN (SELECT questao_id FROM questoes_assinaturas) LIMIT ?
+                    """,
+                    (lote,),
+                ).fetchall()
+                for questao_id, dados in linhas:
+                    self._indexar(questao_id, assinatura(texto_questao(json.loads(dados))))
+            total += len(linhas)
+            if len(linhas) < lote:
+                return total
+
+    def _adicionar(self, tema: str, questoes: list) -> list:
+        tema_norm = normalizar_chave(tema)
+        agora = time.time()
+        salvas = []
+        ids = set()
+        with self.lock, self.conn:
+            for q in questoes:
+                if not questao_valida(q):
+                    continue
+                dados = {k: v for k, v in q.items() if k != "id"}
+                h = hash_questao(dados)
+                existente = self.conn.execute("SELECT id, dados FROM questoes WHERE hash = ?", (h,)).fetchone()
+                if existente is None:
+                    sig = assinatura(texto_questao(dados))
+                    existente = self._quase_duplicata(sig)
+                if existente is not None:
+                    questao_id, dados = existente[0], json.loads(existente[1])
+                else:
+                    cursor = self.conn.execute(
+                        "INSERT INTO questoes (tema, eixo, materia, hash, dados, criada_em) VALUES (?, ?, ?, ?, ?, ?)",
+                        (tema_norm, normalizar_chave(dados["eixo"]), normalizar_chave(dados["materia"]), h,
+                         json.dumps(dados, ensure_ascii=False), agora),
+                    )
+                    questao_id = cursor.lastrowid
+                    self._indexar(questao_id, sig)
+                # Repetições dentro do mesmo lote também caem aqui: a primeira já foi inserida e indexada.
+                if questao_id not in ids:
+                    ids.add(questao_id)
+                    salvas.append(Questao.de_dict(dados, questao_id))
+        return salvas
+
+    def _sortear(self, tema: str, user_id: int, quantidade: int, materia: str = None) -> list:
+        sql = """
+            SELECT id, dados FROM questoes
+            WHERE tema = ?
+              AND id NOT IN (SELECT questao_id FROM questoes_vistas WHERE user_id = ?)
+        """
+        params = [normalizar_chave(tema), user_id]
+        if materia:
+            sql += " AND materia = ?"
+            params.append(normalizar_chave(materia))
+        sql += " ORDER BY RANDOM() LIMIT ?"
+        params.append(quantidade)
+        with self.lock:
+            linhas = self.conn.execute(sql, params).fetchall()
+        return [Questao.de_dict(json.loads(dados), questao_id) for questao_id, dados in linhas]
+
+    def _marcar_vistas(self, user_id: int, questao_ids: list):
+        agora = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO questoes_vistas (user_id, questao_id, vista_em) VALUES (?, ?, ?)",
+                [(user_id, questao_id, agora) for questao_id in questao_ids],
+            )
+
+    def _ja_vistas(self, user_id: int, questao_ids: list) -> set:
+        if not questao_ids:
+            return set()
+        marcadores = ", ".join("?" * len(questao_ids))
+        with self.lock:
+            linhas = self.conn.execute(
+                f"SELECT questao_id FROM questoes_vistas WHERE user_id = ? AND questao_id IN ({marcadores})",
+                [user_id, *questao_ids],
+            ).fetchall()
+        return {questao_id for (questao_id,) in linhas}
+
+    def _contar(self, tema: str) -> int:
+        with self.lock:
+            (total,) = self.conn.execute("SELECT COUNT(*) FROM questoes WHERE tema = ?", (normalizar_chave(tema),)).fetchone()
+        return total
+
+    async def adicionar(self, tema: str, questoes: list) -> list:
+        """Salva as questões válidas e as devolve como `Questao`, com o id do banco."""
+        return await no_executor(self._adicionar, tema, questoes)
+
+    async def sortear(self, tema: str, user_id: int, quantidade: int, materia: str = None) -> list:
+        """Sorteia até `quantidade` questões do tema que o usuário ainda não viu."""
+        return await no_executor(self._sortear, tema, user_id, quantidade, materia)
+
+    async def marcar_vistas(self, user_id: int, questao_ids: list):
+        await no_executor(self._marcar_vistas, user_id, questao_ids)
+
+    async def ja_vistas(self, user_id: int, questao_ids: list) -> set:
+        """Quais destes ids o usuário já respondeu. Como as quase duplicatas recebem o id da questão original,
+        isso também pega as versões reescritas pela IA."""
+        return await no_executor(self._ja_vistas, user_id, questao_ids)
+
+    async def indexar_pendentes(self) -> int:
+        """Calcula as assinaturas das questões salvas antes do índice de quase duplicatas existir."""
+        return await no_executor(self._indexar_pendentes)
+
+    async def contar(self, tema: str) -> int:
+        return await no_executor(self._contar, tema)
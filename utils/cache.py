@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+from utils.sqlite import abrir_sqlite, no_executor
+
+CAMINHO_CACHE = os.getenv("CACHE_PATH", "data/cache.db")
+
+
+class CacheLRU:
+    """Cache em memória com descarte LRU e expiração opcional por TTL (em segundos)."""
+
+    def __init__(self, capacidade: int = 256, ttl: float = None):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.dados = OrderedDict()
+
+    def obter(self, chave, padrao=None):
+        item = self.dados.get(chave)
+        if item is None:
+            return padrao
+        valor, expira_em = item
+        if expira_em is not None and expira_em <= time.monotonic():
+            del self.dados[chave]
+            return padrao
+        self.dados.move_to_end(chave)
+        return valor
+
+    def definir(self, chave, valor):
+        expira_em = time.monotonic() + self.ttl if self.ttl else None
+        self.dados[chave] = (valor, expira_em)
+        self.dados.move_to_end(chave)
+        while len(self.dados) > self.capacidade:
+            self.dados.popitem(last=False)
+
+    def remover(self, chave):
+        self.dados.pop(chave, None)
+
+    def __contains__(self, chave):
+        return self.obter(chave) is not None
+
+    def __len__(self):
+        return len(self.dados)
+
+
+class CacheDuasCamadas:
+    """LRU em memória na frente de um armazenamento SQLite persistente, com TTL.
+
+    Invalidação por versão: quem usa inclui a versão do prompt/modelo na chave,
+    e as entradas antigas simplesmente expiram. Conta acertos por camada e falhas.
+    """
+
+    def __init__(self, namespace: str, capacidade: int = 256, ttl: float = 24 * 3600, caminho: str = CAMINHO_CACHE):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memoria = CacheLRU(capacidade=capacidade, ttl=ttl)
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+        self.conn, self.lock = abrir_sqlite(caminho)
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    expira_em REAL NOT NULL,
+                    PRIMARY KEY (namespace, chave)
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_expira_em ON cache (expira_em);
+            """)
+        self._limpar_expirados()
+
+    def _ler(self, chave: str):
+        with self.lock:
+            linha = self.conn.execute(
+                "SELECT valor, expira_em FROM cache WHERE namespace = ? AND chave = ? AND expira_em > ?",
+                (self.namespace, chave, time.time()),
+            ).fetchone()
+        return linha
+
+    def _gravar(self, chave: str, valor):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                (self.namespace, chave, json.dumps(valor, ensure_ascii=False), time.time() + self.ttl),
+            )
+
+    def _limpar_expirados(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache WHERE expira_em <= ?", (time.time(),))
+
+    async def obter(self, chave: str, contar: bool = True):
+        """Procura na memória e depois no disco; devolve None em caso de falha."""
+        valor = self.memoria.obter(chave)
+        if valor is not None:
+            if contar:
+                self.acertos_memoria += 1
+            return valor
+        linha = await no_executor(self._ler, chave)
+        if linha is None:
+            if contar:
+                self.falhas += 1
+            return None
+        if contar:
+            self.acertos_disco += 1
+        valor = json.loads(linha[0])
+        self.memoria.definir(chave, valor)
+        return valor
+
+    async def definir(self, chave: str, valor):
+        self.memoria.definir(chave, valor)
+        await no_executor(self._gravar, chave, valor)
+
+    def estatisticas(self) -> dict:
+        total = self.acertos_memoria + self.acertos_disco + self.falhas
+        return {
+            "acertos_memoria": self.acertos_memoria,
+            "acertos_disco": self.acertos_disco,
+            "falhas": self.falhas,
+            "taxa_acerto": (self.acertos_memoria + self.acertos_disco) / total if total else 0.0,
+        }
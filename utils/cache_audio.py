@@ -0,0 +1,162 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from utils.texto import hash_texto
+
+PASTA_CACHE = os.getenv("TTS_CACHE_DIR", "data/tts_cache")
+TAMANHO_MAXIMO = int(float(os.getenv("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024)
+# Segundos entre releituras da pasta, que os processos do cluster compartilham: entre uma e outra, cada
+# processo só conhece o que ele mesmo gravou.
+INTERVALO_VARREDURA = 30.0
+
+
+def chave_audio(ssml: str, voz: str, config_audio: str) -> str:
+    """Chave de conteúdo: o mesmo SSML com a mesma voz e configuração gera sempre o mesmo áudio."""
+    return hash_texto(ssml, voz, config_audio)
+
+
+class HandleAudio:
+    """Referência a um áudio do cache que não será descartado enquanto não for liberada."""
+
+    def __init__(self, cache, chave: str, caminho: str, dados: bytes = None):
+        self.cache = cache
+        self.chave = chave
+        self.caminho = caminho
+        self.dados = dados
+        self.liberado = False
+
+    def ler(self) -> bytes:
+        """Conteúdo do áudio em memória (lido do disco só na primeira vez)."""
+        if self.dados is None:
+            with open(self.caminho, "rb") as arquivo:
+                self.dados = arquivo.read()
+        return self.dados
+
+    def liberar(self):
+        if not self.liberado:
+            self.liberado = True
+            self.dados = None
+            self.cache._desafixar(self.chave)
+
+
+class CacheAudio:
+    """Cache em disco dos áudios sintetizados, endereçado por conteúdo e com descarte LRU por tamanho total.
+
+    É seguro entre threads: o `after` do player do discord roda fora do event loop. A pasta pode ser a mesma
+    para todos os processos do cluster: o limite vale para ela inteira, porque o índice é refeito a partir do
+    disco a cada `intervalo_varredura` segundos, e a ordem LRU é o mtime dos arquivos, que `obter` atualiza.
+    """
+
+    def __init__(self, pasta: str = PASTA_CACHE, tamanho_maximo: int = TAMANHO_MAXIMO, extensao: str = ".ogg",
+                 intervalo_varredura: float = INTERVALO_VARREDURA):
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.extensao = extensao
+        self.intervalo_varredura = intervalo_varredura
+        self.lock = threading.Lock()
+        self.entradas = OrderedDict()
+        self.fixados = {}
+        self.tamanho_total = 0
+        self.varrido_em = 0.0
+        os.makedirs(pasta, exist_ok=True)
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        """Refaz o índice com todos os áudios da pasta, inclusive os gravados por outros processos."""
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(self.extensao):
+                try:
+                    info = os.stat(os.path.join(self.pasta, nome))
+                except OSError:
+                    # Descartado por outro processo durante a leitura da pasta.
+                    continue
+                arquivos.append((info.st_mtime, nome[:-len(self.extensao)], info.st_size))
+        self.entradas = OrderedDict()
+        self.tamanho_total = 0
+        for _, chave, tamanho in sorted(arquivos):
+            self.entradas[chave] = tamanho
+            self.tamanho_total += tamanho
+        self.varrido_em = time.monotonic()
+
+    def _caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, chave + self.extensao)
+
+    def _fixar(self, chave: str) -> HandleAudio:
+        self.fixados[chave] = self.fixados.get(chave, 0) + 1
+        return HandleAudio(self, chave, self._caminho(chave))
+
+    def _desafixar(self, chave: str):
+        with self.lock:
+            restantes = self.fixados.get(chave, 1) - 1
+            if restantes > 0:
+                self.fixados[chave] = restantes
+            else:
+                self.fixados.pop(chave, None)
+            self._descartar_excedente()
+
+    def obter(self, chave: str):
+        """Devolve um HandleAudio já lido para a memória se o áudio estiver no cache, ou None.
+
+        Lê na hora porque outro processo pode descartar o arquivo a qualquer momento; o que já está em memória
+        continua tocando.
+        """
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as arquivo:
+                dados = arquivo.read()
+            os.utime(caminho)
+        except OSError:
+            with self.lock:
+                if chave in self.entradas:
+                    self.tamanho_total -= self.entradas.pop(chave)
+            return None
+        with self.lock:
+            if chave not in self.entradas:
+                # Gravado por outro processo depois da última leitura da pasta.
+                self.entradas[chave] = len(dados)
+                self.tamanho_total += len(dados)
+            self.entradas.move_to_end(chave)
+            handle = self._fixar(chave)
+        handle.dados = dados
+        return handle
+
+    def salvar(self, chave: str, dados: bytes) -> HandleAudio:
+        """Grava o áudio (de forma atômica) e devolve um HandleAudio já fixado."""
+        caminho = self._caminho(chave)
+        if not os.path.exists(caminho):
+            fd, temporario = tempfile.mkstemp(dir=self.pasta, suffix=".tmp")
+            with os.fdopen(fd, "wb") as arquivo:
+                arquivo.write(dados)
+            try:
+                os.replace(temporario, caminho)
+            except OSError:
+                # Outra requisição gravou o mesmo conteúdo e o arquivo está em uso (Windows).
+                os.remove(temporario)
+        with self.lock:
+            if time.monotonic() - self.varrido_em >= self.intervalo_varredura:
+                self._carregar_indice()
+            if chave not in self.entradas:
+                self.entradas[chave] = len(dados)
+                self.tamanho_total += len(dados)
+            self.entradas.move_to_end(chave)
+            handle = self._fixar(chave)
+            self._descartar_excedente()
+        handle.dados = dados
+        return handle
+
+    def _descartar_excedente(self):
+        # Só os fixados neste processo são poupados; os de outro processo já estão na memória dele.
+        for chave in list(self.entradas):
+            if self.tamanho_total <= self.tamanho_maximo:
+                break
+            if chave in self.fixados:
+                continue
+            self.tamanho_total -= self.entradas.pop(chave)
+            try:
+                os.remove(self._caminho(chave))
+            except OSError:
+                pass
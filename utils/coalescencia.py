@@ -0,0 +1,46 @@
+import asyncio
+
+
+class CoalescedorRequisicoes:
+    """Single-flight: pedidos simultâneos com a mesma chave aguardam uma única chamada e compartilham o resultado."""
+
+    def __init__(self):
+        self.em_andamento = {}
+        self.fluxos = {}
+        self.chamadas_feitas = 0
+        self.chamadas_economizadas = 0
+
+    async def executar(self, chave, fabrica):
+        """Executa `fabrica()` uma única vez por chave enquanto houver uma chamada em andamento."""
+        task = self.em_andamento.get(chave)
+        if task is not None:
+            self.chamadas_economizadas += 1
+        else:
+            self.chamadas_feitas += 1
+            task = asyncio.ensure_future(fabrica())
+            self.em_andamento[chave] = task
+            task.add_done_callback(lambda _: self.em_andamento.pop(chave, None))
+        # O shield evita que um usuário que desistiu cancele a chamada dos demais.
+        return await asyncio.shield(task)
+
+    def compartilhar(self, chave, fabrica):
+        """Versão para respostas em stream: devolve o fluxo já em produção para a chave ou cria um com `fabrica()`.
+
+        O objeto criado deve expor `tarefa`, a task que o produz; ele deixa de ser compartilhado quando ela termina.
+        """
+        fluxo = self.fluxos.get(chave)
+        if fluxo is not None:
+            self.chamadas_economizadas += 1
+            return fluxo
+        self.chamadas_feitas += 1
+        fluxo = fabrica()
+        self.fluxos[chave] = fluxo
+        fluxo.tarefa.add_done_callback(lambda _: self.fluxos.pop(chave, None))
+        return fluxo
+
+    def estatisticas(self) -> dict:
+        return {
+            "chamadas_feitas": self.chamadas_feitas,
+            "chamadas_economizadas": self.chamadas_economizadas,
+            "em_andamento": len(self.em_andamento) + len(self.fluxos),
+        }
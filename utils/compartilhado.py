@@ -0,0 +1,20 @@
+import os
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PREFIXO = "cnu:"
+
+_cliente = None
+
+
+def cliente_redis():
+    """Conexão (pool) única por processo com o Redis usado pelos backends compartilhados 'redis'."""
+    global _cliente
+    if _cliente is None:
+        # Importado no primeiro uso: quem não usa os backends 'redis' não paga o import.
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("O backend 'redis' precisa do pacote redis (pip install redis). Use 'sqlite' para rodar sem ele.") from None
+        _cliente = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _cliente
+
@@ -0,0 +1,133 @@
+import json
+import re
+from collections import Counter
+
+from utils.executores import pool_cpu
+from utils.metricas import ETAPAS, registro
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_BLOCO_JSON = re.compile(r'```json\s*([\s\S]*?)\s*```|(\[[\s\S]*\])')
+
+contadores = Counter()
+
+_DECODIFICACOES = registro.medidor("cnu_json_decodificacoes", "Respostas da Gemini decodificadas por caminho (rapido, fallback, falha).", ("caminho",))
+for _caminho in ("rapido", "fallback", "falha"):
+    _DECODIFICACOES.acompanhar(lambda caminho=_caminho: contadores[caminho], caminho=_caminho)
+
+_OBJETO_QUESTAO = {
+    "type": "OBJECT",
+    "properties": {
+        "eixo": {"type": "STRING"},
+        "materia": {"type": "STRING"},
+        "pergunta": {"type": "STRING"},
+        "opcoes": {
+            "type": "OBJECT",
+            "properties": {letra: {"type": "STRING"} for letra in "ABCD"},
+            "required": list("ABCD"),
+        },
+        "resposta": {"type": "STRING", "enum": list("ABCD")},
+        "justificativa": {"type": "STRING"},
+        "fonte": {"type": "STRING"},
+        "topico_para_revisao": {"type": "STRING"},
+    },
+    "required": ["eixo", "materia", "pergunta", "opcoes", "resposta", "justificativa", "fonte", "topico_para_revisao"],
+}
+
+_OBJETO_FLASHCARD = {
+    "type": "OBJECT",
+    "properties": {
+        "frente": {"type": "STRING"},
+        "verso": {"type": "STRING"},
+        "topico_para_revisao": {"type": "STRING"},
+    },
+    "required": ["frente", "verso", "topico_para_revisao"],
+}
+
+SCHEMA_QUESTOES = {"type": "ARRAY", "items": _OBJETO_QUESTAO}
+SCHEMA_FLASHCARDS = {"type": "ARRAY", "items": _OBJETO_FLASHCARD}
+
+
+def config_json(schema: dict) -> dict:
+    """generation_config que pede à Gemini saída JSON no schema informado."""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def decodificar(texto):
+    """Decodifica JSON estrito com o decoder em C (orjson) quando disponível."""
+    if orjson is not None:
+        return orjson.loads(texto)
+    return json.loads(texto)
+
+
+def _caminho_rapido(raw_text: str):
+    try:
+        dados = decodificar(raw_text)
+        if isinstance(dados, list):
+            contadores["rapido"] += 1
+            return dados
+    except ValueError:
+        pass
+    return None
+
+
+def _decodificar_tolerante(raw_text: str):
+    """Extração por regex e demjson, lenta e em Python puro: roda no pool de processos. Devolve (dados, erro)."""
+    json_match = _BLOCO_JSON.search(raw_text)
+    if not json_match:
+        return None, "ERRO: Nenhum bloco JSON válido foi encontrado na resposta da IA."
+
+    cleaned_response = next((group for group in json_match.groups() if group is not None), None)
+    if not cleaned_response:
+        return None, "ERRO: Bloco JSON encontrado, mas estava vazio."
+
+    # Só o caminho lento precisa do demjson; importado aqui, ele fica fora da inicialização do bot.
+    import demjson3 as demjson
+
+    try:
+        dados = demjson.decode(cleaned_response)
+    except demjson.JSONDecodeError as e:
+        return None, f"Erro ao parsear o JSON (demjson) da Gemini: {e}"
+    return (dados if isinstance(dados, list) else None), None
+
+
+def _concluir_fallback(raw_text: str, dados, erro):
+    contadores["fallback"] += 1
+    if erro:
+        contadores["falha"] += 1
+        print(erro)
+        print("--- Resposta Recebida ---\n", raw_text, "\n-------------------------")
+    return dados
+
+
+def extrair_lista_json(raw_text: str):
+    """Lê a lista JSON de uma resposta da Gemini.
+
+    O caminho rápido decodifica a saída estruturada diretamente. Se ela não for
+    um array JSON válido, recorre à extração por regex e ao demjson, que tolera
+    JSON malformado, e contabiliza o uso desse fallback. Retorna None se nada der certo.
+    """
+    with ETAPAS.cronometrar(etapa="parse_json"):
+        dados = _caminho_rapido(raw_text)
+        if dados is not None:
+            return dados
+        return _concluir_fallback(raw_text, *_decodificar_tolerante(raw_text))
+
+
+async def extrair_lista_json_async(raw_text: str):
+    """Como `extrair_lista_json`, mas o fallback roda no pool de processos para não travar o event loop.
+
+    Levanta PoolOcupado se o pool estiver saturado.
+    """
+    with ETAPAS.cronometrar(etapa="parse_json"):
+        dados = _caminho_rapido(raw_text)
+        if dados is not None:
+            return dados
+        return _concluir_fallback(raw_text, *await pool_cpu().executar(_decodificar_tolerante, raw_text))
+
+
+def estatisticas() -> dict:
+    return dict(contadores)
@@ -0,0 +1,61 @@
+import discord
+
+# Limites da API do Discord para embeds (em caracteres, exceto os dois últimos).
+LIMITE_TITULO = 256
+LIMITE_DESCRICAO = 4096
+LIMITE_NOME_CAMPO = 256
+LIMITE_CAMPO = 1024
+LIMITE_RODAPE = 2048
+LIMITE_TOTAL = 6000
+MAX_CAMPOS = 25
+MAX_EMBEDS = 10
+RETICENCIAS = "…"
+
+
+def truncar(texto: str, limite: int) -> str:
+    texto = str(texto)
+    if len(texto) <= limite:
+        return texto
+    return texto[:max(limite - len(RETICENCIAS), 0)].rstrip() + RETICENCIAS
+
+
+def dividir_texto(texto: str, limite: int) -> list:
+    """Quebra o texto em partes de até `limite` caracteres, de preferência em quebras de linha, depois em espaços."""
+    partes = []
+    while len(texto) > limite:
+        corte = texto.rfind("\n", 0, limite + 1)
+        if corte <= 0:
+            corte = texto.rfind(" ", 0, limite + 1)
+        if corte <= 0:
+            corte = limite
+        partes.append(texto[:corte].rstrip())
+        texto = texto[corte:].lstrip()
+    if texto or not partes:
+        partes.append(texto)
+    return partes
+
+
+def paginar(titulo: str, texto: str, cor: discord.Color, rodape: str = "", reserva: int = 0) -> list:
+    """Monta os embeds de uma mensagem já dentro dos limites do Discord.
+
+    Uma descrição maior que 4096 caracteres continua em embeds seguintes; o conjunto nunca passa de 6000
+    caracteres (menos `reserva`, para um rodapé definido depois) nem de 10 embeds, truncando o final se preciso.
+    """
+    titulo = truncar(titulo, LIMITE_TITULO)
+    rodape = truncar(rodape, LIMITE_RODAPE)
+    orcamento = LIMITE_TOTAL - reserva - len(titulo) - len(rodape)
+    partes = dividir_texto(truncar(texto, orcamento), LIMITE_DESCRICAO)[:MAX_EMBEDS]
+    embeds = [
+        discord.Embed(title=titulo if i == 0 else None, description=parte or None, color=cor)
+        for i, parte in enumerate(partes)
+    ]
+    if rodape:
+        embeds[-1].set_footer(text=rodape)
+    return embeds
+
+
+def adicionar_campo(embed: discord.Embed, nome: str, valor: str, inline: bool = True):
+    """add_field respeitando os limites de nome, valor e quantidade de campos."""
+    if len(embed.fields) >= MAX_CAMPOS:
+        return
+    embed.add_field(name=truncar(nome, LIMITE_NOME_CAMPO), value=truncar(valor, LIMITE_CAMPO), inline=inline)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.metricas import FILA_EXECUTOR, REJEITADAS_EXECUTOR, registrar_evento
+
+CPU_MAX_PROCESSOS = int(os.getenv("CPU_MAX_PROCESSOS", str(min(2, os.cpu_count() or 1))))
+CPU_MAX_FILA = int(os.getenv("CPU_MAX_FILA", "32"))
+# Abaixo disso a ida e volta até outro processo custa mais que processar o texto no próprio event loop.
+CPU_TAMANHO_MINIMO = int(os.getenv("CPU_TAMANHO_MINIMO", "20000"))
+# Quanto uma tarefa aceita esperar por uma vaga antes de o usuário receber o aviso de "ocupado".
+ESPERA_MAXIMA = float(os.getenv("EXECUTORES_ESPERA_MAXIMA", "2"))
+MENSAGEM_OCUPADO = "Estou com muitos pedidos sendo processados agora. Tente novamente em alguns segundos."
+
+
+class PoolOcupado(Exception):
+    """Todas as vagas do pool (em execução mais na fila) estão ocupadas; o usuário deve tentar de novo em instantes."""
+
+    def __init__(self, nome: str):
+        super().__init__(f"O pool '{nome}' está saturado.")
+        self.nome = nome
+
+
+class PoolLimitado:
+    """Executor com fila limitada: no máximo `max_workers + max_fila` tarefas aceitas ao mesmo tempo.
+
+    Quem chega com tudo ocupado espera até `espera_maxima` segundos por uma vaga (backpressure) e então
+    recebe PoolOcupado, em vez de empilhar trabalho sem limite enquanto o event loop fica livre.
+    `fabrica()` cria o executor, e de novo se ele quebrar (ex.: um processo do pool morreu).
+    """
+
+    def __init__(self, nome: str, fabrica, max_workers: int, max_fila: int, espera_maxima: float = ESPERA_MAXIMA):
+        self.nome = nome
+        self.fabrica = fabrica
+        self.executor = fabrica()
+        self.capacidade = max_workers + max_fila
+        self.espera_maxima = espera_maxima
+        self.vagas = asyncio.Semaphore(self.capacidade)
+        self.ocupadas = 0
+        FILA_EXECUTOR.acompanhar(lambda: self.ocupadas, executor=nome)
+
+    def tem_vagas(self, quantidade: int = 1) -> bool:
+        return self.capacidade - self.ocupadas >= quantidade
+
+    async def _reservar(self, espera: float):
+        if self.vagas.locked():
+            if espera <= 0:
+                REJEITADAS_EXECUTOR.incrementar(executor=self.nome)
+                raise PoolOcupado(self.nome)
+            try:
+                await asyncio.wait_for(self.vagas.acquire(), None if espera == math.inf else espera)
+            except asyncio.TimeoutError:
+                REJEITADAS_EXECUTOR.incrementar(executor=self.nome)
+                raise PoolOcupado(self.nome) from None
+        else:
+            await self.vagas.acquire()
+        self.ocupadas += 1
+
+    def _liberar(self):
+        self.ocupadas -= 1
+        self.vagas.release()
+
+    async def executar(self, funcao, *args, espera: float = None):
+        """Roda `funcao(*args)` no executor. `espera` substitui a espera máxima do pool (math.inf: sem limite)."""
+        await self._reservar(self.espera_maxima if espera is None else espera)
+        loop = asyncio.get_running_loop()
+        try:
+            futuro = self.executor.submit(funcao, *args)
+        except BaseException as e:
+            self._liberar()
+            if isinstance(e, BrokenExecutor):
+                self._recriar()
+            raise
+        # A vaga só volta quando o trabalho termina de fato, mesmo que quem esperava tenha sido cancelado.
+        futuro.add_done_callback(lambda _: loop.call_soon_threadsafe(self._liberar))
+        try:
+            return await asyncio.wrap_future(futuro)
+        except BrokenExecutor:
+            self._recriar()
+            raise
+
+    def _recriar(self):
+        if getattr(self.executor, "_broken", False):
+            registrar_evento("pool_recriado", nivel=logging.WARNING, pool=self.nome)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.fabrica()
+
+    def encerrar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def criar_pool_threads(nome: str, max_threads: int, max_fila: int, espera_maxima: float = ESPERA_MAXIMA) -> PoolLimitado:
+    """Pool para chamadas bloqueantes de SDKs (I/O): threads bastam, o GIL é liberado durante a espera pela rede."""
+    return PoolLimitado(
+        nome, lambda: ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix=nome), max_threads, max_fila, espera_maxima,
+    )
+
+
+_pool_cpu = None
+
+
+def pool_cpu() -> PoolLimitado:
+    """Pool de processos compartilhado para parsing pesado (demjson, regex em textos grandes), criado no primeiro uso.
+
+    Usa 'spawn': o bot tem threads rodando, e fork com threads ativas pode herdar travas em estado inconsistente.
+    """
+    global _pool_cpu
+    if _pool_cpu is None:
+        _pool_cpu = PoolLimitado(
+            "cpu", lambda: ProcessPoolExecutor(max_workers=CPU_MAX_PROCESSOS, mp_context=multiprocessing.get_context("spawn")),
+            CPU_MAX_PROCESSOS, CPU_MAX_FILA,
+        )
+    return _pool_cpu
+
+
+async def processar_texto(funcao, texto: str, *args):
+    """`funcao(texto, *args)` no pool de CPU se o texto for grande; senão, direto no event loop."""
+    if len(texto) < CPU_TAMANHO_MINIMO:
+        return funcao(texto, *args)
+    return await pool_cpu().executar(funcao, texto, *args)
+
+
+def encerrar_pools():
+    global _pool_cpu
+    if _pool_cpu is not None:
+        _pool_cpu.encerrar()
+        _pool_cpu = None
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import discord
+
+from utils.limitacao import BaldeTokens
+from utils.metricas import registrar_evento
+
+# O Discord limita edições e envios por rota (canal ou webhook de interação) a poucas requisições por segundo.
+TAXA_POR_ROTA = float(os.getenv("ENVIO_TAXA_POR_ROTA", "1"))
+RAJADA_POR_ROTA = float(os.getenv("ENVIO_RAJADA_POR_ROTA", "5"))
+JANELA_AGRUPAMENTO = 1.0
+TENTATIVAS_429 = 3
+LIMITE_MENSAGEM = 2000
+
+
+def juntar_linhas(textos, limite: int = LIMITE_MENSAGEM) -> list:
+    """Junta os textos, um por linha, em blocos de até `limite` caracteres."""
+    blocos, atual = [], ""
+    for texto in textos:
+        texto = texto[:limite]
+        if atual and len(atual) + 1 + len(texto) > limite:
+            blocos.append(atual)
+            atual = ""
+        atual = f"{atual}\n{texto}" if atual else texto
+    if atual:
+        blocos.append(atual)
+    return blocos
+
+
+def _registrar_erro(futuro: asyncio.Future):
+    # Envios sem ninguém esperando pelo resultado: o erro só pode ser registrado aqui.
+    if not futuro.cancelled() and futuro.exception() is not None:
+        erro = futuro.exception()
+        registrar_evento("envio_agrupado_falhou", nivel=logging.ERROR, erro=type(erro).__name__, detalhe=str(erro))
+
+
+class EnvioInterrompido(Exception):
+    """O worker da rota parou (ex.: foi cancelado no desligamento) antes de fazer o envio."""
+
+
+class _Rota:
+    __slots__ = ("balde", "pendentes", "pausada_ate", "task")
+
+    def __init__(self, taxa: float, rajada: float):
+        self.balde = BaldeTokens(taxa, rajada)
+        self.pendentes = OrderedDict()
+        self.pausada_ate = 0.0
+        self.task = None
+
+
+class FilaEnvio:
+    """Fila de saída para edições e envios de mensagens no Discord.
+
+    Cada rota tem seu token bucket e um worker que só existe enquanto há pendências. Uma edição nova
+    para uma mensagem que ainda está na fila substitui a pendente, e um 429 pausa a rota inteira pelo
+    tempo pedido, com backoff exponencial entre as tentativas.
+    """
+
+    def __init__(self, taxa: float = TAXA_POR_ROTA, rajada: float = RAJADA_POR_ROTA):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.rotas = {}
+        self.grupos = {}
+        self.enviadas = 0
+        self.substituidas = 0
+        self.limitadas = 0
+
+    def editar(self, rota: str, chave, fabrica) -> asyncio.Future:
+        """Agenda `fabrica()` (uma função que devolve a corrotina da edição) para a mensagem `chave`.
+
+        Se já houver uma edição pendente para a mesma mensagem, só a mais nova é feita; as duas
+        recebem o mesmo futuro.
+        """
+        estado = self.rotas.get(rota)
+        if estado is None:
+            estado = self.rotas[rota] = _Rota(self.taxa, self.rajada)
+        pendente = estado.pendentes.get(chave)
+        if pendente is not None:
+            pendente[0] = fabrica
+            self.substituidas += 1
+            return pendente[1]
+        futuro = asyncio.get_running_loop().create_future()
+        estado.pendentes[chave] = [fabrica, futuro]
+        if estado.task is None or estado.task.done():
+            estado.task = asyncio.create_task(self._processar(rota, estado))
+        return futuro
+
+    def enviar(self, rota: str, fabrica) -> asyncio.Future:
+        """Agenda um envio que nunca é substituído (ex.: uma mensagem nova no canal)."""
+        return self.editar(rota, object(), fabrica)
+
+    def agrupar(self, rota: str, texto: str, enviar):
+        """Avisos para a mesma rota dentro de JANELA_AGRUPAMENTO viram uma mensagem só.
+
+        `enviar(texto)` deve devolver a corrotina que manda o texto já combinado.
+        """
+        grupo = self.grupos.get(rota)
+        if grupo is None:
+            grupo = self.grupos[rota] = []
+            asyncio.get_running_loop().call_later(JANELA_AGRUPAMENTO, self._fechar_grupo, rota, enviar)
+        grupo.append(texto)
+
+    def _fechar_grupo(self, rota: str, enviar):
+        for bloco in juntar_linhas(self.grupos.pop(rota, [])):
+            self.enviar(rota, lambda bloco=bloco: enviar(bloco)).add_done_callback(_registrar_erro)
+
+    def _espera_429(self, erro: discord.HTTPException, tentativa: int) -> float:
+        retry_after = getattr(erro, "retry_after", None)
+        if retry_after is None and getattr(erro, "response", None) is not None:
+            retry_after = erro.response.headers.get("Retry-After")
+        return float(retry_after or 1.0) * (2 ** tentativa)
+
+    async def _processar(self, rota: str, estado: _Rota):
+        futuro = None
+        try:
+            while estado.pendentes:
+                futuro = None
+                await estado.balde.adquirir()
+                espera = estado.pausada_ate - time.monotonic()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                _, (fabrica, futuro) = estado.pendentes.popitem(last=False)
+                if futuro.done():
+                    # Quem pediu desistiu (ex.: foi cancelado) antes da vez dele.
+                    continue
+                for tentativa in range(TENTATIVAS_429):
+                    try:
+                        resultado = await fabrica()
+                    except discord.HTTPException as e:
+                        if e.status == 429 and tentativa + 1 < TENTATIVAS_429:
+                            self.limitadas += 1
+                            espera = self._espera_429(e, tentativa)
+                            estado.pausada_ate = time.monotonic() + espera
+                            registrar_evento("envio_limitado", nivel=logging.WARNING, rota=rota, tentativa=tentativa + 1, pausa_s=round(espera, 1))
+                            await asyncio.sleep(espera)
+                            continue
+                        if not futuro.done():
+                            futuro.set_exception(e)
+                    except Exception as e:
+                        if not futuro.done():
+                            futuro.set_exception(e)
+                    else:
+                        self.enviadas += 1
+                        if not futuro.done():
+                            futuro.set_result(resultado)
+                    break
+        finally:
+            # Saída normal ou não (CancelledError, BaseException da fábrica): ninguém pode ficar esperando para sempre.
+            if self.rotas.get(rota) is estado:
+                del self.rotas[rota]
+            restantes = [futuro] + [pendente[1] for pendente in estado.pendentes.values()]
+            estado.pendentes.clear()
+            for restante in restantes:
+                if restante is not None and not restante.done():
+                    restante.set_exception(EnvioInterrompido(f"A fila de envio da rota '{rota}' foi interrompida."))
+
+    def estatisticas(self) -> dict:
+        return {
+            "rotas_ativas": len(self.rotas),
+            "pendentes": sum(len(estado.pendentes) for estado in self.rotas.values()),
+            "enviadas": self.enviadas,
+            "substituidas": self.substituidas,
+            "limitadas": self.limitadas,
+        }
@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import random
+import time
+
+from utils.limitacao import criar_balde
+from utils.metricas import CHAMADAS_GEMINI, ETAPAS, registrar_evento, registrar_tokens
+
+MAX_CONCORRENCIA = int(os.getenv("GEMINI_MAX_CONCORRENCIA", "8"))
+MAX_POR_MODELO = int(os.getenv("GEMINI_MAX_POR_MODELO", "4"))
+REQUISICOES_POR_MINUTO = float(os.getenv("GEMINI_RPM", "60"))
+TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+TENTATIVAS = int(os.getenv("GEMINI_TENTATIVAS", "3"))
+
+_erros_transitorios = None
+# Contagem ativa de `contar_chamadas`; as tasks criadas dentro do bloco herdam o contexto e somam na mesma.
+_contagem_atual = contextvars.ContextVar("contagem_chamadas_gemini", default=None)
+
+
+def carregar_sdk():
+    """Importa o SDK da Gemini, que sozinho (protobuf, gRPC) leva segundos: fica fora da inicialização do bot.
+
+    Chamado no primeiro uso, ou antes disso numa thread por `GatewayGemini.aquecer`.
+    """
+    import google.generativeai as genai
+
+    return genai
+
+
+def erros_transitorios() -> tuple:
+    global _erros_transitorios
+    if _erros_transitorios is None:
+        from google.api_core import exceptions as google_exceptions
+
+        _erros_transitorios = (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+            asyncio.TimeoutError,
+        )
+    return _erros_transitorios
+
+
+class ContagemChamadas:
+    __slots__ = ("total",)
+
+    def __init__(self):
+        self.total = 0
+
+
+@contextlib.contextmanager
+def contar_chamadas():
+    """Conta as chamadas que o bloco faz à API, novas tentativas incluídas, inclusive pelas tasks que ele criar.
+
+    Um pedido pode virar vários (lotes, rodadas, hedge); quem tem orçamento de chamadas mede por aqui.
+    """
+    contagem = ContagemChamadas()
+    token = _contagem_atual.set(contagem)
+    try:
+        yield contagem
+    finally:
+        _contagem_atual.reset(token)
+
+
+def _contar_chamada():
+    contagem = _contagem_atual.get()
+    if contagem is not None:
+        contagem.total += 1
+
+
+class GeminiIndisponivel(Exception):
+    """A Gemini está fora do ar, sem cota ou o circuito está aberto; o usuário deve tentar mais tarde."""
+
+
+class Disjuntor:
+    """Circuit breaker: abre após `limite_falhas` falhas seguidas e libera uma chamada de teste após `tempo_aberto` segundos."""
+
+    def __init__(self, limite_falhas: int = 5, tempo_aberto: float = 30.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.teste_iniciado_em = None
+
+    @property
+    def estado(self) -> str:
+        if self.falhas_seguidas < self.limite_falhas:
+            return "fechado"
+        return "meio-aberto" if time.monotonic() >= self.aberto_ate else "aberto"
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == "fechado":
+            return True
+        agora = time.monotonic()
+        # Uma chamada de teste por vez; se ela sumir (ex.: cancelada), outra é liberada após `tempo_aberto`.
+        if estado == "meio-aberto" and (self.teste_iniciado_em is None or agora - self.teste_iniciado_em > self.tempo_aberto):
+            self.teste_iniciado_em = agora
+            return True
+        return False
+
+    def registrar_sucesso(self):
+        self.falhas_seguidas = 0
+        self.teste_iniciado_em = None
+
+    def registrar_falha(self):
+        self.falhas_seguidas += 1
+        self.teste_iniciado_em = None
+        if self.falhas_seguidas >= self.limite_falhas:
+            self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+
+class GatewayGemini:
+    """Ponto único de acesso à Gemini, compartilhado por todos os cogs.
+
+    Aplica limite global e por modelo de chamadas simultâneas, token bucket por
+    chave de API, prazo por chamada, novas tentativas com jitter para erros
+    transitórios e um circuit breaker que falha rápido enquanto a API está instável.
+    """
+
+    def __init__(self, api_key: str, max_concorrencia: int = MAX_CONCORRENCIA, max_por_modelo: int = MAX_POR_MODELO,
+                 requisicoes_por_minuto: float = REQUISICOES_POR_MINUTO, timeout: float = TIMEOUT,
+                 tentativas: int = TENTATIVAS, fabrica_modelo=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.max_por_modelo = max_por_modelo
+        self.fabrica_modelo = fabrica_modelo
+        self.semaforo_global = asyncio.Semaphore(max_concorrencia)
+        self.semaforos_modelo = {}
+        self.modelos = {}
+        # A cota é da chave de API: com LIMITES_BACKEND compartilhado, todos os processos do cluster dividem o mesmo balde.
+        nome_balde = "gemini:" + hashlib.sha256(str(api_key).encode()).hexdigest()[:16]
+        self.baldes = {api_key: criar_balde(nome_balde, requisicoes_por_minuto / 60, max(1.0, requisicoes_por_minuto / 6))}
+        self.disjuntor = Disjuntor()
+
+    def _preparar_sdk(self):
+        if self.fabrica_modelo is None:
+            genai = carregar_sdk()
+            genai.configure(api_key=self.api_key)
+            self.fabrica_modelo = genai.GenerativeModel
+        erros_transitorios()
+
+    async def aquecer(self):
+        """Carrega o SDK numa thread, para a primeira chamada não travar o event loop com o import."""
+        try:
+            await asyncio.to_thread(self._preparar_sdk)
+        except Exception as e:
+            registrar_evento("gemini_aquecimento_falhou", nivel=logging.WARNING, erro=type(e).__name__, detalhe=str(e))
+
+    def modelo(self, nome: str):
+        if nome not in self.modelos:
+            self._preparar_sdk()
+            self.modelos[nome] = self.fabrica_modelo(nome)
+            self.semaforos_modelo[nome] = asyncio.Semaphore(self.max_por_modelo)
+        return self.modelos[nome]
+
+    def _liberar_circuito(self):
+        if not self.disjuntor.permitir():
+            raise GeminiIndisponivel("Circuito aberto: a Gemini falhou várias vezes seguidas.")
+
+    async def _esperar_nova_tentativa(self, tentativa: int):
+        await asyncio.sleep(random.uniform(0, min(10.0, 2 ** tentativa)))
+
+    async def gerar(self, nome_modelo: str, prompt: str, generation_config=None, timeout: float = None):
+        """Chama `generate_content_async` respeitando os limites do gateway e devolve a resposta completa."""
+        modelo = self.modelo(nome_modelo)
+        timeout = timeout or self.timeout
+        for tentativa in range(self.tentativas):
+            self._liberar_circuito()
+            try:
+                # Primeiro a cota, depois a vaga: esperar o balde segurando o semáforo deixaria as vagas paradas
+                # e bloquearia também os pedidos dos outros modelos.
+                await self.baldes[self.api_key].adquirir()
+                async with self.semaforo_global, self.semaforos_modelo[nome_modelo]:
+                    _contar_chamada()
+                    inicio = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        modelo.generate_content_async(prompt, generation_config=generation_config), timeout
+                    )
+            except erros_transitorios() as e:
+                self.disjuntor.registrar_falha()
+                CHAMADAS_GEMINI.incrementar(modelo=nome_modelo, resultado=type(e).__name__)
+                registrar_evento(
+                    "gemini_falha_transitoria", nivel=logging.WARNING, modelo=nome_modelo, etapa="gemini_geracao", erro=type(e).__name__,
+                    tentativa=tentativa + 1, tentativas=self.tentativas,
+                )
+                if tentativa + 1 == self.tentativas:
+                    raise GeminiIndisponivel(str(e)) from e
+                await self._esperar_nova_tentativa(tentativa)
+                continue
+            except Exception as e:
+                # A API respondeu (ex.: prompt inválido ou bloqueado): não é sinal de instabilidade.
+                self.disjuntor.registrar_sucesso()
+                CHAMADAS_GEMINI.incrementar(modelo=nome_modelo, resultado=type(e).__name__)
+                raise
+            self.disjuntor.registrar_sucesso()
+            self._registrar_chamada(nome_modelo, "gemini_geracao", time.perf_counter() - inicio, response, tentativa)
+            return response
+
+    async def gerar_stream(self, nome_modelo: str, prompt: str, generation_config=None, timeout: float = None):
+        """Versão em stream de `gerar`: produz o texto de cada pedaço conforme chega.
+
+        Só há nova tentativa enquanto nenhum pedaço foi entregue; o prazo vale para o stream inteiro.
+        """
+        modelo = self.modelo(nome_modelo)
+        timeout = timeout or self.timeout
+        for tentativa in range(self.tentativas):
+            self._liberar_circuito()
+            entregou = False
+            try:
+                await self.baldes[self.api_key].adquirir()
+                async with self.semaforo_global, self.semaforos_modelo[nome_modelo]:
+                    _contar_chamada()
+                    inicio = time.perf_counter()
+                    prazo = time.monotonic() + timeout
+                    response = await asyncio.wait_for(
+                        modelo.generate_content_async(prompt, generation_config=generation_config, stream=True), timeout
+                    )
+                    pedacos = response.__aiter__()
+                    ultimo = None
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(pedacos.__anext__(), max(0.0, prazo - time.monotonic()))
+                        except StopAsyncIteration:
+                            break
+                        if not entregou:
+                            ETAPAS.observar(time.perf_counter() - inicio, etapa="gemini_primeiro_pedaco")
+                        entregou = True
+                        ultimo = chunk
+                        yield chunk.text
+            except erros_transitorios() as e:
+                self.disjuntor.registrar_falha()
+                CHAMADAS_GEMINI.incrementar(modelo=nome_modelo, resultado=type(e).__name__)
+                registrar_evento(
+                    "gemini_falha_transitoria", nivel=logging.WARNING, modelo=nome_modelo, etapa="gemini_stream", erro=type(e).__name__,
+                    tentativa=tentativa + 1, tentativas=self.tentativas, entregou=entregou,
+                )
+                if entregou or tentativa + 1 == self.tentativas:
+                    raise GeminiIndisponivel(str(e)) from e
+                await self._esperar_nova_tentativa(tentativa)
+                continue
+            except Exception as e:
+                self.disjuntor.registrar_sucesso()
+                CHAMADAS_GEMINI.incrementar(modelo=nome_modelo, resultado=type(e).__name__)
+                raise
+            self.disjuntor.registrar_sucesso()
+            # No stream, o usage_metadata completo vem no último pedaço.
+            self._registrar_chamada(nome_modelo, "gemini_stream", time.perf_counter() - inicio, ultimo, tentativa)
+            return
+
+    def _registrar_chamada(self, nome_modelo: str, etapa: str, duracao: float, response, tentativa: int):
+        CHAMADAS_GEMINI.incrementar(modelo=nome_modelo, resultado="ok")
+        ETAPAS.observar(duracao, etapa=etapa)
+        uso = registrar_tokens(nome_modelo, response)
+        registrar_evento(
+            "gemini_chamada", modelo=nome_modelo, etapa=etapa, duracao_ms=round(duracao * 1000, 1), tentativa=tentativa + 1,
+            tokens_entrada=uso[0] if uso else None, tokens_saida=uso[1] if uso else None,
+        )
@@ -0,0 +1,84 @@
+import re
+
+from utils.decodificacao import decodificar
+
+_ESPECIAIS = re.compile(r'["\\{}\[\]]')
+
+
+class ParserArrayJSON:
+    """Parser incremental de um array JSON de objetos.
+
+    Recebe o texto em pedaços (como chega do stream da Gemini) e devolve cada
+    item do array assim que ele fecha. Texto antes do primeiro '[' (por exemplo
+    a cerca ```json) é ignorado.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.iniciado = False
+        self.finalizado = False
+        self.profundidade = 0
+        self.em_string = False
+        self.escape = False
+        self.inicio_item = None
+
+    def alimentar(self, texto: str) -> list:
+        itens = []
+        if self.finalizado:
+            return itens
+        self.buffer += texto
+        buf = self.buffer
+
+        if not self.iniciado:
+            inicio = buf.find("[", self.pos)
+            if inicio == -1:
+                self.buffer, self.pos = "", 0
+                return itens
+            self.iniciado = True
+            self.profundidade = 1
+            self.pos = inicio + 1
+
+        i = self.pos
+        while not self.finalizado:
+            if self.escape:
+                if i >= len(buf):
+                    break
+                self.escape = False
+                i += 1
+                continue
+            m = _ESPECIAIS.search(buf, i)
+            if not m:
+                i = len(buf)
+                break
+            c = m.group()
+            i = m.end()
+            if self.em_string:
+                if c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.em_string = False
+            elif c == '"':
+                self.em_string = True
+            elif c in "{[":
+                if self.profundidade == 1:
+                    self.inicio_item = m.start()
+                self.profundidade += 1
+            elif c in "}]":
+                self.profundidade -= 1
+                if self.profundidade == 1 and self.inicio_item is not None:
+                    try:
+                        itens.append(decodificar(buf[self.inicio_item:i]))
+                    except ValueError:
+                        pass
+                    self.inicio_item = None
+                elif self.profundidade == 0:
+                    self.finalizado = True
+
+        # Descarta o texto já consumido, mantendo apenas o item incompleto.
+        corte = self.inicio_item if self.inicio_item is not None else i
+        self.buffer = buf[corte:]
+        self.pos = i - corte
+        if self.inicio_item is not None:
+            self.inicio_item = 0
+        return itens
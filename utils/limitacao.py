@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+
+from utils.compartilhado import PREFIXO, cliente_redis
+from utils.sqlite import abrir_sqlite, no_executor
+
+BACKEND_LIMITES = os.getenv("LIMITES_BACKEND", "memoria")
+CAMINHO_LIMITES = os.getenv("LIMITES_PATH", "data/limites.db")
+
+
+class BaldeTokens:
+    """Token bucket: permite rajadas de até `capacidade` chamadas e repõe `taxa` tokens por segundo."""
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    async def adquirir(self):
+        async with self.lock:
+            self._repor()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.taxa)
+                self._repor()
+            self.tokens -= 1
+
+
+class _BaldeCompartilhado:
+    """Base dos token buckets cujo estado fica fora do processo, para valer para o cluster inteiro.
+
+    `_tentar()` consome um token se houver e devolve 0, ou devolve quantos segundos faltam para o próximo.
+    """
+
+    def __init__(self, nome: str, taxa: float, capacidade: float):
+        self.nome = nome
+        self.taxa = taxa
+        self.capacidade = capacidade
+        # Dentro do processo as chamadas fazem fila aqui, e só a da vez consulta o backend.
+        self.lock = asyncio.Lock()
+
+    async def _tentar(self) -> float:
+        raise NotImplementedError
+
+    async def adquirir(self):
+        async with self.lock:
+            while True:
+                espera = await self._tentar()
+                if espera <= 0:
+                    return
+                await asyncio.sleep(espera)
+
+
+class BaldeTokensSQLite(_BaldeCompartilhado):
+    """Token bucket num arquivo SQLite: compartilhado entre os processos de uma mesma máquina."""
+
+    def __init__(self, nome: str, taxa: float, capacidade: float, caminho: str = CAMINHO_LIMITES):
+        super().__init__(nome, taxa, capacidade)
+        # Transações controladas à mão: BEGIN IMMEDIATE trava a escrita entre processos durante a leitura e a atualização.
+        self.conn, self.trava = abrir_sqlite(caminho, isolation_level=None)
+        with self.trava:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS baldes (
+                    nome TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+
+    def _tentar_sync(self) -> float:
+        # Relógio de parede: é o único que os processos têm em comum.
+        with self.trava:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                agora = time.time()
+                linha = self.conn.execute("SELECT tokens, atualizado_em FROM baldes WHERE nome = ?", (self.nome,)).fetchone()
+                tokens = self.capacidade if linha is None else min(self.capacidade, linha[0] + max(0.0, agora - linha[1]) * self.taxa)
+                espera = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    espera = (1 - tokens) / self.taxa
+                self.conn.execute("INSERT OR REPLACE INTO baldes (nome, tokens, atualizado_em) VALUES (?, ?, ?)", (self.nome, tokens, agora))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return espera
+
+    async def _tentar(self) -> float:
+        return await no_executor(self._tentar_sync)
+
+
+# Executado atomicamente no Redis, com o relógio do próprio servidor.
+_SCRIPT_BALDE = """
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'atualizado_em')
+local taxa, capacidade = tonumber(ARGV[1]), tonumber(ARGV[2])
+local relogio = redis.call('TIME')
+local agora = tonumber(relogio[1]) + tonumber(relogio[2]) / 1000000
+local tokens = tonumber(estado[1]) or capacidade
+local desde = tonumber(estado[2]) or agora
+tokens = math.min(capacidade, tokens + math.max(0, agora - desde) * taxa)
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = (1 - tokens) / taxa
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'atualizado_em', agora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 60)
+return tostring(espera)
+"""
+
+
+class BaldeTokensRedis(_BaldeCompartilhado):
+    """Token bucket no Redis: compartilhado entre processos e máquinas."""
+
+    def __init__(self, nome: str, taxa: float, capacidade: float):
+        super().__init__(nome, taxa, capacidade)
+        self.redis = cliente_redis()
+        self.script = self.redis.register_script(_SCRIPT_BALDE)
+
+    async def _tentar(self) -> float:
+        return float(await self.script(keys=[f"{PREFIXO}balde:{self.nome}"], args=[self.taxa, self.capacidade]))
+
+
+BACKENDS = {
+    "sqlite": BaldeTokensSQLite,
+    "redis": BaldeTokensRedis,
+}
+
+
+def criar_balde(nome: str, taxa: float, capacidade: float, backend: str = BACKEND_LIMITES):
+    """Token bucket no backend de LIMITES_BACKEND: 'memoria' (só este processo), 'sqlite' ou 'redis'.
+
+    Os backends compartilhados fazem processos diferentes com o mesmo `nome` dividirem a mesma cota.
+    """
+    if backend == "memoria":
+        return BaldeTokens(taxa, capacidade)
+    if backend not in BACKENDS:
+        raise ValueError(f"LIMITES_BACKEND inválido: '{backend}'. Use um destes: memoria, {', '.join(BACKENDS)}.")
+    return BACKENDS[backend](nome, taxa, capacidade)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import math
+import os
+
+from utils.decodificacao import extrair_lista_json_async
+from utils.executores import PoolOcupado
+from utils.gemini_gateway import GeminiIndisponivel
+from utils.metricas import registrar_evento
+from utils.texto import normalizar_chave
+
+# Itens por chamada à Gemini: pedidos maiores são divididos em lotes gerados ao mesmo tempo.
+TAMANHO_LOTE = int(os.getenv("GERACAO_TAMANHO_LOTE", "5"))
+# Rodadas de geração: a primeira pede tudo, as seguintes só o que faltou (lote truncado, inválido ou repetido).
+RODADAS = int(os.getenv("GERACAO_RODADAS", "2"))
+
+
+def dividir_lotes(quantidade: int, tamanho_lote: int = TAMANHO_LOTE) -> list:
+    """Tamanhos dos lotes para `quantidade` itens, o mais iguais possível: 12 em lotes de 5 vira [4, 4, 4]."""
+    if quantidade <= 0:
+        return []
+    partes = math.ceil(quantidade / max(1, tamanho_lote))
+    base, resto = divmod(quantidade, partes)
+    return [base + (1 if i < resto else 0) for i in range(partes)]
+
+
+async def gerar_em_lotes(gerar_lote, quantidade: int, obtidos, tamanho_lote: int = TAMANHO_LOTE, rodadas: int = RODADAS):
+    """Gera `quantidade` itens em lotes concorrentes, tolerando lotes que falham ou vêm incompletos.
+
+    `gerar_lote(n, parte, partes)` pede `n` itens e junta os válidos e inéditos na coleção de quem chama;
+    `obtidos()` diz quantos já foram juntados. Cada rodada pede só o que ainda falta, então a latência é a
+    de um prompt pequeno e um lote perdido custa só a sua fração. Se nada for obtido, levanta o primeiro erro.
+    """
+    primeiro_erro = None
+    for _ in range(rodadas):
+        faltam = quantidade - obtidos()
+        if faltam <= 0:
+            break
+        antes = obtidos()
+        lotes = dividir_lotes(faltam, tamanho_lote)
+        resultados = await asyncio.gather(
+            *(gerar_lote(n, parte, len(lotes)) for parte, n in enumerate(lotes)), return_exceptions=True,
+        )
+        erros = [r for r in resultados if isinstance(r, Exception)]
+        for erro in erros:
+            registrar_evento("lote_falhou", nivel=logging.WARNING, erro=type(erro).__name__, detalhe=str(erro), lotes=len(lotes))
+        primeiro_erro = primeiro_erro or (erros[0] if erros else None)
+        if obtidos() == antes and (not erros or all(isinstance(e, (GeminiIndisponivel, PoolOcupado)) for e in erros)):
+            # Nada novo: a IA só repetiu itens ou está fora/saturada; outra rodada não ajudaria.
+            break
+    if obtidos() == 0 and primeiro_erro is not None:
+        raise primeiro_erro
+
+
+def variacao_prompt(parte: int, partes: int, evitar, foco: str, ja_criados: str) -> str:
+    """Instruções que diversificam os lotes gerados em paralelo (`parte` de `partes`) e as rodadas que completam
+    o que faltou (`evitar`, os itens já obtidos). `foco` diz o que variar; `ja_criados` nomeia os itens no prompt."""
+    variacao = ""
+    if partes > 1:
+        variacao += f"Este é o lote {parte + 1} de {partes} gerados ao mesmo tempo: {foco}\n"
+    if evitar:
+        variacao += f"Não repita nem reformule {ja_criados}:\n" + "\n".join(f"- {texto[:150]}" for texto in evitar) + "\n"
+    return variacao
+
+
+async def gerar_itens(roteador, comando: str, montar_prompt, quantidade: int, valido, campo_chave: str, generation_config=None):
+    """Itens válidos e sem `campo_chave` repetido, gerados em lotes paralelos pelo roteador; pode devolver menos que o pedido.
+
+    `montar_prompt(n, parte, partes, evitar)` recebe em `evitar` o `campo_chave` dos itens já obtidos. Lotes com
+    resposta ilegível são só descartados; IA fora do ar ou pool saturado seguem para `gerar_em_lotes`.
+    """
+    itens, chaves = [], set()
+
+    async def gerar_lote(n, parte, partes):
+        prompt = montar_prompt(n, parte, partes, [str(item[campo_chave]) for item in itens])
+        try:
+            gerados = await roteador.gerar(
+                comando, prompt, lambda response: extrair_lista_json_async(response.text.strip()),
+                tamanho=n, generation_config=generation_config,
+            )
+        except (GeminiIndisponivel, PoolOcupado):
+            raise
+        except Exception as e:
+            registrar_evento("lote_invalido", nivel=logging.WARNING, comando=comando, itens=n, erro=type(e).__name__, detalhe=str(e))
+            return
+        for item in gerados or []:
+            if not valido(item):
+                continue
+            chave = normalizar_chave(str(item[campo_chave]))
+            if chave not in chaves:
+                chaves.add(chave)
+                itens.append(item)
+
+    await gerar_em_lotes(gerar_lote, quantidade, lambda: len(itens))
+    return itens[:quantidade]
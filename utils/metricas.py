@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICAS_HOST = os.getenv("METRICAS_HOST", "127.0.0.1")
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "0") or 0)
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+
+# Limites dos histogramas de duração, em segundos: de respostas de cache até gerações longas da Gemini.
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+LIMITES_ATRASO_LOOP = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra=None) -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        # A síntese de voz roda em threads do executor: as atualizações precisam de trava.
+        self.trava = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"A métrica '{self.nome}' espera os rótulos {self.rotulos}, recebeu {tuple(rotulos)}.")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _linhas(self):
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        linhas.extend(self._linhas())
+        return "\n".join(linhas)
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self.valores = {}
+
+    def incrementar(self, quantidade: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.trava:
+            self.valores[chave] = self.valores.get(chave, 0) + quantidade
+
+    def _linhas(self):
+        with self.trava:
+            valores = list(self.valores.items())
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores]
+
+
+class Medidor(_Metrica):
+    """Gauge: um valor definido diretamente ou uma função lida a cada coleta."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self.valores = {}
+        self.funcoes = {}
+
+    def definir(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self.trava:
+            self.valores[chave] = valor
+
+    def acompanhar(self, funcao, **rotulos):
+        """Registra `funcao()` como fonte do valor; registrar de novo os mesmos rótulos (ex.: ao recarregar um cog) substitui a anterior."""
+        chave = self._chave(rotulos)
+        with self.trava:
+            self.funcoes[chave] = funcao
+
+    def _linhas(self):
+        with self.trava:
+            valores = dict(self.valores)
+            funcoes = list(self.funcoes.items())
+        for chave, funcao in funcoes:
+            try:
+                valores[chave] = funcao()
+            except Exception as e:
+                registrar_evento("metrica_falhou", nivel=logging.WARNING, metrica=self.nome, erro=repr(e))
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores.items()]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites) + (math.inf,)
+        self.series = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self.trava:
+            serie = self.series.get(chave)
+            if serie is None:
+                # Contagens por faixa (não cumulativas), soma e total.
+                serie = self.series[chave] = [[0] * len(self.limites), 0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, **rotulos):
+        """Observa a duração do bloco, inclusive quando ele termina com exceção."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def _linhas(self):
+        with self.trava:
+            series = [(chave, list(faixas), soma, total) for chave, (faixas, soma, total) in self.series.items()]
+        linhas = []
+        for chave, faixas, soma, total in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites, faixas):
+                acumulado += quantidade
+                rotulos = _formatar_rotulos(self.rotulos, chave, f'le="{_numero(limite)}"')
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rotulos} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{rotulos} {total}")
+        return linhas
+
+
+class Registro:
+    """Conjunto das métricas do processo, exportado no formato de texto do Prometheus."""
+
+    def __init__(self):
+        self.metricas = {}
+
+    def _registrar(self, classe, nome, ajuda, rotulos, **kwargs):
+        existente = self.metricas.get(nome)
+        if existente is not None:
+            if type(existente) is not classe or existente.rotulos != tuple(rotulos):
+                raise ValueError(f"Métrica '{nome}' já registrada com outro tipo ou outros rótulos.")
+            return existente
+        metrica = self.metricas[nome] = classe(nome, ajuda, rotulos, **kwargs)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos=()) -> Contador:
+        return self._registrar(Contador, nome, ajuda, rotulos)
+
+    def medidor(self, nome: str, ajuda: str, rotulos=()) -> Medidor:
+        return self._registrar(Medidor, nome, ajuda, rotulos)
+
+    def histograma(self, nome: str, ajuda: str, rotulos=(), limites=LIMITES_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma, nome, ajuda, rotulos, limites=limites)
+
+    def exportar(self) -> str:
+        return "\n".join(metrica.exportar() for metrica in list(self.metricas.values())) + "\n"
+
+
+registro = Registro()
+
+COMANDOS = registro.histograma(
+    "cnu_comando_segundos", "Tempo entre a criação da interação no Discord e o fim do comando de barra.", ("comando", "resultado"),
+)
+ETAPAS = registro.histograma(
+    "cnu_etapa_segundos", "Duração de cada etapa interna: geração, parse, síntese de voz, início da reprodução.", ("etapa",),
+)
+CHAMADAS_GEMINI = registro.contador("cnu_gemini_chamadas_total", "Chamadas à Gemini por modelo e resultado.", ("modelo", "resultado"))
+TOKENS_GEMINI = registro.contador("cnu_gemini_tokens_total", "Tokens consumidos na Gemini, de entrada e de saída.", ("modelo", "tipo"))
+ATRASO_LOOP = registro.histograma(
+    "cnu_event_loop_atraso_segundos", "Quanto um sleep curto no event loop atrasou além do pedido.", limites=LIMITES_ATRASO_LOOP,
+)
+FILA_EXECUTOR = registro.medidor("cnu_executor_fila", "Tarefas aceitas (rodando ou na fila) em cada executor.", ("executor",))
+REJEITADAS_EXECUTOR = registro.contador("cnu_executor_rejeitadas_total", "Tarefas recusadas com o executor saturado.", ("executor",))
+SESSOES_ATIVAS = registro.medidor("cnu_sessoes_ativas", "Sessões vivas em memória por tipo.", ("tipo",))
+SESSOES_BYTES = registro.medidor("cnu_sessoes_bytes", "Memória estimada das sessões vivas, medida na última varredura.", ("tipo",))
+ROTAS = registro.contador("cnu_rota_total", "Modelo escolhido pela política de roteamento, por comando e motivo.", ("comando", "modelo", "motivo"))
+HEDGES = registro.contador("cnu_hedge_total", "Pedidos de hedge disparados, por comando e resposta usada.", ("comando", "vencedor"))
+LATENCIA_MODELO = registro.medidor(
+    "cnu_modelo_p95_segundos", "p95 recente da latência por item pedido de cada modelo, usado no roteamento.", ("modelo",),
+)
+INICIALIZACAO = registro.medidor("cnu_inicializacao_segundos", "Duração de cada etapa da inicialização do processo.", ("etapa",))
+ESTATISTICAS = registro.medidor(
+    "cnu_componente", "Valores de estatisticas() dos componentes compartilhados (filas, caches, coalescedor).", ("componente", "campo"),
+)
+
+
+def usage_gemini(resposta):
+    """(tokens de entrada, tokens de saída) do usage_metadata de uma resposta, ou None se ela não trouxer."""
+    uso = getattr(resposta, "usage_metadata", None)
+    if uso is None:
+        return None
+    return getattr(uso, "prompt_token_count", 0) or 0, getattr(uso, "candidates_token_count", 0) or 0
+
+
+def registrar_tokens(modelo: str, resposta):
+    uso = usage_gemini(resposta)
+    if uso:
+        TOKENS_GEMINI.incrementar(uso[0], modelo=modelo, tipo="entrada")
+        TOKENS_GEMINI.incrementar(uso[1], modelo=modelo, tipo="saida")
+    return uso
+
+
+def acompanhar_estatisticas(componente: str, objeto):
+    """Publica cada campo numérico de `objeto.estatisticas()` como um gauge."""
+    for campo, valor in objeto.estatisticas().items():
+        if isinstance(valor, (int, float)):
+            ESTATISTICAS.acompanhar(lambda campo=campo: objeto.estatisticas()[campo], componente=componente, campo=campo)
+
+
+async def monitorar_loop(intervalo: float = 0.5):
+    """Mede continuamente o atraso do event loop: um sleep de `intervalo` que demora mais indica trabalho bloqueante."""
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        atraso = time.perf_counter() - inicio - intervalo
+        ATRASO_LOOP.observar(max(atraso, 0.0))
+        if atraso > 0.25:
+            registrar_evento("event_loop_atrasado", nivel=logging.WARNING, atraso_ms=round(atraso * 1000, 1))
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em `extra={"campos": {...}}`.
+
+    `campos_fixos` vão em todas as linhas (ex.: o número do processo no cluster).
+    """
+
+    def __init__(self, campos_fixos: dict = None):
+        super().__init__()
+        self.campos_fixos = campos_fixos or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname.lower(),
+            "evento": record.getMessage(),
+            **self.campos_fixos,
+        }
+        dados.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+logger = logging.getLogger("cnu")
+
+
+def configurar_logs(nivel: str = LOG_NIVEL, **campos_fixos):
+    """Logs estruturados em JSON no stderr, separados dos logs do discord.py."""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(FormatadorJSON(campos_fixos))
+    logger.addHandler(handler)
+    logger.setLevel(nivel)
+    logger.propagate = False
+
+
+def registrar_evento(evento: str, nivel: int = logging.INFO, **campos):
+    logger.log(nivel, evento, extra={"campos": campos})
+
+
+class ServidorMetricas:
+    """Servidor HTTP local com /metrics (formato do Prometheus) e /saude.
+
+    Usa o aiohttp, que já vem como dependência do discord.py.
+    """
+
+    def __init__(self, host: str = METRICAS_HOST, porta: int = METRICAS_PORTA, registro_metricas: Registro = registro):
+        self.host = host
+        self.porta = porta
+        self.registro = registro_metricas
+        self.runner = None
+
+    async def iniciar(self):
+        from aiohttp import web
+
+        async def metricas(request):
+            return web.Response(text=self.registro.exportar(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+        async def saude(request):
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/metrics", metricas)
+        app.router.add_get("/saude", saude)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.porta).start()
+        registrar_evento("metricas_disponiveis", url=f"http://{self.host}:{self.porta}/metrics")
+
+    async def parar(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
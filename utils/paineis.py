@@ -0,0 +1,33 @@
+import discord
+
+
+def painel_botoes(botoes) -> discord.ui.View:
+    """View só com o layout dos botões, para mensagens cujos cliques são tratados por uma view persistente
+    registrada uma vez com `bot.add_view` (os custom_ids são os mesmos).
+
+    Ela já vai parada, e o discord.py não guarda views paradas no ViewStore. Uma view ativa enviada a cada
+    clique ficaria lá para sempre: só sai com `stop()` ou quando a mensagem é apagada, e mensagens efêmeras
+    não geram esse evento. Precisa ser criada dentro do event loop, como em qualquer handler.
+    """
+    view = discord.ui.View(timeout=None)
+    for botao in botoes:
+        view.add_item(botao)
+    view.stop()
+    return view
+
+
+async def avisar_expiracao(bot, interacao: discord.Interaction, message_id: int, conteudo: str, **campos):
+    """Faz o papel do antigo on_timeout das views: troca os botões da mensagem da sessão expirada por um aviso.
+
+    `interacao` é a última interação do usuário, cujo webhook ainda pode editar a mensagem efêmera; sem ela
+    (sessão recarregada após um reinício e sem cliques desde então) não há o que editar.
+    """
+    if interacao is None:
+        return
+    try:
+        await bot.fila_envio.editar(
+            f"interacao:{interacao.id}", message_id,
+            lambda: interacao.edit_original_response(content=conteudo, view=None, **campos),
+        )
+    except discord.HTTPException:
+        pass
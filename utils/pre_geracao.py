@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+
+from utils.compartilhado import PREFIXO, cliente_redis
+from utils.gemini_gateway import contar_chamadas
+from utils.metricas import registrar_evento
+from utils.sqlite import abrir_sqlite, no_executor
+from utils.texto import normalizar_chave
+
+COGS_POR_TIPO = {
+    "simulado": "SimuladoAICog",
+    "flashcards": "FlashcardsCog",
+    "explique": "ExplicacaoCog",
+}
+
+TOP_N = int(os.getenv("PRE_GERACAO_TOP_N", "5"))
+ORCAMENTO_POR_HORA = int(os.getenv("PRE_GERACAO_ORCAMENTO_HORA", "20"))
+INTERVALO = float(os.getenv("PRE_GERACAO_INTERVALO", "60"))
+OCIOSO_APOS = float(os.getenv("PRE_GERACAO_OCIOSO_APOS", "30"))
+# Onde contar a popularidade. Só o líder do cluster pré-gera: com "memoria" ele vê só os pedidos dos próprios shards.
+BACKEND_POPULARIDADE = os.getenv("PRE_GERACAO_BACKEND", "memoria")
+CAMINHO_POPULARIDADE = os.getenv("PRE_GERACAO_PATH", "data/popularidade.db")
+MEIA_VIDA = 6 * 3600
+MAX_TEMAS = 5000
+
+
+class ContadorPopularidade:
+    """Conta pedidos por (tipo, tema) com decaimento exponencial, para favorecer o que é popular agora.
+
+    Esta versão fica na memória do processo; as compartilhadas somam os pedidos de todo o cluster.
+    """
+
+    def __init__(self, meia_vida: float = MEIA_VIDA):
+        self.meia_vida = meia_vida
+        self.pontuacoes = {}
+
+    def _decair(self, pontuacao, desde, agora):
+        return pontuacao * 2 ** (-(agora - desde) / self.meia_vida)
+
+    async def registrar(self, tipo: str, tema: str):
+        agora = time.time()
+        chave = (tipo, normalizar_chave(tema))
+        pontuacao, desde, _ = self.pontuacoes.get(chave, (0.0, agora, tema))
+        self.pontuacoes[chave] = (self._decair(pontuacao, desde, agora) + 1, agora, tema)
+        if len(self.pontuacoes) > MAX_TEMAS:
+            self._podar(agora)
+
+    def _podar(self, agora):
+        ordenados = sorted(self.pontuacoes.items(), key=lambda item: self._decair(item[1][0], item[1][1], agora))
+        for chave, _ in ordenados[:len(ordenados) - MAX_TEMAS // 2]:
+            del self.pontuacoes[chave]
+
+    async def mais_populares(self, n: int) -> list:
+        """Devolve os `n` pares (tipo, tema original) mais pedidos."""
+        agora = time.time()
+        ordenados = sorted(
+            self.pontuacoes.items(),
+            key=lambda item: self._decair(item[1][0], item[1][1], agora),
+            reverse=True,
+        )
+        return [(tipo, tema) for (tipo, _), (_, _, tema) in ordenados[:n]]
+
+    async def ultimo_pedido(self):
+        """Horário (time.time) do último pedido em todo o cluster, ou None se só este processo é contado."""
+        return None
+
+
+def somar_log2(a: float, b: float) -> float:
+    """log2(2**a + 2**b) sem estourar o float."""
+    maior, menor = max(a, b), min(a, b)
+    return maior + math.log2(1 + 2 ** (menor - maior))
+
+
+class ContadorPopularidadeSQLite(ContadorPopularidade):
+    """Popularidade num arquivo SQLite, somando os pedidos dos processos de uma mesma máquina.
+
+    Cada pedido vale 2**(t / meia_vida): comparar essas somas é o mesmo que comparar as contagens já decaídas,
+    sem precisar reescrever as outras linhas. A coluna guarda o log2 da soma, que não estoura.
+    """
+
+    def __init__(self, meia_vida: float = MEIA_VIDA, caminho: str = CAMINHO_POPULARIDADE):
+        super().__init__(meia_vida)
+        # Transações controladas à mão: BEGIN IMMEDIATE evita que dois processos somem sobre o mesmo valor antigo.
+        self.conn, self.lock = abrir_sqlite(caminho, isolation_level=None)
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS popularidade (
+                    tipo TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    tema TEXT NOT NULL,
+                    pontuacao REAL NOT NULL,
+                    pedido_em REAL NOT NULL,
+                    PRIMARY KEY (tipo, chave)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_popularidade_pontuacao ON popularidade (pontuacao)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_popularidade_pedido ON popularidade (pedido_em)")
+
+    def _registrar(self, tipo: str, tema: str):
+        agora = time.time()
+        chave = normalizar_chave(tema)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self.conn.execute(
+                    "SELECT pontuacao FROM popularidade WHERE tipo = ? AND chave = ?", (tipo, chave)
+                ).fetchone()
+                pontuacao = agora / self.meia_vida
+                if linha is not None:
+                    pontuacao = somar_log2(linha[0], pontuacao)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO popularidade (tipo, chave, tema, pontuacao, pedido_em) VALUES (?, ?, ?, ?, ?)",
+                    (tipo, chave, tema, pontuacao, agora),
+                )
+                (total,) = self.conn.execute("SELECT COUNT(*) FROM popularidade").fetchone()
+                if total > MAX_TEMAS:
+                    self.conn.execute(
+                        "DELETE FROM popularidade WHERE rowid IN (SELECT rowid FROM popularidade ORDER BY pontuacao LIMIT ?)",
+                        (total - MAX_TEMAS // 2,),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _mais_populares(self, n: int) -> list:
+        with self.lock:
+            return self.conn.execute("SELECT tipo, tema FROM popularidade ORDER BY pontuacao DESC LIMIT ?", (n,)).fetchall()
+
+    def _ultimo_pedido(self):
+        with self.lock:
+            (ultimo,) = self.conn.execute("SELECT MAX(pedido_em) FROM popularidade").fetchone()
+        return ultimo
+
+    async def registrar(self, tipo: str, tema: str):
+        await no_executor(self._registrar, tipo, tema)
+
+    async def mais_populares(self, n: int) -> list:
+        return [tuple(linha) for linha in await no_executor(self._mais_populares, n)]
+
+    async def ultimo_pedido(self):
+        return await no_executor(self._ultimo_pedido)
+
+
+# Mesma conta do SQLite, atômica no Redis. Lua 5.1: math.log só tem base e.
+_SCRIPT_POPULARIDADE = """
+local pontuacao = tonumber(ARGV[2])
+local atual = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+if atual then
+    local maior, menor = math.max(atual, pontuacao), math.min(atual, pontuacao)
+    pontuacao = maior + math.log(1 + 2 ^ (menor - maior)) / math.log(2)
+end
+redis.call('ZADD', KEYS[1], pontuacao, ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('SET', KEYS[3], ARGV[4])
+local total, maximo = redis.call('ZCARD', KEYS[1]), tonumber(ARGV[5])
+if total > maximo then
+    local removidos = redis.call('ZRANGE', KEYS[1], 0, total - math.floor(maximo / 2) - 1)
+    redis.call('ZREM', KEYS[1], unpack(removidos))
+    redis.call('HDEL', KEYS[2], unpack(removidos))
+end
+return 1
+"""
+
+
+class ContadorPopularidadeRedis(ContadorPopularidade):
+    """Popularidade no Redis, somando os pedidos de processos e máquinas. Mesma pontuação do SQLite."""
+
+    def __init__(self, meia_vida: float = MEIA_VIDA):
+        super().__init__(meia_vida)
+        self.redis = cliente_redis()
+        self.script = self.redis.register_script(_SCRIPT_POPULARIDADE)
+        self.chave_pontuacoes = f"{PREFIXO}popularidade"
+        self.chave_temas = f"{PREFIXO}popularidade:temas"
+        self.chave_ultimo = f"{PREFIXO}popularidade:ultimo"
+
+    async def registrar(self, tipo: str, tema: str):
+        agora = time.time()
+        await self.script(
+            keys=[self.chave_pontuacoes, self.chave_temas, self.chave_ultimo],
+            args=[f"{tipo}:{normalizar_chave(tema)}", agora / self.meia_vida, tema, agora, MAX_TEMAS],
+        )
+
+    async def mais_populares(self, n: int) -> list:
+        membros = await self.redis.zrevrange(self.chave_pontuacoes, 0, n - 1)
+        if not membros:
+            return []
+        temas = await self.redis.hmget(self.chave_temas, membros)
+        return [(membro.split(":", 1)[0], tema) for membro, tema in zip(membros, temas) if tema is not None]
+
+    async def ultimo_pedido(self):
+        ultimo = await self.redis.get(self.chave_ultimo)
+        return float(ultimo) if ultimo is not None else None
+
+
+BACKENDS = {
+    "memoria": ContadorPopularidade,
+    "sqlite": ContadorPopularidadeSQLite,
+    "redis": ContadorPopularidadeRedis,
+}
+
+
+def criar_contador(backend: str = BACKEND_POPULARIDADE) -> ContadorPopularidade:
+    """Cria o contador configurado em PRE_GERACAO_BACKEND ('memoria', 'sqlite' ou 'redis')."""
+    if backend not in BACKENDS:
+        raise ValueError(f"PRE_GERACAO_BACKEND inválido: '{backend}'. Use um destes: {', '.join(BACKENDS)}.")
+    return BACKENDS[backend]()
+
+
+class AgendadorPreGeracao:
+    """Pré-gera conteúdo para os temas mais pedidos enquanto o bot está ocioso, dentro de um orçamento de chamadas.
+
+    O orçamento conta as chamadas que chegam de fato à Gemini, não as pré-gerações: uma só pode virar vários
+    lotes e rodadas. Ele é conferido antes de cada tema, então o último pode passar um pouco do limite.
+    """
+
+    def __init__(self, bot, top_n: int = TOP_N, orcamento_por_hora: int = ORCAMENTO_POR_HORA,
+                 intervalo: float = INTERVALO, ocioso_apos: float = OCIOSO_APOS):
+        self.bot = bot
+        self.top_n = top_n
+        self.orcamento_por_hora = orcamento_por_hora
+        self.intervalo = intervalo
+        self.ocioso_apos = ocioso_apos
+        self.contador = criar_contador()
+        self.chamadas = deque()
+        self.ultima_atividade = time.monotonic()
+        self.registros = set()
+        self.task = None
+
+    def registrar(self, tipo: str, tema: str):
+        """Chamado pelos cogs a cada pedido de usuário; a contagem segue em segundo plano, sem atrasar o comando."""
+        self.ultima_atividade = time.monotonic()
+        tarefa = asyncio.create_task(self._registrar(tipo, tema))
+        self.registros.add(tarefa)
+        tarefa.add_done_callback(self.registros.discard)
+
+    async def _registrar(self, tipo: str, tema: str):
+        try:
+            await self.contador.registrar(tipo, tema)
+        except Exception as e:
+            registrar_evento("pre_geracao_contagem_falhou", nivel=logging.WARNING, tipo=tipo, erro=type(e).__name__, detalhe=str(e))
+
+    async def ocioso(self) -> bool:
+        if time.monotonic() - self.ultima_atividade < self.ocioso_apos:
+            return False
+        # Com contador compartilhado, o cluster inteiro precisa estar ocioso, não só os shards deste processo.
+        ultimo = await self.contador.ultimo_pedido()
+        return ultimo is None or time.time() - ultimo >= self.ocioso_apos
+
+    def tem_orcamento(self) -> bool:
+        limite = time.monotonic() - 3600
+        while self.chamadas and self.chamadas[0] < limite:
+            self.chamadas.popleft()
+        return len(self.chamadas) < self.orcamento_por_hora
+
+    def iniciar(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._executar())
+
+    def parar(self):
+        if self.task:
+            self.task.cancel()
+
+    async def _executar(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.intervalo)
+            try:
+                if await self.ocioso():
+                    await self.pre_gerar_populares()
+            except Exception as e:
+                registrar_evento("pre_geracao_falhou", nivel=logging.ERROR, erro=type(e).__name__, detalhe=str(e))
+
+    async def pre_gerar_populares(self):
+        for tipo, tema in await self.contador.mais_populares(self.top_n):
+            if not await self.ocioso() or not self.tem_orcamento():
+                return
+            cog = self.bot.get_cog(COGS_POR_TIPO[tipo])
+            if cog is None:
+                continue
+            with contar_chamadas() as contagem:
+                try:
+                    chamou_modelo = await cog.pre_gerar(tema)
+                except Exception as e:
+                    registrar_evento("pre_geracao_falhou", nivel=logging.ERROR, tipo=tipo, tema=tema, erro=type(e).__name__, detalhe=str(e))
+                    chamou_modelo = False
+            # Chamadas que falharam também gastaram cota.
+            self.chamadas.extend([time.monotonic()] * contagem.total)
+            if chamou_modelo:
+                registrar_evento("pre_geracao", tipo=tipo, tema=tema, chamadas=contagem.total)
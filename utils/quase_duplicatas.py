@@ -0,0 +1,72 @@
+import hashlib
+import os
+from array import array
+
+from utils.texto import normalizar_chave
+
+# Assinatura MinHash de NUM_PERMUTACOES valores, dividida em BANDAS faixas de LINHAS_POR_BANDA para o LSH.
+# Com 16 x 4, pares com similaridade de Jaccard 0.75 viram candidatos com probabilidade > 99.7%.
+NUM_PERMUTACOES = 64
+BANDAS = 16
+LINHAS_POR_BANDA = NUM_PERMUTACOES // BANDAS
+TAMANHO_SHINGLE = 2
+LIMIAR = float(os.getenv("QUASE_DUPLICATA_LIMIAR", "0.75"))
+VAZIO = 0xFFFFFFFF
+
+
+def _hash64(texto: str) -> int:
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(texto: str) -> set:
+    palavras = normalizar_chave(texto).split()
+    if len(palavras) <= TAMANHO_SHINGLE:
+        return {" ".join(palavras)} if palavras else set()
+    return {" ".join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+
+
+def texto_questao(q) -> str:
+    """Enunciado mais as alternativas em ordem alfabética, para que embaralhar as letras não esconda a repetição."""
+    if isinstance(q, dict):
+        pergunta, opcoes = q["pergunta"], [str(v) for v in q["opcoes"].values()]
+    else:
+        pergunta, opcoes = q.pergunta, list(q.opcoes)
+    return " ".join([str(pergunta), *sorted(normalizar_chave(o) for o in opcoes)])
+
+
+def assinatura(texto: str) -> array:
+    """MinHash de uma permutação só (one permutation hashing): cada shingle é hasheado uma única vez e cai em
+    um dos NUM_PERMUTACOES compartimentos, que guardam o menor valor. Compartimentos vazios são preenchidos
+    pelo vizinho da direita (densificação por rotação), para que textos curtos continuem comparáveis."""
+    valores = [VAZIO] * NUM_PERMUTACOES
+    for shingle in shingles(texto):
+        h = _hash64(shingle)
+        compartimento = h % NUM_PERMUTACOES
+        valor = h >> 32
+        if valor < valores[compartimento]:
+            valores[compartimento] = valor
+    if all(v == VAZIO for v in valores):
+        return array("I", valores)
+    for i in range(NUM_PERMUTACOES):
+        distancia = 0
+        j = i
+        while valores[j] == VAZIO:
+            j = (j + 1) % NUM_PERMUTACOES
+            distancia += 1
+        if distancia:
+            valores[i] = (valores[j] + distancia * 0x9E3779B1) & 0xFFFFFFFF
+    return array("I", valores)
+
+
+def chaves_bandas(sig: array) -> list:
+    """Uma chave de 63 bits por banda; questões parecidas tendem a coincidir em pelo menos uma."""
+    chaves = []
+    for banda in range(BANDAS):
+        trecho = sig[banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA].tobytes()
+        chaves.append(int.from_bytes(hashlib.blake2b(trecho, digest_size=8).digest(), "little") >> 1)
+    return chaves
+
+
+def similaridade(a: array, b: array) -> float:
+    """Estimativa da similaridade de Jaccard entre os textos das duas assinaturas."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERMUTACOES
@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from utils.sqlite import abrir_sqlite, no_executor
+from utils.texto import hash_texto, normalizar_chave
+
+CAMINHO_REVISAO = os.getenv("REVISAO_PATH", "data/revisao.db")
+FACILIDADE_INICIAL = 2.5
+FACILIDADE_MINIMA = 1.3
+SEGUNDOS_POR_DIA = 86400
+
+
+@dataclass(slots=True, frozen=True)
+class Flashcard:
+    frente: str
+    verso: str
+    topico_para_revisao: str = ""
+
+    @classmethod
+    def de_dict(cls, dados: dict) -> "Flashcard":
+        return cls(
+            frente=str(dados["frente"]), verso=str(dados["verso"]),
+            topico_para_revisao=sys.intern(str(dados.get("topico_para_revisao") or "")),
+        )
+
+    def hash(self) -> str:
+        return hash_texto(normalizar_chave(self.frente), normalizar_chave(self.verso))
+
+
+def sm2(facilidade: float, intervalo: float, repeticoes: int, nota: int):
+    """Um passo do SM-2: recebe o estado do card e a nota (0 a 5) e devolve (facilidade, intervalo em dias, repetições)."""
+    if nota >= 3:
+        if repeticoes == 0:
+            intervalo = 1
+        elif repeticoes == 1:
+            intervalo = 6
+        else:
+            intervalo = round(intervalo * facilidade)
+        repeticoes += 1
+    else:
+        repeticoes = 0
+        intervalo = 1
+    facilidade = max(FACILIDADE_MINIMA, facilidade + 0.1 - (5 - nota) * (0.08 + (5 - nota) * 0.02))
+    return facilidade, intervalo, repeticoes
+
+
+class BaralhoRevisao:
+    """Baralho persistente de cada usuário (SQLite), com o estado de revisão espaçada de cada card.
+
+    O conteúdo dos cards é guardado uma vez só e compartilhado entre usuários; o estado de cada
+    usuário fica em `revisoes`, indexado pela data de vencimento.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_REVISAO):
+        self.conn, self.lock = abrir_sqlite(caminho)
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS flashcards (
+                    id INTEGER PRIMARY KEY,
+                    tema TEXT NOT NULL,
+                    hash TEXT NOT NULL UNIQUE,
+                    dados TEXT NOT NULL,
+                    criado_em REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS revisoes (
+                    user_id INTEGER NOT NULL,
+                    card_id INTEGER NOT NULL,
+                    tema TEXT NOT NULL,
+                    facilidade REAL NOT NULL,
+                    intervalo REAL NOT NULL,
+                    repeticoes INTEGER NOT NULL,
+                    vence_em REAL NOT NULL,
+                    PRIMARY KEY (user_id, card_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_revisoes_vencimento ON revisoes (user_id, tema, vence_em);
+            """)
+
+    def _vencidos(self, user_id: int, tema: str, quantidade: int) -> list:
+        with self.lock:
+            linhas = self.conn.execute(
+                """
+                SELECT r.card_id, f.dados FROM revisoes r JOIN flashcards f ON f.id = r.card_id
+                WHERE r.user_id = ? AND r.tema = ? AND r.vence_em <= ?
+                ORDER BY r.vence_em LIMIT ?
+                """,
+                (user_id, normalizar_chave(tema), time.time(), quantidade),
+            ).fetchall()
+        return [(card_id, Flashcard.de_dict(json.loads(dados))) for card_id, dados in linhas]
+
+    def _adicionar(self, user_id: int, tema: str, cards, limite: int = None) -> list:
+        tema_norm = normalizar_chave(tema)
+        agora = time.time()
+        novos = []
+        with self.lock, self.conn:
+            for card in cards:
+                if limite is not None and len(novos) >= limite:
+                    break
+                h = card.hash()
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO flashcards (tema, hash, dados, criado_em) VALUES (?, ?, ?, ?)",
+                    (tema_norm, h, json.dumps(asdict(card), ensure_ascii=False), agora),
+                )
+                (card_id,) = self.conn.execute("SELECT id FROM flashcards WHERE hash = ?", (h,)).fetchone()
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO revisoes (user_id, card_id, tema, facilidade, intervalo, repeticoes, vence_em) "
+                    "VALUES (?, ?, ?, ?, 0, 0, ?)",
+                    (user_id, card_id, tema_norm, FACILIDADE_INICIAL, agora),
+                )
+                if cursor.rowcount:
+                    novos.append((card_id, card))
+        return novos
+
+    def _registrar(self, user_id: int, card_id: int, nota: int):
+        with self.lock, self.conn:
+            linha = self.conn.execute(
+                "SELECT facilidade, intervalo, repeticoes FROM revisoes WHERE user_id = ? AND card_id = ?", (user_id, card_id)
+            ).fetchone()
+            if linha is None:
+                return
+            facilidade, intervalo, repeticoes = sm2(*linha, nota)
+            self.conn.execute(
+                "UPDATE revisoes SET facilidade = ?, intervalo = ?, repeticoes = ?, vence_em = ? WHERE user_id = ? AND card_id = ?",
+                (facilidade, intervalo, repeticoes, time.time() + intervalo * SEGUNDOS_POR_DIA, user_id, card_id),
+            )
+
+    async def vencidos(self, user_id: int, tema: str, quantidade: int) -> list:
+        """Até `quantidade` pares (card_id, Flashcard) do tema que já venceram, os mais atrasados primeiro."""
+        return await no_executor(self._vencidos, user_id, tema, quantidade)
+
+    async def adicionar(self, user_id: int, tema: str, cards, limite: int = None) -> list:
+        """Coloca os cards no baralho do usuário e devolve (card_id, Flashcard) só dos que ele ainda não tinha.
+
+        Com `limite`, para depois de tantos cards novos: os demais não entram no baralho nem ficam vencidos.
+        """
+        return await no_executor(self._adicionar, user_id, tema, cards, limite)
+
+    async def registrar(self, user_id: int, card_id: int, nota: int):
+        """Aplica a nota de uma revisão (0 a 5) e reagenda o card."""
+        await no_executor(self._registrar, user_id, card_id, nota)
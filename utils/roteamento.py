@@ -0,0 +1,201 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from utils.metricas import HEDGES, LATENCIA_MODELO, ROTAS, registrar_evento
+
+MODELO_QUALIDADE = os.getenv("GEMINI_MODELO_QUALIDADE", "gemini-1.5-pro")
+MODELO_RAPIDO = os.getenv("GEMINI_MODELO_RAPIDO", "gemini-1.5-flash")
+# Latências guardadas por modelo: as mais recentes, dentro da janela de tempo. Com menos de AMOSTRAS_MINIMAS a
+# política usa só o orçamento; a janela de tempo faz um modelo evitado voltar a ser tentado quando ela esvazia.
+JANELA_LATENCIA = int(os.getenv("ROTEAMENTO_JANELA", "200"))
+JANELA_SEGUNDOS = float(os.getenv("ROTEAMENTO_JANELA_SEGUNDOS", "300"))
+AMOSTRAS_MINIMAS = 20
+# Se o primário perde para o hedge em mais que esta fração das chamadas, a rota vai direto ao modelo rápido.
+LIMITE_DERROTAS_HEDGE = 0.2
+# Sem histórico do primário, o hedge sai nesta fração do orçamento.
+FRACAO_HEDGE_SEM_DADOS = 0.5
+# Prazo mínimo do hedge: sem ele, um primário no limite do orçamento dispararia o hedge no instante zero,
+# dobrando o custo de todo pedido.
+PRAZO_MINIMO_HEDGE = float(os.getenv("ROTEAMENTO_PRAZO_MINIMO_HEDGE", "1"))
+
+
+@dataclass(frozen=True, slots=True)
+class PoliticaRota:
+    primario: str
+    # Modelo do hedge e da rota de escape quando o primário estoura o orçamento. Pode ser o próprio primário:
+    # aí o hedge é uma cópia do pedido, que corta a cauda de latência sem trocar de modelo.
+    rapido: str
+    # Segundos que o usuário deve esperar, no máximo, pela resposta completa.
+    orcamento: float
+
+
+POLITICAS = {
+    "simulado": PoliticaRota(MODELO_QUALIDADE, MODELO_RAPIDO, float(os.getenv("ROTEAMENTO_ORCAMENTO_SIMULADO", "30"))),
+    "flashcards": PoliticaRota(MODELO_QUALIDADE, MODELO_RAPIDO, float(os.getenv("ROTEAMENTO_ORCAMENTO_FLASHCARDS", "25"))),
+    "explique": PoliticaRota(MODELO_RAPIDO, MODELO_RAPIDO, float(os.getenv("ROTEAMENTO_ORCAMENTO_EXPLIQUE", "15"))),
+}
+
+
+@dataclass(slots=True)
+class Rota:
+    modelo: str
+    motivo: str
+    # Modelo e segundos até o hedge; None quando a rota não tem hedge.
+    hedge: str = None
+    prazo_hedge: float = None
+
+
+class LatenciaModelos:
+    """Janela deslizante da latência de cada modelo, normalizada pelo tamanho do pedido (questões, cards).
+
+    A latência cresce com a quantidade de itens gerados; dividir pelo tamanho deixa comparáveis pedidos de
+    3 e de 10 questões, ao custo de superestimar um pouco os pedidos pequenos. Primários que perderam para o
+    hedge entram com o tempo que duraram até ali (um limite inferior) e marcados como interrompidos.
+    """
+
+    def __init__(self, janela: int = JANELA_LATENCIA, janela_segundos: float = JANELA_SEGUNDOS):
+        self.janela = janela
+        self.janela_segundos = janela_segundos
+        self.amostras = {}
+
+    def registrar(self, modelo: str, duracao: float, tamanho: int = 1, interrompida: bool = False):
+        amostras = self.amostras.get(modelo)
+        if amostras is None:
+            amostras = self.amostras[modelo] = deque(maxlen=self.janela)
+            LATENCIA_MODELO.acompanhar(lambda: self.p95(modelo, minimo=1) or 0.0, modelo=modelo)
+        amostras.append((time.monotonic(), duracao / max(1, tamanho), interrompida))
+
+    def _recentes(self, modelo: str) -> deque:
+        amostras = self.amostras.get(modelo)
+        if amostras is None:
+            return ()
+        limite = time.monotonic() - self.janela_segundos
+        while amostras and amostras[0][0] < limite:
+            amostras.popleft()
+        return amostras
+
+    def p95(self, modelo: str, tamanho: int = 1, minimo: int = AMOSTRAS_MINIMAS):
+        """p95 estimado para um pedido de `tamanho` itens, ou None sem amostras suficientes."""
+        amostras = self._recentes(modelo)
+        if len(amostras) < minimo:
+            return None
+        ordenadas = sorted(duracao for _, duracao, _ in amostras)
+        return ordenadas[math.ceil(0.95 * len(ordenadas)) - 1] * max(1, tamanho)
+
+    def fracao_interrompida(self, modelo: str, minimo: int = AMOSTRAS_MINIMAS):
+        amostras = self._recentes(modelo)
+        if len(amostras) < minimo:
+            return None
+        return sum(1 for _, _, interrompida in amostras if interrompida) / len(amostras)
+
+
+class RoteadorModelos:
+    """Escolhe o modelo de cada chamada pela política do comando e faz hedge quando o primário demora.
+
+    Fica sobre o GatewayGemini: o hedge passa pelos mesmos limites de concorrência, cota e circuit breaker.
+    """
+
+    def __init__(self, gateway, politicas: dict = POLITICAS, latencias: LatenciaModelos = None):
+        self.gateway = gateway
+        self.politicas = politicas
+        self.latencias = latencias or LatenciaModelos()
+        self.hedges_disparados = 0
+        self.hedges_vencedores = 0
+
+    def escolher(self, comando: str, tamanho: int = 1) -> Rota:
+        politica = self.politicas[comando]
+        p95_primario = self.latencias.p95(politica.primario, tamanho)
+        p95_rapido = self.latencias.p95(politica.rapido, tamanho)
+        # O p95 do primário não passa muito do prazo do hedge, porque as chamadas lentas são canceladas nele;
+        # perder para o hedge com frequência é o sinal de que ele não cabe no orçamento.
+        derrotas = self.latencias.fracao_interrompida(politica.primario)
+        lento = (p95_primario is not None and p95_primario > politica.orcamento) or (
+            derrotas is not None and derrotas > LIMITE_DERROTAS_HEDGE
+        )
+        if lento and politica.rapido != politica.primario and (p95_rapido is None or p95_primario is None or p95_rapido < p95_primario):
+            rota = Rota(politica.rapido, "orcamento")
+        else:
+            # O hedge sai quando o primário entra na cauda (passou do seu p95), mas a tempo de o rápido caber no orçamento.
+            prazo = p95_primario if p95_primario is not None else politica.orcamento * FRACAO_HEDGE_SEM_DADOS
+            if p95_rapido is not None:
+                prazo = min(prazo, politica.orcamento - p95_rapido)
+            if prazo > 0:
+                rota = Rota(politica.primario, "primario", politica.rapido, max(PRAZO_MINIMO_HEDGE, prazo))
+            else:
+                # Nem o rápido cabe mais no orçamento: um hedge só dobraria o custo sem chegar a tempo.
+                rota = Rota(politica.primario, "primario")
+        ROTAS.incrementar(comando=comando, modelo=rota.modelo, motivo=rota.motivo)
+        return rota
+
+    async def _tentar(self, modelo: str, prompt: str, tamanho: int, validar, generation_config):
+        inicio = time.perf_counter()
+        response = await self.gateway.gerar(modelo, prompt, generation_config=generation_config)
+        self.latencias.registrar(modelo, time.perf_counter() - inicio, tamanho)
+        return await validar(response)
+
+    async def gerar(self, comando: str, prompt: str, validar, tamanho: int = 1, generation_config=None):
+        """Gera pela rota do comando e devolve `await validar(response)`; None ou vazio conta como resposta inválida.
+
+        Se o primário não tiver respondido até o prazo do hedge, ou falhar antes dele, o mesmo pedido vai ao
+        modelo do hedge e vale a primeira resposta válida; a outra chamada é cancelada. Se nenhuma for
+        válida, levanta o primeiro erro ou devolve None.
+        """
+        rota = self.escolher(comando, tamanho)
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        limite_hedge = loop.time() + rota.prazo_hedge if rota.hedge else None
+        tarefas = {asyncio.ensure_future(self._tentar(rota.modelo, prompt, tamanho, validar, generation_config)): "primario"}
+        primeiro_erro = None
+        hedge_disparado = False
+
+        def disparar_hedge():
+            nonlocal hedge_disparado
+            hedge_disparado = True
+            self.hedges_disparados += 1
+            registrar_evento("hedge", comando=comando, primario=rota.modelo, hedge=rota.hedge, prazo_s=round(rota.prazo_hedge, 2))
+            tarefas[asyncio.ensure_future(self._tentar(rota.hedge, prompt, tamanho, validar, generation_config))] = "hedge"
+
+        try:
+            while tarefas:
+                espera = None if hedge_disparado or limite_hedge is None else max(0.0, limite_hedge - loop.time())
+                prontas, _ = await asyncio.wait(tarefas, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+                if not prontas:
+                    disparar_hedge()
+                    continue
+                for tarefa in prontas:
+                    origem = tarefas.pop(tarefa)
+                    try:
+                        resultado = tarefa.result()
+                    except Exception as e:
+                        primeiro_erro = primeiro_erro or e
+                        continue
+                    if resultado:
+                        if hedge_disparado:
+                            HEDGES.incrementar(comando=comando, vencedor=origem)
+                        if origem == "hedge":
+                            self.hedges_vencedores += 1
+                            if "primario" in tarefas.values():
+                                # O primário perdeu para o hedge e vai ser cancelado: a latência real dele é pelo menos
+                                # esta, e ignorá-la deixaria o p95 otimista. Cancelamentos de quem chamou não contam.
+                                self.latencias.registrar(rota.modelo, time.perf_counter() - inicio, tamanho, interrompida=True)
+                        return resultado
+                if limite_hedge is not None and not hedge_disparado:
+                    # O primário falhou antes do prazo: o hedge vira a segunda tentativa imediata.
+                    disparar_hedge()
+        finally:
+            for tarefa in tarefas:
+                if tarefa.done() and not tarefa.cancelled():
+                    tarefa.exception()
+                tarefa.cancel()
+        if hedge_disparado:
+            HEDGES.incrementar(comando=comando, vencedor="nenhum")
+        if primeiro_erro is not None:
+            raise primeiro_erro
+        return None
+
+    def estatisticas(self) -> dict:
+        return {"hedges_disparados": self.hedges_disparados, "hedges_vencedores": self.hedges_vencedores}
@@ -0,0 +1,268 @@
+import copy
+import dataclasses
+import json
+import os
+import sys
+import time
+
+from utils.agendador import AgendadorTimers
+from utils.compartilhado import PREFIXO, cliente_redis
+from utils.metricas import SESSOES_ATIVAS, SESSOES_BYTES
+from utils.sqlite import abrir_sqlite, no_executor
+
+BACKEND_SESSOES = os.getenv("SESSOES_BACKEND", "memoria")
+CAMINHO_SESSOES = os.getenv("SESSOES_PATH", "data/sessoes.db")
+
+
+class ArmazemSessoes:
+    """Interface dos armazenamentos de sessões em andamento (simulados, flashcards, pomodoros).
+
+    Os dados são dicionários serializáveis em JSON, indexados por uma chave (em geral o id do usuário).
+    """
+
+    async def salvar(self, chave, dados: dict):
+        raise NotImplementedError
+
+    async def obter(self, chave):
+        raise NotImplementedError
+
+    async def remover(self, chave):
+        raise NotImplementedError
+
+    async def carregar_todas(self) -> dict:
+        raise NotImplementedError
+
+    async def remover_inativas(self, idade_maxima: float) -> int:
+        """Apaga as sessões salvas há mais de `idade_maxima` segundos e devolve quantas foram apagadas."""
+        raise NotImplementedError
+
+
+class ArmazemSessoesMemoria(ArmazemSessoes):
+    """Padrão: rápido, mas as sessões se perdem quando o processo reinicia."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.dados = {}
+        self.atualizado_em = {}
+
+    async def salvar(self, chave, dados: dict):
+        self.dados[str(chave)] = copy.deepcopy(dados)
+        self.atualizado_em[str(chave)] = time.time()
+
+    async def obter(self, chave):
+        dados = self.dados.get(str(chave))
+        return copy.deepcopy(dados) if dados is not None else None
+
+    async def remover(self, chave):
+        self.dados.pop(str(chave), None)
+        self.atualizado_em.pop(str(chave), None)
+
+    async def carregar_todas(self) -> dict:
+        return copy.deepcopy(self.dados)
+
+    async def remover_inativas(self, idade_maxima: float) -> int:
+        limite = time.time() - idade_maxima
+        vencidas = [chave for chave, quando in self.atualizado_em.items() if quando < limite]
+        for chave in vencidas:
+            await self.remover(chave)
+        return len(vencidas)
+
+
+class ArmazemSessoesSQLite(ArmazemSessoes):
+    """Guarda o estado das sessões em andamento para que sobrevivam a um reinício do bot."""
+
+    def __init__(self, namespace: str, caminho: str = CAMINHO_SESSOES):
+        self.namespace = namespace
+        self.conn, self.lock = abrir_sqlite(caminho)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessoes (
+                    namespace TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    dados TEXT NOT NULL,
+                    atualizado_em REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, chave)
+                )
+            """)
+            colunas = {linha[1] for linha in self.conn.execute("PRAGMA table_info(sessoes)")}
+            if "atualizado_em" not in colunas:
+                self.conn.execute("ALTER TABLE sessoes ADD COLUMN atualizado_em REAL NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_atualizado ON sessoes (namespace, atualizado_em)")
+
+    def _salvar(self, chave, dados: dict):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessoes (namespace, chave, dados, atualizado_em) VALUES (?, ?, ?, ?)",
+                (self.namespace, str(chave), json.dumps(dados, ensure_ascii=False), time.time()),
+            )
+
+    def _obter(self, chave):
+        with self.lock:
+            linha = self.conn.execute(
+                "SELECT dados FROM sessoes WHERE namespace = ? AND chave = ?", (self.namespace, str(chave))
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def _remover(self, chave):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessoes WHERE namespace = ? AND chave = ?", (self.namespace, str(chave)))
+
+    def _carregar_todas(self) -> dict:
+        with self.lock:
+            linhas = self.conn.execute("SELECT chave, dados FROM sessoes WHERE namespace = ?", (self.namespace,)).fetchall()
+        return {chave: json.loads(dados) for chave, dados in linhas}
+
+    def _remover_inativas(self, idade_maxima: float) -> int:
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM sessoes WHERE namespace = ? AND atualizado_em < ?", (self.namespace, time.time() - idade_maxima)
+            )
+        return cursor.rowcount
+
+    async def salvar(self, chave, dados: dict):
+        await no_executor(self._salvar, chave, dados)
+
+    async def obter(self, chave):
+        return await no_executor(self._obter, chave)
+
+    async def remover(self, chave):
+        await no_executor(self._remover, chave)
+
+    async def carregar_todas(self) -> dict:
+        return await no_executor(self._carregar_todas)
+
+    async def remover_inativas(self, idade_maxima: float) -> int:
+        return await no_executor(self._remover_inativas, idade_maxima)
+
+
+class ArmazemSessoesRedis(ArmazemSessoes):
+    """Sessões num Redis compartilhado: qualquer processo do cluster (ou de outra máquina) enxerga as mesmas sessões.
+
+    Um hash guarda os dados de cada sessão e um sorted set, a hora da última gravação, para a limpeza das inativas.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.redis = cliente_redis()
+        self.chave_dados = f"{PREFIXO}sessoes:{namespace}"
+        self.chave_atualizacoes = f"{PREFIXO}sessoes:{namespace}:atualizado_em"
+
+    async def salvar(self, chave, dados: dict):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.chave_dados, str(chave), json.dumps(dados, ensure_ascii=False))
+            pipe.zadd(self.chave_atualizacoes, {str(chave): time.time()})
+            await pipe.execute()
+
+    async def obter(self, chave):
+        dados = await self.redis.hget(self.chave_dados, str(chave))
+        return json.loads(dados) if dados is not None else None
+
+    async def remover(self, chave):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.chave_dados, str(chave))
+            pipe.zrem(self.chave_atualizacoes, str(chave))
+            await pipe.execute()
+
+    async def carregar_todas(self) -> dict:
+        return {chave: json.loads(dados) for chave, dados in (await self.redis.hgetall(self.chave_dados)).items()}
+
+    async def remover_inativas(self, idade_maxima: float) -> int:
+        vencidas = await self.redis.zrangebyscore(self.chave_atualizacoes, "-inf", time.time() - idade_maxima)
+        if not vencidas:
+            return 0
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.chave_dados, *vencidas)
+            pipe.zrem(self.chave_atualizacoes, *vencidas)
+            await pipe.execute()
+        return len(vencidas)
+
+
+def tamanho_profundo(obj, vistos: set = None) -> int:
+    """Bytes ocupados por `obj` e pelo que ele referencia (contêineres e dataclasses).
+
+    Objetos compartilhados, como as questões servidas a várias sessões, contam uma vez só
+    quando o mesmo `vistos` é usado em todas as medições.
+    """
+    vistos = set() if vistos is None else vistos
+    pendentes = [obj]
+    total = 0
+    while pendentes:
+        atual = pendentes.pop()
+        if id(atual) in vistos:
+            continue
+        vistos.add(id(atual))
+        total += sys.getsizeof(atual)
+        if isinstance(atual, dict):
+            pendentes.extend(atual.keys())
+            pendentes.extend(atual.values())
+        elif isinstance(atual, (list, tuple, set, frozenset)):
+            pendentes.extend(atual)
+        elif dataclasses.is_dataclass(atual) and not isinstance(atual, type):
+            pendentes.extend(getattr(atual, campo.name) for campo in dataclasses.fields(atual))
+    return total
+
+
+class ExpiracaoSessoes:
+    """Encerra sessões ociosas como o timeout de uma discord.ui.View: cada atividade reinicia o prazo.
+
+    As views das sessões são persistentes (timeout=None), então é aqui que a sessão sai da memória e do
+    armazenamento. Uma varredura periódica também apaga sessões salvas que ficaram para trás num reinício.
+    """
+
+    def __init__(self, nome: str, ativas: dict, armazem: ArmazemSessoes, ttl: float, ao_expirar=None):
+        self.nome = nome
+        self.ativas = ativas
+        self.armazem = armazem
+        self.ttl = ttl
+        self.ao_expirar = ao_expirar
+        self.agendador = AgendadorTimers()
+        self.expiradas = 0
+        SESSOES_ATIVAS.acompanhar(lambda: len(self.ativas), tipo=nome)
+
+    def iniciar(self):
+        self.agendador.iniciar()
+        self.agendador.agendar("varredura", time.monotonic(), self._varrer)
+
+    def parar(self):
+        self.agendador.parar()
+
+    def tocar(self, chave):
+        """Registra atividade na sessão e adia a expiração dela por mais `ttl` segundos."""
+        self.agendador.agendar(chave, time.monotonic() + self.ttl, lambda: self._expirar(chave))
+
+    def cancelar(self, chave):
+        self.agendador.cancelar(chave)
+
+    async def _expirar(self, chave):
+        sessao = self.ativas.pop(chave, None)
+        await self.armazem.remover(chave)
+        if sessao is not None:
+            self.expiradas += 1
+            if self.ao_expirar:
+                await self.ao_expirar(chave, sessao)
+
+    async def _varrer(self):
+        self.agendador.agendar("varredura", time.monotonic() + self.ttl, self._varrer)
+        await self.armazem.remover_inativas(self.ttl)
+        medida = self.medir()
+        SESSOES_BYTES.definir(medida["bytes"], tipo=self.nome)
+        if medida["sessoes"]:
+            print(f"Sessões de {self.nome}: {medida['sessoes']} ativas, {medida['bytes'] / 1024:.1f} KiB em memória.")
+
+    def medir(self) -> dict:
+        """Medidor das sessões vivas: quantas são e quantos bytes seguram."""
+        return {"sessoes": len(self.ativas), "bytes": tamanho_profundo(self.ativas), "expiradas": self.expiradas}
+
+
+BACKENDS = {
+    "memoria": ArmazemSessoesMemoria,
+    "sqlite": ArmazemSessoesSQLite,
+    "redis": ArmazemSessoesRedis,
+}
+
+
+def criar_armazem(namespace: str, backend: str = BACKEND_SESSOES) -> ArmazemSessoes:
+    """Cria o armazenamento configurado em SESSOES_BACKEND ('memoria', 'sqlite' ou 'redis')."""
+    if backend not in BACKENDS:
+        raise ValueError(f"SESSOES_BACKEND inválido: '{backend}'. Use um destes: {', '.join(BACKENDS)}.")
+    return BACKENDS[backend](namespace)
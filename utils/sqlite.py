@@ -0,0 +1,27 @@
+import asyncio
+import os
+import sqlite3
+import threading
+
+
+def abrir_sqlite(caminho: str, **opcoes):
+    """Abre o banco em modo WAL, criando a pasta se preciso, e devolve (conexão, trava).
+
+    A conexão é usada pelas threads do executor, então quem a usa segura a trava em cada acesso. O arquivo pode
+    ser compartilhado pelos processos do cluster: `timeout` espera a trava de escrita do SQLite em vez de
+    falhar, e o WAL deixa as leituras seguirem durante uma escrita.
+    """
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conn = sqlite3.connect(caminho, check_same_thread=False, timeout=30, **opcoes)
+    trava = threading.Lock()
+    with trava:
+        conn.execute("PRAGMA journal_mode=WAL")
+    return conn, trava
+
+
+async def no_executor(funcao, *args):
+    """Roda uma operação síncrona do banco no executor padrão, sem bloquear o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, funcao, *args)
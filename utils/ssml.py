@@ -0,0 +1,113 @@
+import re
+
+_TAG = re.compile(r"<[^>]+>")
+_TAG_QUALQUER = re.compile(r"<[^<]+?>")
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?…])\s+")
+# Espaço que não está dentro de uma tag: depois dele vem texto ou outra tag, nunca o `>` da tag atual.
+_ESPACO_FORA_DE_TAG = re.compile(r"\s+(?![^<]*>)")
+_NOME_TAG = re.compile(r"<\s*([\w:-]+)")
+
+LIMITE_BYTES_TTS = 4800
+TAMANHO_PRIMEIRO_TRECHO = 400
+TAMANHO_TRECHO = 1500
+
+
+def remover_tags(ssml: str) -> str:
+    """Texto puro do SSML, para exibir ou sintetizar sem marcação."""
+    return _TAG_QUALQUER.sub("", ssml)
+
+
+def _conteudo(ssml: str) -> str:
+    ssml = ssml.strip()
+    if ssml.startswith("<speak>"):
+        ssml = ssml[len("<speak>"):]
+    if ssml.endswith("</speak>"):
+        ssml = ssml[:-len("</speak>")]
+    return ssml.strip()
+
+
+def _unidades(conteudo: str) -> list:
+    """Quebra o SSML em frases, cortando só em pausas (<break/>) ou fins de frase fora de outras tags."""
+    unidades, atual = [], []
+    profundidade, pos = 0, 0
+
+    def fechar():
+        texto = "".join(atual).strip()
+        if texto:
+            unidades.append(texto)
+        atual.clear()
+
+    def adicionar_texto(texto):
+        if profundidade:
+            atual.append(texto)
+            return
+        partes = _FIM_DE_FRASE.split(texto)
+        for parte in partes[:-1]:
+            atual.append(parte)
+            fechar()
+        atual.append(partes[-1])
+
+    for m in _TAG.finditer(conteudo):
+        adicionar_texto(conteudo[pos:m.start()])
+        tag = m.group()
+        atual.append(tag)
+        if tag.startswith("</"):
+            profundidade = max(0, profundidade - 1)
+        elif not tag.endswith("/>"):
+            profundidade += 1
+        elif profundidade == 0 and tag.startswith("<break"):
+            fechar()
+        pos = m.end()
+    adicionar_texto(conteudo[pos:])
+    fechar()
+    return unidades
+
+
+def _quebrar_unidade(unidade: str, limite: int) -> list:
+    """Corta uma frase maior que o limite em espaços fora das tags (nunca dentro de `<break time="..."/>`).
+
+    Se o corte cair dentro de um elemento (ex.: `<prosody>`), ele é fechado no fim de um pedaço e reaberto,
+    com os mesmos atributos, no começo do seguinte: cada pedaço continua sendo SSML válido.
+    """
+    pedacos, atual, abertas = [], "", []
+
+    def fechamento():
+        return "".join(f"</{nome}>" for nome, _ in reversed(abertas))
+
+    for palavra in _ESPACO_FORA_DE_TAG.split(unidade):
+        candidato = f"{atual} {palavra}" if atual else palavra
+        if atual and len((candidato + fechamento()).encode("utf-8")) > limite:
+            pedacos.append(atual + fechamento())
+            candidato = "".join(tag for _, tag in abertas) + palavra
+        atual = candidato
+        for tag in _TAG.findall(palavra):
+            if tag.startswith("</"):
+                if abertas:
+                    abertas.pop()
+            elif not tag.endswith("/>"):
+                abertas.append((_NOME_TAG.match(tag).group(1), tag))
+    if atual:
+        pedacos.append(atual)
+    return pedacos
+
+
+def dividir_ssml(ssml: str, tamanho_primeiro: int = TAMANHO_PRIMEIRO_TRECHO, tamanho: int = TAMANHO_TRECHO,
+                 limite: int = LIMITE_BYTES_TTS) -> list:
+    """Divide o SSML em trechos <speak> independentes para síntese em paralelo.
+
+    O primeiro trecho é curto para a reprodução começar logo; os demais ficam
+    em torno de `tamanho` bytes e nunca passam de `limite` (limite de entrada do TTS).
+    """
+    trechos, atual = [], ""
+    alvo = tamanho_primeiro
+    for unidade in _unidades(_conteudo(ssml)):
+        for pedaco in ([unidade] if len(unidade.encode("utf-8")) <= limite else _quebrar_unidade(unidade, limite)):
+            candidato = f"{atual} {pedaco}" if atual else pedaco
+            if atual and len(candidato.encode("utf-8")) > alvo:
+                trechos.append(atual)
+                alvo = tamanho
+                candidato = pedaco
+            atual = candidato
+    if atual:
+        trechos.append(atual)
+    return [f"<speak>{trecho}</speak>" for trecho in trechos]
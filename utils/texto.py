@@ -0,0 +1,16 @@
+import hashlib
+import re
+import unicodedata
+
+
+def normalizar_chave(texto: str) -> str:
+    """Normaliza um tema/tópico para uso como chave (sem acentos, minúsculo, espaços simples)."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto.lower())
+    return " ".join(texto.split())
+
+
+def hash_texto(*partes: str) -> str:
+    """Gera um hash estável a partir das partes informadas."""
+    return hashlib.sha1("\x1f".join(partes).encode("utf-8")).hexdigest()
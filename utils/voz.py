@@ -0,0 +1,209 @@
+import asyncio
+import io
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import discord
+from discord.oggparse import OggStream
+
+from utils.metricas import ETAPAS, registrar_evento
+
+# Segundos que a conexão de voz fica aberta depois da última explicação, esperando o próximo pedido.
+OCIOSO_VOZ = float(os.getenv("VOZ_OCIOSO", "120"))
+
+_CABECALHOS_OPUS = (b"OpusHead", b"OpusTags")
+
+
+class AudioOpusMemoria(discord.AudioSource):
+    """Toca um arquivo OGG/Opus que está em memória, repassando os pacotes Opus sem decodificar nem reencodar.
+
+    Não usa ffmpeg nem arquivo em disco: o discord envia os pacotes como estão.
+    O áudio precisa estar a 48 kHz, como o TTS gera com `sample_rate_hertz=48000`.
+    """
+
+    def __init__(self, dados: bytes):
+        self._pacotes = (
+            pacote for pacote in OggStream(io.BytesIO(dados)).iter_packets()
+            if not pacote.startswith(_CABECALHOS_OPUS)
+        )
+
+    def read(self) -> bytes:
+        return next(self._pacotes, b"")
+
+    def is_opus(self) -> bool:
+        return True
+
+
+def liberar_partes(partes):
+    """Libera os áudios de trechos que não serão tocados, inclusive os que ainda estão sendo sintetizados."""
+    def liberar(parte):
+        if not parte.cancelled() and parte.exception() is None and parte.result():
+            parte.result().liberar()
+
+    for parte in partes:
+        parte.add_done_callback(liberar)
+
+
+@dataclass(slots=True)
+class PedidoReproducao:
+    canal: discord.VoiceChannel
+    # Futuros dos HandleAudio de cada trecho, na ordem de reprodução; podem ainda estar sendo sintetizados.
+    partes: list
+    # perf_counter do pedido, para medir quanto o usuário esperou até ouvir o primeiro trecho.
+    inicio: float = None
+    # Corrotina chamada com a exceção se a reprodução falhar (ex.: sem permissão para entrar no canal).
+    avisar_falha: object = None
+
+
+class ReprodutorServidor:
+    """Dono da conexão de voz de um servidor: toca os pedidos em ordem de chegada, um de cada vez.
+
+    Entre um pedido e outro a conexão fica aberta por `ocioso` segundos, evitando um novo handshake de voz
+    a cada explicação; passado esse tempo sem pedidos, desconecta e se retira do gerenciador.
+    """
+
+    def __init__(self, gerenciador, guild_id, guild, ocioso: float):
+        self.gerenciador = gerenciador
+        self.guild_id = guild_id
+        self.guild = guild
+        self.ocioso = ocioso
+        self.fila = deque()
+        self.novidade = asyncio.Event()
+        self.vc = None
+        self.tocando = None
+        self.task = asyncio.create_task(self._processar())
+
+    def enfileirar(self, pedido: PedidoReproducao) -> int:
+        """Adiciona o pedido e devolve quantos estão na frente dele."""
+        na_frente = len(self.fila) + (1 if self.tocando is not None else 0)
+        self.fila.append(pedido)
+        self.novidade.set()
+        return na_frente
+
+    async def _processar(self):
+        try:
+            while True:
+                if not self.fila:
+                    self.novidade.clear()
+                    try:
+                        await asyncio.wait_for(self.novidade.wait(), self.ocioso)
+                    except asyncio.TimeoutError:
+                        await self._desconectar()
+                        # Sem await entre a checagem e a remoção: um pedido novo ou entra nesta fila, ou cria outro reprodutor.
+                        if not self.fila:
+                            self.gerenciador._remover(self)
+                            return
+                    continue
+                pedido = self.tocando = self.fila.popleft()
+                try:
+                    await self._tocar(pedido)
+                except Exception as e:
+                    registrar_evento("voz_reproducao_falhou", nivel=logging.ERROR, servidor=self.guild_id, erro=type(e).__name__, detalhe=str(e))
+                    # HandleAudio.liberar é idempotente: liberar de novo os trechos já tocados não tem efeito.
+                    liberar_partes(pedido.partes)
+                    if pedido.avisar_falha:
+                        try:
+                            await pedido.avisar_falha(e)
+                        except Exception as erro_aviso:
+                            registrar_evento(
+                                "voz_aviso_falhou", nivel=logging.WARNING, servidor=self.guild_id, erro=type(erro_aviso).__name__, detalhe=str(erro_aviso),
+                            )
+                self.tocando = None
+        except asyncio.CancelledError:
+            for pedido in (self.tocando, *self.fila):
+                if pedido is not None:
+                    liberar_partes(pedido.partes)
+            self.fila.clear()
+            await self._desconectar()
+            raise
+
+    async def _conectar(self, canal):
+        if self.vc is None and self.guild is not None and self.guild.voice_client is not None:
+            # Conexão que já existia (ex.: aberta antes de o cog ser recarregado).
+            self.vc = self.guild.voice_client
+        if self.vc is not None and self.vc.is_connected():
+            self.gerenciador.conexoes_reaproveitadas += 1
+            if self.vc.channel != canal:
+                await self.vc.move_to(canal)
+            return self.vc
+        self.vc = await canal.connect()
+        self.gerenciador.conexoes_abertas += 1
+        return self.vc
+
+    async def _desconectar(self):
+        vc, self.vc = self.vc, None
+        if vc is None:
+            return
+        try:
+            await vc.disconnect()
+        except Exception as e:
+            registrar_evento("voz_desconexao_falhou", nivel=logging.WARNING, servidor=self.guild_id, erro=type(e).__name__, detalhe=str(e))
+
+    async def _tocar(self, pedido: PedidoReproducao):
+        """Toca os trechos em ordem, cada um assim que sua síntese termina. Em caso de erro, quem chama libera as partes."""
+        loop = asyncio.get_running_loop()
+        for parte in pedido.partes:
+            audio = await parte
+            if not audio:
+                registrar_evento("voz_trecho_pulado", nivel=logging.WARNING, servidor=self.guild_id)
+                continue
+            vc = await self._conectar(pedido.canal)
+            terminou = loop.create_future()
+
+            def after_playing(error, terminou=terminou):
+                # Roda na thread de áudio do discord: só agenda o fim no event loop, sem bloquear esperando nada aqui.
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_concluir, terminou, error)
+
+            vc.play(AudioOpusMemoria(audio.dados), after=after_playing)
+            if pedido.inicio is not None:
+                ETAPAS.observar(time.perf_counter() - pedido.inicio, etapa="voz_inicio_reproducao")
+                pedido.inicio = None
+            erro = await terminou
+            audio.liberar()
+            if erro:
+                registrar_evento("voz_audio_falhou", nivel=logging.ERROR, servidor=self.guild_id, erro=type(erro).__name__, detalhe=str(erro))
+
+
+def _concluir(futuro: asyncio.Future, erro):
+    if not futuro.done():
+        futuro.set_result(erro)
+
+
+class GerenciadorVoz:
+    """Um ReprodutorServidor por servidor com áudio tocando ou conexão ainda aquecida."""
+
+    def __init__(self, ocioso: float = OCIOSO_VOZ):
+        self.ocioso = ocioso
+        self.reprodutores = {}
+        self.conexoes_abertas = 0
+        self.conexoes_reaproveitadas = 0
+
+    def enfileirar(self, guild_id, guild, pedido: PedidoReproducao) -> int:
+        reprodutor = self.reprodutores.get(guild_id)
+        if reprodutor is None:
+            reprodutor = self.reprodutores[guild_id] = ReprodutorServidor(self, guild_id, guild, self.ocioso)
+        return reprodutor.enfileirar(pedido)
+
+    def _remover(self, reprodutor: ReprodutorServidor):
+        if self.reprodutores.get(reprodutor.guild_id) is reprodutor:
+            del self.reprodutores[reprodutor.guild_id]
+
+    async def encerrar(self):
+        reprodutores = list(self.reprodutores.values())
+        self.reprodutores.clear()
+        for reprodutor in reprodutores:
+            reprodutor.task.cancel()
+        await asyncio.gather(*(reprodutor.task for reprodutor in reprodutores), return_exceptions=True)
+
+    def estatisticas(self) -> dict:
+        return {
+            "servidores": len(self.reprodutores),
+            "conectados": sum(1 for r in self.reprodutores.values() if r.vc is not None),
+            "na_fila": sum(len(r.fila) for r in self.reprodutores.values()),
+            "conexoes_abertas": self.conexoes_abertas,
+            "conexoes_reaproveitadas": self.conexoes_reaproveitadas,
+        }